@@ -1,52 +1,105 @@
+import math
 from datetime import datetime, timedelta
-from uuid import UUID
+from typing import Optional
 
 import asyncpg
-import httpx
 import jwt
-import redis
-from asyncpg import Connection
-from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response, status
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request, Response, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 
 from app.core.config import settings
-from app.db import get_db
-from app.db.functions import execute_save_refresh_token, get_refresh_token_for_user, delete_refresh_token_for_user
-from app.middlewares.auth import create_access_token, get_current_user, verify_token, decode_access_token, oauth2_scheme
-from app.schemas.auth import LoginRequest
-from app.utils.pass_reset_token import create_password_reset_token, verify_password_reset_token
+from app.core import resilience
+from app.core.keys import keyring
+from app.core.metrics import db_query_duration
+from app.db import get_db, get_read_db
+from app.db.redis_client import get_redis
+from app.db.replicas import fetchrow_read
+from app.db.write_behind import get_refresh_token_db
+from app.db.functions import GET_USER_ID_BY_EMAIL_QUERY, delete_refresh_token_for_user, execute_save_refresh_token
+from app.middlewares.auth import (create_access_token, decode_access_token, ensure_not_revoked, oauth2_scheme,
+                                  verify_token)
+from app.middlewares.rate_limit import email_endpoints_limiter, rate_limit
+from app.middlewares.token_cache import token_cache
+from app.schemas.auth import LoginRequest, VerifyCodeRequest, VerifyTokensRequest
+from app.services.password_reset import save_password_reset_token
+from app.services.revocation import revoke_token
+from app.services.verification import (CODE_INVALID, CODE_LOCKED, CODE_VERIFIED, check_verification_code,
+                                       save_verification_code)
+from app.services.tokens import forget_refreshed_token, get_user_id_from_expired_token, refresh_access_token
+from app.utils.pass_reset_token import create_password_reset_token
 from app.utils.gen_verification_code import generate_verification_code
+from app.utils.email_templates import pick_locale
 from app.utils.email_utils import send_verification_email, send_password_reset_email
 
 router = APIRouter(
     prefix=f'/api/v1/{settings.service_name}'
 )
 
-redis = redis.from_url(f"redis://{settings.redis_host}:{settings.redis_port}", decode_responses=True)
+_get_user_by_email_timer = db_query_duration.labels('get_user_by_email')
 
-@router.post('/send_verification_code', status_code=status.HTTP_200_OK)
-async def send_verification_code(email:str):
+@router.post(
+    '/send_verification_code',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(email_endpoints_limiter), Depends(rate_limit('send_verification_code'))]
+)
+async def send_verification_code(
+    email:str,
+    accept_language: Optional[str] = Header(None)
+):
     """Отправка кода верификации на почту пользоватля
     и сохранение в Redis"""
     verification_code = generate_verification_code()
 
     try:
-        r.setex(f'verification_code:{email}', 86400, verification_code)
-    except redis.RedisError as e:
+        await save_verification_code(email, verification_code)
+    except RedisError as e:
         raise HTTPException(status_code=500, detail=f'Failed to save verification code to Redis: {e}')
     
     try:
-        await send_verification_email(email, verification_code)
+        await send_verification_email(email, verification_code, pick_locale('verification', accept_language))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=f'Failed to send email: {e}')
     return {'message': 'Verification code sent and saved successfully'}
 
+@router.post(
+    '/verify_code',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(rate_limit('verify_code'))]
+)
+async def verify_code(request: VerifyCodeRequest):
+    """Проверка кода из письма: верный код гасится, после нескольких
+    неверных попыток проверка для email блокируется"""
+    try:
+        result = await check_verification_code(request.email, request.code)
+    except RedisError as e:
+        raise HTTPException(status_code=500, detail=f'Failed to check verification code: {e}')
+
+    if result.status == CODE_VERIFIED:
+        return {'message': 'Verification code confirmed'}
+    if result.status == CODE_INVALID:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Invalid verification code, {result.value} attempts left'
+        )
+    if result.status == CODE_LOCKED:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail='Too many invalid attempts, request a new code later',
+            headers={'Retry-After': str(max(1, math.ceil(result.value / 1000)))}
+        )
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Verification code is missing or expired')
+
 @router.post('/login', status_code=status.HTTP_200_OK)
-async def login(request: LoginRequest, db: asyncpg.Connection = Depends(get_db), response: Response = None):
+async def login(request: LoginRequest, db: Optional[asyncpg.Connection] = Depends(get_refresh_token_db),
+                response: Response = None):
     token_data = str(request.user_id)
     access_token = create_access_token(user_id=token_data)
     expires_at = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
     try:
         await execute_save_refresh_token(db, request.user_id, access_token, expires_at)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save refresh token: {e}")
     response.set_cookie(
@@ -70,18 +123,13 @@ async def refresh_token(
     access_token = authorization_header.split(" ")[1]
 
     try:
-        payload = jwt.decode(access_token, settings.jwt_secret_key, algorithms=['HS256'])
+        payload = keyring.decode(access_token)
+        ensure_not_revoked(payload)
         return {"is_valid": True, "user_id": payload["sub"], "token_type": "bearer"}
 
     except jwt.ExpiredSignatureError:
-        try:
-            user_id = jwt.decode(access_token, options={"verify_signature": False}).get("sub")
-            if not user_id:
-                raise HTTPException(status_code=401, detail="Invalid token structure")
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid token structure")
+        user_id = get_user_id_from_expired_token(access_token)
 
-        
         refresh_token: Optional[str] = None
         try:
             body = await request.json()
@@ -89,15 +137,7 @@ async def refresh_token(
         except Exception:
             pass 
 
-        if not refresh_token:
-            refresh_token = await get_refresh_token_for_user(db, user_id)
-            if not refresh_token:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="No refresh token found"
-                )
-
-        new_access_token = create_access_token(user_id)
+        new_access_token = await refresh_access_token(db, user_id, refresh_token)
 
         return {
             "access_token": new_access_token,
@@ -124,24 +164,52 @@ async def verify_token_endpoint(token_data: dict = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
 
-@router.post('/send_password_reset_link', status_code=status.HTTP_200_OK)
-async def send_password_reset_link(email: str, db=Depends(get_db)):
+@router.post("/verify_tokens", status_code=status.HTTP_200_OK)
+async def verify_tokens_endpoint(request: VerifyTokensRequest):
+    """Пакетная проверка токенов: результаты возвращаются в порядке запроса"""
+    if len(request.tokens) > settings.verify_tokens_max_batch:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many tokens, maximum is {settings.verify_tokens_max_batch}"
+        )
+
+    results = []
+    for token in request.tokens:
+        try:
+            payload = verify_token(token)
+            results.append({"is_valid": True, "user_id": payload["sub"]})
+        except HTTPException as e:
+            results.append({"is_valid": False, "detail": e.detail})
+        except Exception as e:
+            results.append({"is_valid": False, "detail": f"An error occurred: {e}"})
+    return {"results": results}
+
+@router.post(
+    '/send_password_reset_link',
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(email_endpoints_limiter), Depends(rate_limit('send_password_reset_link'))]
+)
+async def send_password_reset_link(
+    email: str,
+    db=Depends(get_read_db),
+    accept_language: Optional[str] = Header(None)
+):
     """Эндпоинт для генерации токена сброса пароля и отправки ссылки на email"""
-    user = await db.fetchrow("SELECT id FROM users WHERE email = $1", email)
+    async with resilience.postgres.guard():
+        with _get_user_by_email_timer.time():
+            user = await fetchrow_read(db, GET_USER_ID_BY_EMAIL_QUERY, email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     reset_token = create_password_reset_token(user["id"])
-    
-    reset_link = f"{settings.fake_link}/?token={reset_token}"
 
     try:
-        redis.setex(f"password_reset_token:{email}", 900, reset_token)
-    except redis.RedisError as e:
+        await save_password_reset_token(email, reset_token)
+    except RedisError as e:
         raise HTTPException(status_code=500, detail=f"Failed to save token in Redis: {e}")
 
     try:
-        await send_password_reset_email(email, reset_link)
+        await send_password_reset_email(email, reset_token, pick_locale('password_reset', accept_language))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=f"Failed to send email: {e}")
     
@@ -149,7 +217,12 @@ async def send_password_reset_link(email: str, db=Depends(get_db)):
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-async def logout(response: Response, db=Depends(get_db), token: str = Depends(oauth2_scheme)):
+async def logout(
+    response: Response,
+    db=Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    token: str = Depends(oauth2_scheme)
+):
     """Логаут: удаление токена и очистка сессии"""
     
     # Удаление cookie с токеном
@@ -164,7 +237,14 @@ async def logout(response: Response, db=Depends(get_db), token: str = Depends(oa
             raise HTTPException(status_code=401, detail="Invalid token structure")
 
         await delete_refresh_token_for_user(db, user_id)  # Передаем только строку UUID
+        if settings.refresh_singleflight_redis_enabled:
+            await forget_refreshed_token(redis, user_id)  # Общий для воркеров токен не должен пережить логаут
+        token_cache.invalidate_user(user_id)  # Проверенные токены пользователя больше не отдаём из кеша
+        if settings.revocation_enabled:
+            await revoke_token(redis, payload)  # Текущий access-токен перестаёт приниматься до своего exp
 
+    except HTTPException as e:
+        raise e
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired.")
     except jwt.InvalidTokenError:
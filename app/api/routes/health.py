@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Response, status
+
+from app.core.lifespan import warmup
+
+router = APIRouter(
+    prefix='/health',
+    include_in_schema=False
+)
+
+
+@router.get('/live')
+async def live():
+    """Процесс жив и цикл событий отвечает. Соединения принимаются только после
+    прогрева в lifespan, поэтому до его окончания ответа нет и здесь"""
+    return {'status': 'alive'}
+
+
+@router.get('/ready')
+async def ready(response: Response):
+    """Экземпляр прогрет и готов принимать трафик; во время остановки — 503"""
+    if not warmup.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {'status': warmup.state}
+    return {'status': warmup.state, 'warmup_seconds': {name: round(duration, 3)
+                                                       for name, duration in warmup.durations.items()}}
@@ -0,0 +1,112 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from redis.exceptions import RedisError
+
+import app.db as db
+from app.core import resilience
+from app.core.lifespan import warmup
+from app.core.logger import queue_handlers
+from app.core.metrics import MetricFamily, labelled_values, registry, single_value
+from app.db import replicas, sweeper, write_behind
+from app.db.functions import token_store_stats
+from app.middlewares.rate_limit import email_endpoints_limiter
+from app.middlewares.token_cache import token_cache
+from app.services import email_outbox
+from app.services.revocation import revocation_list
+from app.services.tokens import refresh_singleflight, refresh_stats
+
+router = APIRouter()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def collect_caches() -> list[MetricFamily]:
+    return [
+        labelled_values('auth_token_cache', 'gauge', 'Local access token cache state', 'stat', token_cache.stats()),
+        labelled_values('auth_refresh_token_store', 'gauge', 'Refresh token Redis tier state', 'stat',
+                        token_store_stats.stats()),
+        labelled_values('auth_revocation_list', 'gauge', 'Local revocation list state', 'stat',
+                        revocation_list.stats()),
+        labelled_values('auth_refresh_singleflight', 'gauge', 'Coalesced access token refreshes', 'stat',
+                        {**refresh_singleflight.stats(), **refresh_stats.stats()}),
+    ]
+
+
+def collect_pools() -> list[MetricFamily]:
+    families = [
+        single_value('auth_email_endpoints_in_flight', 'gauge', 'Email endpoint requests in flight',
+                     email_endpoints_limiter.in_flight),
+        single_value('auth_email_endpoints_rejected_total', 'counter', 'Email endpoint requests shed with 503',
+                     email_endpoints_limiter.rejected),
+    ]
+    if db.pool is not None:
+        families.append(labelled_values('auth_db_pool_connections', 'gauge', 'Postgres pool connections', 'state', {
+            'open': db.pool.get_size(),
+            'idle': db.pool.get_idle_size(),
+            'max': db.pool.get_max_size(),
+        }))
+    replica_set = replicas.replica_set
+    if replica_set is not None:
+        families.append(labelled_values('auth_db_read_replicas', 'gauge', 'Read replica routing state', 'stat',
+                                        replica_set.stats()))
+    writer = write_behind.refresh_token_writer
+    if writer is not None:
+        families.append(labelled_values('auth_refresh_token_writer', 'gauge', 'Write-behind buffer state', 'stat',
+                                        writer.stats()))
+    token_sweeper = sweeper.token_sweeper
+    if token_sweeper is not None:
+        families.append(labelled_values('auth_token_sweeper', 'gauge', 'Expired tokens sweeper state', 'stat',
+                                        token_sweeper.stats()))
+    return families
+
+
+def collect_backends() -> list[MetricFamily]:
+    states = (resilience.CLOSED, resilience.HALF_OPEN, resilience.OPEN)
+    return [
+        MetricFamily('auth_backend_circuit_state', 'gauge', 'Circuit breaker state per backend', [
+            ('', {'backend': backend.name, 'state': state}, int(backend.breaker.state == state))
+            for backend in resilience.backends for state in states
+        ]),
+        MetricFamily('auth_backend_calls', 'gauge', 'Resilience layer state per backend', [
+            ('', {'backend': backend.name, 'stat': stat}, value)
+            for backend in resilience.backends for stat, value in backend.stats().items()
+        ]),
+    ]
+
+
+def collect_logging() -> list[MetricFamily]:
+    return [single_value('auth_log_records_dropped_total', 'counter', 'Log records dropped on a full queue',
+                         sum(handler.dropped for handler in queue_handlers))]
+
+
+def collect_startup() -> list[MetricFamily]:
+    return [labelled_values('auth_startup_warmup_seconds', 'gauge', 'Startup warmup duration by step', 'step',
+                            warmup.durations)]
+
+
+async def collect_outbox() -> list[MetricFamily]:
+    outbox = email_outbox.outbox
+    if outbox is None:
+        return []
+    families = [labelled_values('auth_email_outbox', 'gauge', 'Email outbox worker state', 'stat', outbox.stats())]
+    try:
+        families.append(labelled_values('auth_email_outbox_depth', 'gauge', 'Email outbox queue depth', 'queue',
+                                        await outbox.queue_depth()))
+    except RedisError:
+        # Метрики не должны падать вместе с Redis
+        pass
+    return families
+
+
+registry.register_collector(collect_caches)
+registry.register_collector(collect_pools)
+registry.register_collector(collect_outbox)
+registry.register_collector(collect_logging)
+registry.register_collector(collect_backends)
+registry.register_collector(collect_startup)
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics():
+    """Метрики сервиса в текстовом формате Prometheus"""
+    return PlainTextResponse(await registry.render(), media_type=CONTENT_TYPE)
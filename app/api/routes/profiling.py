@@ -0,0 +1,35 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse
+
+from app.middlewares.profiling import is_profiling_admin, profile_ring
+
+MEDIA_TYPES = {'html': 'text/html', 'prof': 'application/octet-stream'}
+
+
+async def require_profiling_admin(x_profile: Optional[str] = Header(None)):
+    if not is_profiling_admin(x_profile):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Forbidden')
+
+
+router = APIRouter(
+    prefix='/debug/profiles',
+    dependencies=[Depends(require_profiling_admin)],
+    include_in_schema=False
+)
+
+
+@router.get('')
+async def list_profiles():
+    """Сохранённые профили запросов этого экземпляра, новые первыми"""
+    return {'profiles': profile_ring.list()}
+
+
+@router.get('/{name}')
+async def download_profile(name: str):
+    """Файл профиля: html от pyinstrument или статистика cProfile для pstats/snakeviz"""
+    path = profile_ring.path(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Profile not found')
+    return FileResponse(path, media_type=MEDIA_TYPES[path.suffix[1:]], filename=name)
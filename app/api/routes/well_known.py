@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Request, Response, status
+
+from app.core.config import settings
+from app.core.keys import keyring
+
+router = APIRouter(
+    prefix='/.well-known'
+)
+
+
+@router.get('/jwks.json')
+async def jwks(request: Request, response: Response):
+    """Публичные ключи подписи access-токенов для локальной проверки в других сервисах"""
+    jwks_body = keyring.jwks()
+    headers = {
+        'Cache-Control': f'public, max-age={settings.jwks_max_age}',
+        'ETag': keyring.jwks_etag,
+    }
+    if request.headers.get('if-none-match') == keyring.jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return jwks_body
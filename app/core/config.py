@@ -10,6 +10,12 @@ class Settings(BaseSettings):
     is_debug: bool = True
     host: str = '127.0.0.1'
     port: int = 8080
+    # Число процессов-воркеров app.core.server, 0 — по числу доступных ядер
+    workers: int = 0
+    # Сколько воркер ждёт завершения текущих запросов при остановке, с
+    graceful_shutdown_timeout: int = 30
+    keepalive_timeout: int = 5
+    backlog: int = 2048
     log_level: str = 'info'
     docs_name: str = 'auth'
     
@@ -21,24 +27,181 @@ class Settings(BaseSettings):
     postgres_db_name: str
     postgres_url: str
 
+    # Настройки пула соединений с базой данных
+    postgres_pool_min_size: int = 5
+    postgres_pool_max_size: int = 20
+    postgres_pool_acquire_timeout: float = 5.0
+    postgres_pool_max_queries: int = 50000
+    postgres_pool_max_inactive_connection_lifetime: float = 300.0
+    postgres_statement_cache_size: int = 100
+    # Реплики только для чтения (JSON-список DSN): поиск refresh-токена и пользователя
+    # идёт на здоровые реплики по кругу. Реплика выходит из ротации при ошибке или
+    # отставании больше postgres_replica_max_lag, проверка раз в check_interval, с
+    postgres_replica_urls: list[str] = []
+    postgres_replica_max_lag: float = 5.0
+    postgres_replica_check_interval: float = 5.0
+    postgres_replica_check_timeout: float = 2.0
+    # Применять миграции из app/db/migrations при старте (иначе python -m app.db.migrations upgrade)
+    db_migrate_on_startup: bool = False
+
+    # Отложенная пакетная запись refresh-токенов при логине
+    refresh_token_write_behind: bool = False
+    refresh_token_write_behind_max_batch: int = 500
+    refresh_token_write_behind_flush_interval: float = 0.05
+    # Предел буфера (пользователей) и число попыток записи строки, после
+    # которых она отбрасывается
+    refresh_token_write_behind_max_pending: int = 20000
+    refresh_token_write_behind_max_attempts: int = 3
+
+    # Фоновая очистка просроченных refresh-токенов: период, размер пачки
+    # и пауза между пачками, с
+    token_sweeper_enabled: bool = True
+    token_sweeper_interval: float = 300.0
+    token_sweeper_batch_size: int = 1000
+    token_sweeper_batch_pause: float = 0.1
+    # Таблица tokens секционирована по дням expires_at (python -m app.db.migrations partition):
+    # очистка создаёт секции вперёд и удаляет истёкшие целиком
+    tokens_partitioning_enabled: bool = False
+
+    # Горячий уровень хранения refresh-токенов в Redis перед таблицей tokens
+    refresh_token_cache_enabled: bool = True
+    # Сколько после логаута прочитанный из бд токен не попадает в кеш, с; должно
+    # быть больше самого долгого чтения из бд (postgres_deadline)
+    refresh_token_cache_tombstone_ttl: int = 60
+
     # Настройка почтового клиента
     smtp_host: str
     smtp_port: int
     smtp_user: str
     smtp_password: str
     smtp_from: str 
+    smtp_timeout: float = 10.0
+    # STARTTLS после подключения; без него — только для локальных SMTP-заглушек
+    smtp_start_tls: bool = True
+    smtp_pool_size: int = 2
+    smtp_idle_timeout: float = 60.0
+    email_default_locale: str = 'ru'
+
+    # Outbox писем: задания хранятся в Redis Stream и отправляются фоновыми воркерами
+    email_outbox_enabled: bool = True
+    email_outbox_workers: int = 2
+    email_outbox_batch_size: int = 20
+    email_outbox_max_attempts: int = 5
+    email_outbox_retry_base_delay: float = 5.0
+    email_outbox_retry_max_delay: float = 600.0
+    email_outbox_claim_idle_ms: int = 60000
 
     # Настройка Redis
     redis_host: str
     redis_port: int
     redis_db: int
+    redis_max_connections: int = 50
+    redis_pool_timeout: float = 1.0
+    redis_socket_timeout: float = 2.0
+    # Соединения с Redis, открываемые при старте, до первых запросов
+    redis_warm_connections: int = 5
+    # Где хранятся коды подтверждения и токены сброса пароля (app.db.redis_shards):
+    # single — в основном Redis, cluster — в Redis Cluster, sharded — на узлах
+    # по согласованному хешированию. redis_nodes — JSON-список "host:port"
+    redis_keyspace_mode: str = 'single'
+    redis_nodes: list[str] = []
+    redis_ring_points_per_node: int = 160
+
+    # Защита обращений к Postgres, Redis и SMTP (app.core.resilience): предел
+    # одновременных вызовов и дедлайн одного вызова для каждого сервиса, с
+    postgres_max_concurrency: int = 20
+    postgres_deadline: float = 5.0
+    redis_max_concurrency: int = 50
+    redis_deadline: float = 2.0
+    smtp_max_concurrency: int = 10
+    smtp_deadline: float = 30.0
+    # Сколько вызов ждёт свободного слота, прежде чем получить 503, с
+    backend_queue_timeout: float = 0.5
+    # Автомат размыкается после стольких сбоев подряд и через
+    # circuit_recovery_timeout секунд пропускает пробный вызов
+    circuit_failure_threshold: int = 5
+    circuit_recovery_timeout: float = 10.0
 
     # JWT настройки
     jwt_secret_key: str
+    # Алгоритм подписи access-токенов: HS256 (общий секрет), RS256 или EdDSA.
+    # Для асимметричных алгоритмов приватные ключи лежат в jwt_keys_dir
+    # в файлах <kid>.pem, ключи только для проверки — в <kid>.pub.pem
+    jwt_algorithm: str = 'HS256'
+    jwt_keys_dir: Optional[str] = None
+    jwt_active_kid: Optional[str] = None
+    jwks_max_age: int = 300
     access_token_expire_minutes: int = 60
     refresh_token_expire_days: int = 30
     secure_cookies: bool = False  # change for True in production
 
+    # Одновременные обновления просроченных токенов одного пользователя ждут
+    # одного поиска refresh-токена в бд и получают один новый access-токен.
+    # С блокировкой в Redis это действует и между воркерами: lock_ttl ограничивает
+    # ожидание чужого результата, выпущенный токен виден остальным share_ttl, с
+    refresh_singleflight_redis_enabled: bool = False
+    refresh_singleflight_lock_ttl: float = 2.0
+    refresh_singleflight_share_ttl: float = 5.0
+
+    # Внешний сервис авторизации для обновления токенов; если не задан,
+    # просроченные токены обновляются внутри процесса
+    auth_service_url: Optional[str] = None
+    auth_service_timeout: float = 5.0
+    auth_service_max_connections: int = 20
+
+    # Кеш проверенных access-токенов
+    token_cache_enabled: bool = True
+    token_cache_max_entries: int = 10000
+    token_cache_max_bytes: int = 16 * 1024 * 1024
+    token_cache_ttl_seconds: int = 300
+
+    # Отзыв access-токенов по jti
+    revocation_enabled: bool = True
+    revocation_bloom_capacity: int = 1_000_000
+    revocation_bloom_error_rate: float = 0.001
+    revocation_prune_interval: float = 60.0
+
+    # Коды подтверждения email: время жизни, число неверных попыток
+    # до блокировки и длительность блокировки, с
+    verification_code_ttl: int = 86400
+    verification_code_max_attempts: int = 5
+    verification_code_lockout_seconds: int = 900
+
+    # Ограничение частоты запросов к эндпоинтам, отправляющим письма: правила
+    # "число/секунды" через запятую для каждого измерения (ip, email)
+    rate_limit_enabled: bool = True
+    rate_limits: dict[str, dict[str, str]] = {
+        'send_verification_code': {'ip': '10/60,100/3600', 'email': '3/60,10/3600'},
+        'send_password_reset_link': {'ip': '10/60,100/3600', 'email': '3/900'},
+        'verify_code': {'ip': '60/60,600/3600'},
+    }
+    # Общий предел одновременно обрабатываемых запросов к этим эндпоинтам
+    email_endpoints_max_concurrency: int = 100
+
+    # Максимальное число токенов в одном запросе к /verify_tokens
+    verify_tokens_max_batch: int = 100
+
+    # Экспорт метрик Prometheus на /metrics
+    metrics_enabled: bool = True
+
+    # Профилирование отдельных запросов: по заголовку X-Profile с profiling_admin_token
+    # или для случайной доли profiling_sample_rate запросов к API. В профилировщике
+    # pyinstrument (если установлен) опрос стека раз в profiling_interval, с;
+    # в profiling_dir хранятся последние profiling_max_files профилей
+    profiling_enabled: bool = False
+    profiling_admin_token: Optional[str] = None
+    profiling_sample_rate: float = 0.0
+    profiling_interval: float = 0.001
+    profiling_dir: str = '/tmp/auth-profiles'
+    profiling_max_files: int = 100
+
+    # Логирование: формат console или json; записи уходят в очередь и пишутся
+    # отдельным потоком, при переполнении очереди лишние записи отбрасываются
+    log_format: str = 'console'
+    log_queue_size: int = 10000
+    # Доля debug-событий проверки токенов, попадающих в лог
+    log_auth_debug_sample_rate: float = 0.01
+
     fake_link: str = "http://localhost:8080/api/v1/auth/simulate_password_reset_link"
     reset_url: str = "http://localhost:8080/api/v1/users/reset_password"
 
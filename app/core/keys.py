@@ -0,0 +1,112 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from app.core.config import settings
+
+SYMMETRIC_ALGORITHMS = {'HS256', 'HS384', 'HS512'}
+PUBLIC_KEY_SUFFIX = '.pub.pem'
+
+
+class KeyRing:
+    """Набор ключей подписи access-токенов.
+
+    Для HS256 используется общий секрет. Для RS256/EdDSA ключи читаются из
+    каталога один раз при старте: подпись идёт активным ключом, его kid
+    пишется в заголовок токена, а проверка принимает любой ключ из каталога,
+    что позволяет ротировать ключи без инвалидации выданных токенов."""
+
+    def __init__(self, algorithm: str, secret: str, keys_dir: Optional[str] = None, active_kid: Optional[str] = None):
+        self.algorithm = algorithm
+        self.secret = secret
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.signing_kid: Optional[str] = None
+        self._signing_key: Any = None
+        self._verification_keys: dict[str, Any] = {}
+        self._jwks: dict[str, Any] = {'keys': []}
+        self.jwks_etag = ''
+        self._loaded = False
+
+    @property
+    def is_symmetric(self) -> bool:
+        return self.algorithm in SYMMETRIC_ALGORITHMS
+
+    def load(self) -> None:
+        """Разбор ключей и подготовка JWKS; повторные вызовы ничего не делают"""
+        if self._loaded:
+            return
+        if self.is_symmetric:
+            self._signing_key = self.secret
+        else:
+            self._load_asymmetric()
+        body = json.dumps(self._jwks, sort_keys=True).encode()
+        self.jwks_etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._loaded = True
+
+    def _load_asymmetric(self) -> None:
+        algorithm = get_default_algorithms().get(self.algorithm)
+        if algorithm is None:
+            raise RuntimeError(
+                f'JWT algorithm {self.algorithm} is not available, install pyjwt[crypto]'
+            )
+        if not self.keys_dir:
+            raise RuntimeError(f'jwt_keys_dir is required for {self.algorithm}')
+
+        private_keys: dict[str, Any] = {}
+        jwks = []
+        for path in sorted(Path(self.keys_dir).glob('*.pem')):
+            key = algorithm.prepare_key(path.read_bytes())
+            if path.name.endswith(PUBLIC_KEY_SUFFIX):
+                kid = path.name[:-len(PUBLIC_KEY_SUFFIX)]
+                public_key = key
+            else:
+                kid = path.stem
+                private_keys[kid] = key
+                public_key = key.public_key()
+            self._verification_keys[kid] = public_key
+            jwk = algorithm.to_jwk(public_key, as_dict=True)
+            jwk.update(kid=kid, alg=self.algorithm, use='sig')
+            jwks.append(jwk)
+
+        if not private_keys:
+            raise RuntimeError(f'No private signing keys found in {self.keys_dir}')
+        # По умолчанию подписываем последним по имени ключом, например 2024-05.pem
+        self.signing_kid = self.active_kid or max(private_keys)
+        if self.signing_kid not in private_keys:
+            raise RuntimeError(f'Signing key {self.signing_kid} not found in {self.keys_dir}')
+        self._signing_key = private_keys[self.signing_kid]
+        self._jwks = {'keys': jwks}
+
+    def encode(self, payload: dict[str, Any]) -> str:
+        self.load()
+        headers = {'kid': self.signing_kid} if self.signing_kid else None
+        return jwt.encode(payload, self._signing_key, algorithm=self.algorithm, headers=headers)
+
+    def decode(self, token: str) -> dict[str, Any]:
+        """Проверка подписи и срока действия токена, ошибки — исключения jwt"""
+        self.load()
+        if self.is_symmetric:
+            return jwt.decode(token, self._signing_key, algorithms=[self.algorithm])
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self._verification_keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f'Unknown signing key: {kid}')
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+    def jwks(self) -> dict[str, Any]:
+        """Публичные ключи в формате JWKS; для HS256 список пуст"""
+        self.load()
+        return self._jwks
+
+
+keyring = KeyRing(
+    algorithm=settings.jwt_algorithm,
+    secret=settings.jwt_secret_key,
+    keys_dir=settings.jwt_keys_dir,
+    active_kid=settings.jwt_active_kid,
+)
@@ -0,0 +1,168 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, Awaitable, Callable, Optional, TypeVar
+
+import asyncpg
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.keys import keyring
+from app.db import close_pool, init_pool
+from app.db.functions import SAVE_REFRESH_TOKEN_QUERY
+from app.db.migrations import migrate_pool
+from app.db.replicas import start_replicas, stop_replicas
+from app.db.sweeper import start_token_sweeper, stop_token_sweeper
+from app.db.write_behind import start_refresh_token_writer, stop_refresh_token_writer
+from app.db.redis_client import close_redis, init_redis, warm_redis
+from app.db.redis_shards import close_keyspace, init_keyspace
+from app.services.email_outbox import start_outbox, stop_outbox
+from app.services.revocation import start_revocation_sync, stop_revocation_sync
+from app.services.tokens import close_http_client, get_http_client
+from app.utils.email_utils import build_email_message, prepare_email_templates
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+STARTING = 'starting'
+READY = 'ready'
+STOPPING = 'stopping'
+
+# Предел паузы между попытками подключиться к Redis при запуске, с
+REDIS_RETRY_MAX_DELAY = 30.0
+
+
+class Warmup:
+    """Состояние запуска экземпляра для /health/ready и длительность шагов прогрева"""
+
+    def __init__(self):
+        self.state = STARTING
+        self.durations: dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    async def step(self, name: str, awaitable: Awaitable[T]) -> T:
+        started = time.perf_counter()
+        result = await awaitable
+        self.durations[name] = time.perf_counter() - started
+        return result
+
+
+warmup = Warmup()
+
+
+async def _warm_database() -> asyncpg.Pool:
+    """Пул основной бд (asyncpg сразу открывает postgres_pool_min_size соединений),
+    миграции и проверка реплик"""
+    pool = await init_pool()
+    if settings.db_migrate_on_startup:
+        await migrate_pool(pool)
+    await start_replicas()
+    return pool
+
+
+async def _warm_redis() -> Optional[asyncio.Task]:
+    """Прогрев общего клиента и подключение к узлам ключей email; возвращает
+    задачу повторов, если узлы недоступны"""
+    try:
+        await warm_redis(settings.redis_warm_connections)
+    except (RedisError, OSError) as e:
+        # Без Redis сервис работает с деградацией, запуск из-за него не прерывается
+        logger.warning('Failed to open Redis connections on startup: %s', e)
+    return await _start_on_redis('redis keyspace', init_keyspace)
+
+
+def _warm_signing() -> None:
+    """Разбор ключей и пробная подпись: первый jwt.encode/decode дорог из-за
+    ленивой инициализации pyjwt и cryptography"""
+    keyring.load()
+    payload = {'sub': 'warmup', 'exp': datetime.now(timezone.utc) + timedelta(minutes=1)}
+    keyring.decode(keyring.encode(payload))
+    prepare_email_templates()
+
+
+async def _warm_http_client() -> None:
+    # Импорт httpx в потоке идёт параллельно с подключением к бд и Redis
+    await asyncio.to_thread(importlib.import_module, 'httpx')
+    get_http_client()
+
+
+async def _retry_start(name: str, start: Callable[[], Awaitable]) -> None:
+    delay = 1.0
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await start()
+        except (RedisError, OSError) as e:
+            delay = min(delay * 2, REDIS_RETRY_MAX_DELAY)
+            logger.warning('Failed to start %s, retrying in %.0fs: %s', name, delay, e)
+        else:
+            logger.info('Started %s after Redis became available', name)
+            return
+
+
+async def _start_on_redis(name: str, start: Callable[[], Awaitable]) -> Optional[asyncio.Task]:
+    """Запуск того, что требует Redis: узлов ключей email, синхронизации отзывов, outbox.
+    Если Redis недоступен, запуск сервиса не прерывается: попытки продолжаются
+    в фоне, возвращается их задача"""
+    try:
+        await start()
+    except (RedisError, OSError) as e:
+        logger.warning('Failed to start %s on startup, retrying in background: %s', name, e)
+        return asyncio.create_task(_retry_start(name, start))
+    return None
+
+
+@asynccontextmanager
+async def lifespan(app) -> AsyncGenerator:
+    """Функция инициализации контекстного менеджера жизненного цикла для пулов соединений.
+
+    Пулы бд и Redis, ключи подписи и шаблоны писем прогреваются параллельно,
+    и только после этого uvicorn начинает принимать соединения, а
+    /health/ready отвечает 200"""
+    started = time.perf_counter()
+    steps = [
+        warmup.step('database', _warm_database()),
+        warmup.step('redis', _warm_redis()),
+        warmup.step('signing', asyncio.to_thread(_warm_signing)),
+    ]
+    if settings.auth_service_url:
+        steps.append(warmup.step('http_client', _warm_http_client()))
+    pool, keyspace_retry, *_ = await asyncio.gather(*steps)
+    if settings.refresh_token_write_behind:
+        start_refresh_token_writer(pool, SAVE_REFRESH_TOKEN_QUERY)
+    if settings.token_sweeper_enabled:
+        start_token_sweeper(pool)
+    redis = await init_redis()
+    retries = [keyspace_retry]
+    if settings.revocation_enabled:
+        retries.append(await _start_on_redis('revocation sync', lambda: start_revocation_sync(redis)))
+    if settings.email_outbox_enabled:
+        retries.append(await _start_on_redis(
+            'email outbox', lambda: start_outbox(redis, build_email_message)))
+    retries = [task for task in retries if task is not None]
+    warmup.durations['total'] = time.perf_counter() - started
+    warmup.state = READY
+    logger.info('Warmup finished in %.3fs: %s', warmup.durations['total'],
+                ', '.join(f'{name} {duration:.3f}s' for name, duration in warmup.durations.items() if name != 'total'))
+    yield
+    warmup.state = STOPPING
+    for task in retries:
+        task.cancel()
+    await asyncio.gather(*retries, return_exceptions=True)
+    await stop_outbox()
+    await stop_revocation_sync()
+    await close_http_client()
+    await close_keyspace()
+    await close_redis()
+    # Буфер refresh-токенов сбрасывается в бд до закрытия пула
+    await stop_refresh_token_writer()
+    await stop_token_sweeper()
+    await stop_replicas()
+    await close_pool()
@@ -1,14 +1,106 @@
-from typing import Any
+import atexit
+import json
+import logging
+import queue
+import random
+from contextvars import ContextVar
+from logging import config as logging_config
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
 
 from app.core.config import settings
 
+# Идентификатор текущего запроса, выставляется RequestIdMiddleware
+request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+# Логгеры событий проверки токенов: их debug-записи сэмплируются
+AUTH_LOGGERS = ('app.middlewares.auth', 'app.services.tokens')
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями из extra
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'color_message',
+}
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет к записи request_id. Стоит на QueueHandler, то есть
+    срабатывает в потоке цикла событий, где контекст запроса ещё доступен"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей уровня DEBUG, остальные уровни не трогает"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Компактная запись в одну строку JSON с полями из extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который никогда не ждёт: при заполненной очереди запись отбрасывается"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.addFilter(RequestIdFilter())
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Очередь внутри процесса, сериализовать запись не нужно. Стандартный
+        # prepare затирает args, на которые опирается форматтер uvicorn.access
+        return record
+
+
+class _BlockingStopListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # При остановке можно и подождать места в очереди
+        self.queue.put(self._sentinel)
+
+
+_listeners: list[QueueListener] = []
+queue_handlers: list[NonBlockingQueueHandler] = []
+
 
 def get_logging_config(
     log_level: str | None = "INFO",
+    log_format: str = "console",
 ) -> dict[str, Any]:
     log_default_handlers: list[str] = [
         "console",
     ]
+    as_json = log_format == "json"
 
     return {
         "version": 1,
@@ -29,20 +121,23 @@ def get_logging_config(
                 "fmt": "%(levelprefix)s [%(asctime)s] - %(request_line)s %(status_code)s",
                 "use_colors": True,
             },
+            "json": {
+                "()": "app.core.logger.JsonFormatter",
+            },
         },
         "handlers": {
             "console": {
                 "level": log_level,
                 "class": "logging.StreamHandler",
-                "formatter": "verbose",
+                "formatter": "json" if as_json else "verbose",
             },
             "default": {
-                "formatter": "default",
+                "formatter": "json" if as_json else "default",
                 "class": "logging.StreamHandler",
                 "stream": "ext://sys.stdout",
             },
             "access": {
-                "formatter": "access",
+                "formatter": "json" if as_json else "access",
                 "class": "logging.StreamHandler",
                 "stream": "ext://sys.stdout",
             },
@@ -81,4 +176,49 @@ def get_logging_config(
             "formatter": "verbose",
             "handlers": log_default_handlers,
         },
-    }
\ No newline at end of file
+    }
+
+
+def setup_logging(log_level: str | None = None, log_format: str | None = None, queued: bool = True) -> None:
+    """Применяет конфигурацию логирования и переносит запись в фоновые потоки.
+
+    Обработчики, пишущие в stdout, остаются прежними, но каждый логгер получает
+    вместо них NonBlockingQueueHandler, а сами обработчики вызывает QueueListener
+    в отдельном потоке. Так запись лога в цикле событий — это только put_nowait.
+    queued=False оставляет обычную синхронную запись, например для процесса,
+    который будет делать fork: потоки в дочерний процесс не переходят."""
+    stop_logging()
+    log_level = (log_level or settings.log_level).upper()
+    logging_config.dictConfig(get_logging_config(log_level, log_format or settings.log_format))
+
+    for name in ("", "uvicorn", "uvicorn.access", "sqlalchemy") if queued else ():
+        logger = logging.getLogger(name)
+        handlers = logger.handlers[:]
+        if not handlers:
+            continue
+        log_queue: queue.Queue = queue.Queue(settings.log_queue_size)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        logger.handlers = [queue_handler]
+        listener = _BlockingStopListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        queue_handlers.append(queue_handler)
+        _listeners.append(listener)
+
+    sampling = SamplingFilter(settings.log_auth_debug_sample_rate)
+    for name in AUTH_LOGGERS:
+        logging.getLogger(name).addFilter(sampling)
+
+
+def stop_logging() -> None:
+    """Останавливает фоновые потоки, дописав накопленные записи"""
+    while _listeners:
+        _listeners.pop().stop()
+    queue_handlers.clear()
+    for name in AUTH_LOGGERS:
+        auth_logger = logging.getLogger(name)
+        for log_filter in auth_logger.filters[:]:
+            if isinstance(log_filter, SamplingFilter):
+                auth_logger.removeFilter(log_filter)
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,211 @@
+import inspect
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable, Union
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Сэмпл внешнего сборщика: (суффикс имени, метки, значение)
+Sample = tuple[str, dict[str, str], float]
+Collector = Callable[[], Union[Iterable['MetricFamily'], Awaitable[Iterable['MetricFamily']]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricFamily:
+    """Готовый набор сэмплов одной метрики для вывода в формате Prometheus"""
+
+    def __init__(self, name: str, metric_type: str, documentation: str, samples: Iterable[Sample]):
+        self.name = name
+        self.metric_type = metric_type
+        self.documentation = documentation
+        self.samples = samples
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for suffix, labels, value in self.samples:
+            label_text = _format_labels(tuple(labels), tuple(labels.values()))
+            lines.append(f'{self.name}{suffix}{label_text} {_format_value(value)}')
+        return lines
+
+
+class _Metric:
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        registry.register(self)
+
+    def labels(self, *values: str):
+        """Дочерняя метрика для набора меток. Вызывающий код получает её один раз
+        и хранит у себя, чтобы на горячем пути не собирать метки заново"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: tuple[str, ...], child) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child: '_HistogramChild'):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, upper_bounds: tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.upper_bounds)
+
+    def _render_child(self, values: tuple[str, ...], child: _HistogramChild) -> list[str]:
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds + (float('inf'),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(upper_bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Registry:
+    """Реестр метрик и внешних сборщиков, отдающий всё в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Collector) -> None:
+        """Сборщик вызывается при каждом запросе /metrics и возвращает MetricFamily"""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            families = collector()
+            if inspect.isawaitable(families):
+                families = await families
+            for family in families:
+                lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+# Метрики, общие для нескольких модулей
+db_query_duration = Histogram('auth_db_query_duration_seconds', 'Duration of Postgres queries', ('query',))
+redis_command_duration = Histogram('auth_redis_command_duration_seconds', 'Duration of Redis calls', ('operation',))
+smtp_send_duration = Histogram('auth_smtp_send_duration_seconds', 'Duration of SMTP sends', ('mode',))
+
+
+def single_value(name: str, metric_type: str, documentation: str, value: float) -> MetricFamily:
+    return MetricFamily(name, metric_type, documentation, [('', {}, value)])
+
+
+def labelled_values(name: str, metric_type: str, documentation: str, label: str,
+                    values: dict[str, float]) -> MetricFamily:
+    """MetricFamily из словаря: каждый ключ становится значением метки label"""
+    return MetricFamily(name, metric_type, documentation, [('', {label: key}, value) for key, value in values.items()])
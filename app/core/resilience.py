@@ -0,0 +1,203 @@
+"""Защита обращений к Postgres, Redis и SMTP.
+
+Каждый внешний сервис получает свой Backend: семафор ограничивает число
+одновременных вызовов, дедлайн — время одного вызова, а автомат
+размыкания после серии сбоев подряд сразу отказывает вызовам, пока не
+пройдёт recovery_timeout. Затем пропускается один пробный вызов: успех
+замыкает автомат, сбой размыкает его снова.
+
+    async with postgres.guard():
+        row = await conn.fetchrow(...)
+
+Отказ — BackendUnavailable, то есть ответ 503 с Retry-After. Сбоем
+считаются только исключения из failure_exceptions и истёкший дедлайн:
+ошибки уровня приложения (нарушение ограничения, отказ получателя
+письма) означают, что сервис отвечает.
+"""
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiosmtplib
+import asyncpg
+from fastapi import HTTPException, status
+from redis import exceptions as redis_exceptions
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+backend_rejections = Counter('auth_backend_rejected_total', 'Calls rejected by the resilience layer',
+                             ('backend', 'reason'))
+
+
+class BackendUnavailable(HTTPException):
+    """Вызов не выполнен: автомат разомкнут, нет свободного слота или истёк дедлайн"""
+
+    def __init__(self, backend: str, reason: str, retry_after: float = 1.0):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f'{backend} is unavailable ({reason}), try again later',
+            headers={'Retry-After': str(max(1, math.ceil(retry_after)))}
+        )
+        self.backend = backend
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Автомат размыкания по числу сбоев подряд"""
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._probe_in_flight = False
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; в полуоткрытом состоянии пропускает один пробный"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.retry_after > 0:
+            return False
+        if self._probe_in_flight:
+            return False
+        self.state = HALF_OPEN
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info('Circuit closed after a successful probe')
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opened_total += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Пробный вызов отменён, не дав результата: следующий вызов станет новым пробным"""
+        self._probe_in_flight = False
+
+
+class Backend:
+    """Семафор, дедлайн и автомат размыкания для одного внешнего сервиса"""
+
+    def __init__(self, name: str, max_concurrency: int, deadline: Optional[float],
+                 failure_exceptions: tuple[type[BaseException], ...]):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.failure_exceptions = failure_exceptions
+        self.breaker = CircuitBreaker(settings.circuit_failure_threshold, settings.circuit_recovery_timeout)
+        self.in_flight = 0
+        self.timeouts = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rejected = {reason: backend_rejections.labels(name, reason)
+                          for reason in ('circuit_open', 'concurrency', 'deadline')}
+
+    def ensure_available(self) -> None:
+        """Быстрый отказ без вызова, если автомат разомкнут и пробовать ещё рано"""
+        if self.breaker.state == OPEN and self.breaker.retry_after > 0:
+            self._reject('circuit_open', self.breaker.retry_after)
+
+    @asynccontextmanager
+    async def guard(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        if not self.breaker.allow():
+            self._reject('circuit_open', self.breaker.retry_after)
+        try:
+            await self._acquire_slot()
+        except BackendUnavailable:
+            self.breaker.release_probe()
+            raise
+        self.in_flight += 1
+        try:
+            async with asyncio.timeout(deadline or self.deadline):
+                yield
+        except TimeoutError:
+            # Сюда же попадают собственные таймауты драйверов (asyncio.TimeoutError)
+            self.timeouts += 1
+            self.breaker.record_failure()
+            self._reject('deadline')
+        except self.failure_exceptions:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception:
+            self.breaker.record_success()
+            raise
+        else:
+            self.breaker.record_success()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _acquire_slot(self) -> None:
+        if self._semaphore.locked() and settings.backend_queue_timeout <= 0:
+            self._reject('concurrency')
+        try:
+            async with asyncio.timeout(settings.backend_queue_timeout):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self._reject('concurrency')
+
+    def _reject(self, reason: str, retry_after: float = 1.0) -> None:
+        self._rejected[reason].inc()
+        raise BackendUnavailable(self.name, reason, retry_after)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'consecutive_failures': self.breaker.failures,
+            'circuit_opened_total': self.breaker.opened_total,
+            'timeouts': self.timeouts,
+        }
+
+
+postgres = Backend(
+    'postgres',
+    max_concurrency=settings.postgres_max_concurrency,
+    deadline=settings.postgres_deadline,
+    failure_exceptions=(OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                        asyncpg.exceptions.QueryCanceledError, asyncpg.exceptions.TooManyConnectionsError),
+)
+redis = Backend(
+    'redis',
+    max_concurrency=settings.redis_max_concurrency,
+    deadline=settings.redis_deadline,
+    failure_exceptions=(OSError, redis_exceptions.ConnectionError, redis_exceptions.TimeoutError,
+                        redis_exceptions.BusyLoadingError),
+)
+smtp = Backend(
+    'smtp',
+    max_concurrency=settings.smtp_max_concurrency,
+    deadline=settings.smtp_deadline,
+    failure_exceptions=(OSError, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPServerDisconnected,
+                        aiosmtplib.SMTPTimeoutError),
+)
+
+backends = (postgres, redis, smtp)
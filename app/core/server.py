@@ -0,0 +1,200 @@
+"""Production-запуск сервиса: несколько процессов uvicorn на одном сокете.
+
+Родительский процесс загружает приложение и прогревает его (настройки,
+ключи подписи, шаблоны писем, схема OpenAPI), открывает сокет и делает fork
+нужного числа воркеров. Прогретое состояние воркеры получают готовым,
+а пулы соединений с бд и Redis каждый открывает сам в lifespan.
+
+    python -m app.core.server --workers 4
+
+По SIGTERM или SIGINT родитель рассылает воркерам SIGTERM: они перестают
+принимать соединения, дожидаются текущих запросов (не дольше
+graceful_shutdown_timeout) и закрывают пулы. Упавший воркер перезапускается.
+"""
+import argparse
+import gc
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Optional
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+from app.core.config import settings
+from app.core.keys import keyring
+from app.core.logger import setup_logging, stop_logging
+from app.utils.email_utils import prepare_email_templates
+
+logger = logging.getLogger(__name__)
+
+# Воркер, проживший меньше этого времени, считается падающим при старте
+MIN_WORKER_LIFETIME = 5.0
+
+
+def default_workers() -> int:
+    """Число ядер, доступных процессу (с учётом taskset/cpuset)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def select_loop() -> str:
+    return 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+
+
+def select_http() -> str:
+    return 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+
+def warm_up(app: Any) -> None:
+    """Всё, что не зависит от цикла событий и соединений, делается до fork"""
+    keyring.load()
+    prepare_email_templates()
+    if hasattr(app, 'openapi'):
+        app.openapi()
+    # Объекты, созданные к этому моменту, сборщик мусора больше не обходит,
+    # и страницы памяти родителя не копируются в воркеры из-за его проходов
+    gc.collect()
+    gc.freeze()
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _ignore_signal(signum, frame) -> None:
+    pass
+
+
+def run_worker(app: Any, sock: socket.socket) -> int:
+    """Тело дочернего процесса: один uvicorn на унаследованном сокете"""
+    # Свои группы процессов: Ctrl+C в терминале получает только родитель,
+    # и воркер не останавливают дважды (повторный SIGINT uvicorn считает принудительным)
+    os.setpgid(0, 0)
+    # uvicorn после остановки повторно поднимает пойманный сигнал; обработчик-заглушка
+    # не даёт процессу умереть до того, как допишутся логи
+    signal.signal(signal.SIGTERM, _ignore_signal)
+    signal.signal(signal.SIGINT, _ignore_signal)
+    setup_logging()
+    config = uvicorn.Config(
+        app,
+        loop=select_loop(),
+        http=select_http(),
+        lifespan='on',
+        log_config=None,
+        timeout_keep_alive=settings.keepalive_timeout,
+        timeout_graceful_shutdown=settings.graceful_shutdown_timeout,
+        backlog=settings.backlog,
+    )
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        stop_logging()
+    return 0 if server.started else 1
+
+
+class Supervisor:
+    """Родительский процесс: запускает воркеры, перезапускает упавшие и останавливает все"""
+
+    def __init__(self, app: Any, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children: dict[int, float] = {}
+        self._stopping = False
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logger.info('Starting %d workers (loop=%s, http=%s) on %s',
+                    self.workers, select_loop(), select_http(), self.sock.getsockname())
+        for _ in range(self.workers):
+            self._spawn()
+        while not self._stopping:
+            self._reap()
+            time.sleep(0.5)
+        self._shutdown()
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(self.app, self.sock)
+            except BaseException:
+                logger.exception('Worker %d crashed', os.getpid())
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def _reap(self) -> None:
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if started is None or self._stopping:
+                continue
+            logger.warning('Worker %d exited with status %d, restarting', pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(1)
+            self._spawn()
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _shutdown(self) -> None:
+        logger.info('Stopping %d workers', len(self.children))
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + settings.graceful_shutdown_timeout + 10
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.children:
+            logger.warning('Worker %d did not stop in time, killing', pid)
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.children.clear()
+        self.sock.close()
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def run(app: Any, host: Optional[str] = None, port: Optional[int] = None, workers: Optional[int] = None) -> None:
+    """Прогрев приложения и запуск воркеров; возвращается после остановки всех воркеров"""
+    # Потоки логирования не переживают fork, поэтому родитель пишет логи синхронно
+    setup_logging(queued=False)
+    warm_up(app)
+    sock = bind_socket(host or settings.host, port or settings.port, settings.backlog)
+    Supervisor(app, sock, workers or settings.workers or default_workers()).run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default='main:app', help='ASGI-приложение в виде module:attribute')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help='По умолчанию settings.workers или число ядер')
+    args = parser.parse_args()
+
+    run(import_from_string(args.app), args.host, args.port, args.workers)
@@ -1,27 +1,101 @@
+import asyncio
+import contextlib
+import logging
 from typing import AsyncGenerator, Optional
 
 import asyncpg
+from fastapi import HTTPException, status
 
+from app.core import resilience
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = settings.postgres_url
 
-connection: Optional[asyncpg.Connection] = None
-
-async def lifespan(app) -> AsyncGenerator:
-    """Функция инициализации контекстного менеджера жизненного цикла для соединения с бд"""
-    global connection
-    if connection is None:
-        connection = await asyncpg.connect(DATABASE_URL)
-        print('Соединение с базой данных установлено')
-    yield
-    if connection is not None:
-        await connection.close()
-        print('Соединение с базой данных закрыто')
-
-async def get_db():
-    """Dependency для получения соединения с бд"""
-    global connection
-    if connection is None:
-        connection = await asyncpg.connect(DATABASE_URL)
-    yield connection
\ No newline at end of file
+pool: Optional[asyncpg.Pool] = None
+_pool_lock = asyncio.Lock()
+
+
+async def create_pool(dsn: str = DATABASE_URL) -> asyncpg.Pool:
+    """Создание пула соединений с бд (основной или репликой) по настройкам приложения.
+
+    Подготовленные выражения кешируются asyncpg внутри каждого соединения
+    (statement_cache_size), поэтому запросы из app.db.functions
+    подготавливаются один раз на соединение, а не на каждый вызов."""
+    return await asyncpg.create_pool(
+        dsn,
+        min_size=settings.postgres_pool_min_size,
+        max_size=settings.postgres_pool_max_size,
+        max_queries=settings.postgres_pool_max_queries,
+        max_inactive_connection_lifetime=settings.postgres_pool_max_inactive_connection_lifetime,
+        statement_cache_size=settings.postgres_statement_cache_size,
+    )
+
+
+async def init_pool() -> asyncpg.Pool:
+    """Ленивая инициализация глобального пула соединений"""
+    global pool
+    async with _pool_lock:
+        if pool is None:
+            pool = await create_pool()
+            logger.info('Пул соединений с базой данных создан')
+    return pool
+
+
+async def close_pool() -> None:
+    """Закрытие пула: дожидается возврата всех соединений"""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+        logger.info('Пул соединений с базой данных закрыт')
+
+
+async def get_db() -> AsyncGenerator[asyncpg.Connection, None]:
+    """Dependency для получения соединения из пула на время запроса"""
+    db_pool = pool if pool is not None else await init_pool()
+    # Пока автомат размыкания открыт, не ждём соединения из пула
+    resilience.postgres.ensure_available()
+    try:
+        connection = await db_pool.acquire(timeout=settings.postgres_pool_acquire_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Database connection pool exhausted'
+        )
+    try:
+        yield connection
+    finally:
+        await db_pool.release(connection)
+
+
+async def get_read_db() -> AsyncGenerator[asyncpg.Connection, None]:
+    """Dependency для запросов только на чтение: соединение с реплики по кругу,
+    а если реплики не настроены или недоступны — с основной бд.
+    Только для данных, отставание которых безопасно (поиск пользователя по
+    email); refresh-токены читаются с основной бд, иначе реплика с задержкой
+    вернула бы токен, уже удалённый при логауте"""
+    replica_set = replicas.replica_set
+    if replica_set is None:
+        async with contextlib.aclosing(get_db()) as connections:
+            async for connection in connections:
+                yield connection
+        return
+    if pool is None:
+        await init_pool()
+    try:
+        connection, replica = await replica_set.acquire()
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Database connection pool exhausted'
+        )
+    try:
+        yield connection
+    finally:
+        await replica_set.release(connection, replica)
+
+
+# Модуль реплик обращается к pool и create_pool этого модуля во время работы
+from app.db import replicas  # noqa: E402
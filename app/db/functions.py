@@ -1,39 +1,224 @@
+import logging
+import time
 from datetime import datetime
 from typing import Optional
 from uuid import UUID
 
 import asyncpg
 from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import db_query_duration, redis_command_duration
+from app.db import write_behind
+from app.db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Тексты запросов вынесены в константы: asyncpg кеширует подготовленные
+# выражения по тексту запроса, так что каждый из них готовится один раз
+# на соединение пула
+# Просроченные строки, которые очистка ещё не удалила, не возвращаются
+GET_REFRESH_TOKEN_QUERY = (
+    "SELECT refresh_token, expires_at FROM tokens "
+    "WHERE user_id = $1 AND expires_at > (now() AT TIME ZONE 'utc')"
+)
+SAVE_REFRESH_TOKEN_QUERY = 'SELECT save_refresh_token($1, $2, $3)'
+DELETE_REFRESH_TOKEN_QUERY = 'DELETE FROM tokens WHERE user_id = $1'
+# Сравнение без учёта регистра совпадает с индексом users_email_lower_idx
+GET_USER_ID_BY_EMAIL_QUERY = 'SELECT id FROM users WHERE lower(email) = lower($1)'
+
+REFRESH_TOKEN_KEY = 'refresh_token:{}'
+# Метка логаута: пока она жива, прочитанный из бд токен в кеш не попадает
+REFRESH_TOKEN_DELETED_KEY = 'refresh_token_deleted:{}'
+
+# Заполнение кеша после чтения из бд. Чтение могло начаться до логаута, и
+# безусловный SET вернул бы отозванный токен в кеш до его expires_at, поэтому
+# токен записывается, только если метки логаута нет
+FILL_REFRESH_TOKEN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+_get_refresh_token_timer = db_query_duration.labels('get_refresh_token')
+_save_refresh_token_timer = db_query_duration.labels('save_refresh_token')
+_delete_refresh_token_timer = db_query_duration.labels('delete_refresh_token')
+_cache_get_timer = redis_command_duration.labels('get_refresh_token')
+_cache_set_timer = redis_command_duration.labels('set_refresh_token')
+_cache_delete_timer = redis_command_duration.labels('delete_refresh_token')
+_fill_refresh_token_script = None
+
+
+class TokenStoreStats:
+    """Счётчики двухуровневого хранилища refresh-токенов: Redis перед Postgres"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+        self.postgres_calls = 0
+        self.postgres_seconds = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def observe_redis(self, started: float) -> None:
+        self.redis_calls += 1
+        self.redis_seconds += time.perf_counter() - started
+
+    def observe_postgres(self, started: float) -> None:
+        self.postgres_calls += 1
+        self.postgres_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'redis_calls': self.redis_calls,
+            'redis_seconds': self.redis_seconds,
+            'postgres_calls': self.postgres_calls,
+            'postgres_seconds': self.postgres_seconds,
+        }
+
+
+token_store_stats = TokenStoreStats()
+
+
+async def _get_cached_refresh_token(user_id: str) -> Optional[str]:
+    started = time.perf_counter()
+    try:
+        async with resilience.redis.guard():
+            with _cache_get_timer.time():
+                refresh_token = await (await get_redis()).get(REFRESH_TOKEN_KEY.format(user_id))
+    except (RedisError, resilience.BackendUnavailable) as e:
+        # Недоступный Redis не должен ломать чтение: идём в Postgres
+        logger.warning('Error reading cached refresh_token for user_id %s: %s', user_id, e)
+        return None
+    token_store_stats.observe_redis(started)
+    if refresh_token is None:
+        token_store_stats.misses += 1
+    else:
+        token_store_stats.hits += 1
+    return refresh_token
+
+
+def _get_fill_refresh_token_script(redis):
+    global _fill_refresh_token_script
+    if _fill_refresh_token_script is None:
+        _fill_refresh_token_script = redis.register_script(FILL_REFRESH_TOKEN_SCRIPT)
+    return _fill_refresh_token_script
+
+
+async def _cache_refresh_token(user_id: str, refresh_token: str, expires_at: datetime, fill: bool = False) -> None:
+    """Запись токена в Redis с TTL до expires_at (время в UTC, как в таблице tokens).
+    fill — токен прочитан из бд и записывается, только если после чтения не было логаута"""
+    ttl = int((expires_at - datetime.utcnow()).total_seconds())
+    if ttl <= 0:
+        return
+    started = time.perf_counter()
+    try:
+        redis = await get_redis()
+        async with resilience.redis.guard():
+            with _cache_set_timer.time():
+                if fill:
+                    await _get_fill_refresh_token_script(redis)(
+                        keys=[REFRESH_TOKEN_KEY.format(user_id), REFRESH_TOKEN_DELETED_KEY.format(user_id)],
+                        args=[refresh_token, ttl],
+                        client=redis,
+                    )
+                else:
+                    await redis.setex(REFRESH_TOKEN_KEY.format(user_id), ttl, refresh_token)
+    except (RedisError, resilience.BackendUnavailable) as e:
+        logger.warning('Error caching refresh_token for user_id %s: %s', user_id, e)
+        return
+    token_store_stats.observe_redis(started)
 
 
 async def get_refresh_token_for_user(conn: asyncpg.Connection, user_id: str) -> Optional[str]:
+    writer = write_behind.refresh_token_writer
+    if writer is not None:
+        pending_token = writer.get_pending(user_id)
+        if pending_token is not None:
+            return pending_token
+    if settings.refresh_token_cache_enabled:
+        refresh_token = await _get_cached_refresh_token(user_id)
+        if refresh_token is not None:
+            return refresh_token
     try:
-        query = """
-        SELECT refresh_token FROM tokens WHERE user_id = $1
-        """
-        row = await conn.fetchrow(query, user_id)
-        return row['refresh_token'] if row else None
+        started = time.perf_counter()
+        async with resilience.postgres.guard():
+            with _get_refresh_token_timer.time():
+                # Только основная бд: реплика может ещё хранить удалённый при
+                # логауте токен, а прочитанное отсюда попадает в кеш Redis
+                row = await conn.fetchrow(GET_REFRESH_TOKEN_QUERY, user_id)
+        token_store_stats.observe_postgres(started)
+    except resilience.BackendUnavailable:
+        # Недоступная бд — 503, а не отсутствующий токен
+        raise
     except Exception as e:
-        print(f"Error fetching refresh_token for user_id {user_id}: {e}")
+        logger.error('Error fetching refresh_token for user_id %s: %s', user_id, e)
+        return None
+    if row is None:
         return None
+    if settings.refresh_token_cache_enabled:
+        await _cache_refresh_token(user_id, row['refresh_token'], row['expires_at'], fill=True)
+    return row['refresh_token']
 
 
-async def execute_save_refresh_token(conn: asyncpg.Connection, user_id: UUID, refresh_token: str, expires_at: datetime) -> None:
-    try:
-        query = '''
-        SELECT save_refresh_token($1, $2, $3);
-        '''
-        await conn.execute(query, user_id, refresh_token, expires_at)
-    except asyncpg.exceptions.RaiseException as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+async def execute_save_refresh_token(conn: Optional[asyncpg.Connection], user_id: UUID, refresh_token: str, expires_at: datetime) -> None:
+    writer = write_behind.refresh_token_writer
+    if writer is not None:
+        # В режиме write-behind запись уйдёт в бд следующим пакетом
+        await writer.save(user_id, refresh_token, expires_at)
+    else:
+        try:
+            started = time.perf_counter()
+            async with resilience.postgres.guard():
+                with _save_refresh_token_timer.time():
+                    await conn.execute(SAVE_REFRESH_TOKEN_QUERY, user_id, refresh_token, expires_at)
+            token_store_stats.observe_postgres(started)
+        except asyncpg.exceptions.RaiseError as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    if settings.refresh_token_cache_enabled:
+        await _cache_refresh_token(str(user_id), refresh_token, expires_at)
+
+
+async def _invalidate_cached_refresh_token(user_id: str) -> None:
+    """Метка логаута и удаление токена из кеша одной транзакцией"""
+    started = time.perf_counter()
+    async with resilience.redis.guard():
+        with _cache_delete_timer.time():
+            async with (await get_redis()).pipeline(transaction=True) as pipe:
+                pipe.set(REFRESH_TOKEN_DELETED_KEY.format(user_id), 1, ex=settings.refresh_token_cache_tombstone_ttl)
+                pipe.delete(REFRESH_TOKEN_KEY.format(user_id))
+                await pipe.execute()
+    token_store_stats.observe_redis(started)
 
 
 async def delete_refresh_token_for_user(conn: asyncpg.Connection, user_id: str) -> None:
+    """Логаут: сначала кеш, затем строка в бд. Если Redis недоступен, логаут не
+    выполняется вовсе, а не оставляет в кеше токен, удалённый из бд"""
     try:
-        query = """
-        DELETE FROM tokens WHERE user_id = $1
-        """
-        await conn.execute(query, user_id)
+        if settings.refresh_token_cache_enabled:
+            await _invalidate_cached_refresh_token(user_id)
+        writer = write_behind.refresh_token_writer
+        if writer is not None:
+            await writer.discard(user_id)
+        started = time.perf_counter()
+        async with resilience.postgres.guard():
+            with _delete_refresh_token_timer.time():
+                await conn.execute(DELETE_REFRESH_TOKEN_QUERY, user_id)
+        token_store_stats.observe_postgres(started)
+    except resilience.BackendUnavailable:
+        raise
     except Exception as e:
-        print(f"Error deleting refresh_token for user_id {user_id}: {e}")
+        logger.error('Error deleting refresh_token for user_id %s: %s', user_id, e)
         raise HTTPException(status_code=500, detail="Failed to delete refresh token")
@@ -1,3 +1,4 @@
+-- Исходная схема. Повторяет прежний init.sql и безопасна для баз, где он уже применён
 CREATE TABLE IF NOT EXISTS tokens(
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID NOT NULL,
@@ -6,6 +7,16 @@ CREATE TABLE IF NOT EXISTS tokens(
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
 
+-- Индекс для фоновой очистки просроченных токенов
+CREATE INDEX IF NOT EXISTS tokens_expires_at_idx ON tokens (expires_at);
+
+-- Пользователи; сервис только ищет их по email
+CREATE TABLE IF NOT EXISTS users(
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    email TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
 CREATE OR REPLACE FUNCTION save_refresh_token(p_user_id UUID,
 p_refresh_token TEXT, p_expires_at TIMESTAMP)
 RETURNS VOID AS $$
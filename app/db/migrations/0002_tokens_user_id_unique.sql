@@ -0,0 +1,35 @@
+-- Один refresh-токен на пользователя: уникальный индекс по user_id и upsert
+-- в save_refresh_token вместо накопления строк на каждый логин.
+-- Из дублей остаётся токен с самым поздним сроком действия
+DELETE FROM tokens
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY expires_at DESC, created_at DESC) AS position
+        FROM tokens
+    ) ranked
+    WHERE position > 1
+);
+
+-- У секционированной таблицы (tokens_partitioning.sql) уникальный индекс обязан
+-- включать expires_at, поэтому для неё индекс по user_id обычный
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'tokens'::regclass) = 'p' THEN
+        CREATE INDEX IF NOT EXISTS tokens_user_id_idx ON tokens (user_id);
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS tokens_user_id_key ON tokens (user_id);
+    END IF;
+END $$;
+
+CREATE OR REPLACE FUNCTION save_refresh_token(p_user_id UUID,
+p_refresh_token TEXT, p_expires_at TIMESTAMP)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO tokens(user_id, refresh_token, expires_at)
+  VALUES (p_user_id, p_refresh_token, p_expires_at)
+  ON CONFLICT (user_id) DO UPDATE
+  SET refresh_token = EXCLUDED.refresh_token,
+      expires_at = EXCLUDED.expires_at,
+      created_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
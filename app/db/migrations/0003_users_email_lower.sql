@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Поиск пользователя по email без учёта регистра. CONCURRENTLY не блокирует
+-- запись в users, но не работает в транзакции, поэтому миграция из одного выражения
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users (lower(email));
@@ -0,0 +1,91 @@
+import logging
+from pathlib import Path
+from typing import NamedTuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent
+PARTITIONING_SCRIPT = MIGRATIONS_DIR / 'tokens_partitioning.sql'
+
+# Миграции с этой первой строкой выполняются вне транзакции (CREATE INDEX
+# CONCURRENTLY и т. п.) и должны состоять из одного выражения
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
+# Одновременно миграции применяет только один процесс
+MIGRATION_LOCK_ID = 0x6D6967726174
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations(
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION_MARKER)
+
+
+def load_migrations() -> list[Migration]:
+    """Миграции из файлов вида 0001_name.sql по возрастанию версии"""
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob('[0-9][0-9][0-9][0-9]_*.sql')):
+        version, _, name = path.stem.partition('_')
+        migrations.append(Migration(int(version), name, path.read_text()))
+    return migrations
+
+
+async def applied_versions(conn: asyncpg.Connection) -> set[int]:
+    await conn.execute(CREATE_MIGRATIONS_TABLE)
+    return {row['version'] for row in await conn.fetch('SELECT version FROM schema_migrations')}
+
+
+async def pending_migrations(conn: asyncpg.Connection) -> list[Migration]:
+    applied = await applied_versions(conn)
+    return [migration for migration in load_migrations() if migration.version not in applied]
+
+
+async def migrate(conn: asyncpg.Connection) -> list[Migration]:
+    """Применяет недостающие миграции по порядку, возвращает применённые"""
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        pending = await pending_migrations(conn)
+        for migration in pending:
+            logger.info('Applying migration %04d_%s', migration.version, migration.name)
+            if migration.transactional:
+                async with conn.transaction():
+                    await conn.execute(migration.sql)
+                    await _mark_applied(conn, migration)
+            else:
+                await conn.execute(migration.sql)
+                await _mark_applied(conn, migration)
+        return pending
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+
+
+async def migrate_pool(pool: asyncpg.Pool) -> list[Migration]:
+    async with pool.acquire() as conn:
+        return await migrate(conn)
+
+
+async def partition_tokens(conn: asyncpg.Connection) -> None:
+    """Однократный перевод tokens на секционирование, только поверх всех миграций"""
+    pending = await pending_migrations(conn)
+    if pending:
+        raise RuntimeError(f'Apply pending migrations first: {", ".join(m.name for m in pending)}')
+    await conn.execute(PARTITIONING_SCRIPT.read_text())
+
+
+async def _mark_applied(conn: asyncpg.Connection, migration: Migration) -> None:
+    await conn.execute('INSERT INTO schema_migrations(version, name) VALUES ($1, $2)',
+                       migration.version, migration.name)
@@ -0,0 +1,85 @@
+"""Миграции схемы бд и проверка планов горячих запросов.
+
+    python -m app.db.migrations upgrade    # применить недостающие миграции
+    python -m app.db.migrations status     # применённые и ожидающие миграции
+    python -m app.db.migrations check      # EXPLAIN запросов сервиса, ошибка при Seq Scan
+    python -m app.db.migrations partition  # однократно секционировать tokens по expires_at
+
+check запускается на базе со всеми миграциями. Seq Scan отключается через
+enable_seqscan, поэтому на пустой таблице проверка тоже находит
+запросы, которым не хватает индекса.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+from typing import Any, Iterator
+
+import asyncpg
+
+from app.db import DATABASE_URL
+from app.db.functions import DELETE_REFRESH_TOKEN_QUERY, GET_REFRESH_TOKEN_QUERY, GET_USER_ID_BY_EMAIL_QUERY
+from app.db.migrations import load_migrations, migrate, partition_tokens, pending_migrations
+from app.db.sweeper import DELETE_EXPIRED_TOKENS_QUERY
+
+# Запросы app.db.functions, роутов и очистки с примерами параметров
+CHECKED_QUERIES = {
+    'get_refresh_token': (GET_REFRESH_TOKEN_QUERY, (uuid.uuid4(),)),
+    'delete_refresh_token': (DELETE_REFRESH_TOKEN_QUERY, (uuid.uuid4(),)),
+    'get_user_by_email': (GET_USER_ID_BY_EMAIL_QUERY, ('user@example.com',)),
+    'delete_expired_tokens': (DELETE_EXPIRED_TOKENS_QUERY, (1000,)),
+}
+
+
+def _plan_nodes(node: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+async def check_query_plans(conn: asyncpg.Connection) -> list[str]:
+    """Имена запросов, в плане которых есть последовательное чтение таблицы"""
+    failed = []
+    async with conn.transaction():
+        await conn.execute('SET LOCAL enable_seqscan = off')
+        for name, (query, params) in CHECKED_QUERIES.items():
+            plan = json.loads(await conn.fetchval(f'EXPLAIN (FORMAT JSON) {query}', *params))
+            scans = [node.get('Relation Name', '?') for node in _plan_nodes(plan[0]['Plan'])
+                     if node['Node Type'] == 'Seq Scan']
+            if scans:
+                failed.append(name)
+                print(f'FAIL {name}: Seq Scan on {", ".join(scans)}')
+            else:
+                print(f'ok   {name}')
+    return failed
+
+
+async def main(command: str) -> int:
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if command == 'upgrade':
+            applied = await migrate(conn)
+            print(f'Applied {len(applied)} migration(s)')
+        elif command == 'status':
+            pending = {migration.version for migration in await pending_migrations(conn)}
+            for migration in load_migrations():
+                state = 'pending' if migration.version in pending else 'applied'
+                print(f'{migration.version:04d}_{migration.name}: {state}')
+        elif command == 'check':
+            if await check_query_plans(conn):
+                return 1
+        elif command == 'partition':
+            await partition_tokens(conn)
+            print('Table tokens is partitioned by expires_at, set TOKENS_PARTITIONING_ENABLED=true')
+    finally:
+        await conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['upgrade', 'status', 'check', 'partition'])
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.command)))
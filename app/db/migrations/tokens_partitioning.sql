@@ -0,0 +1,60 @@
+-- Перевод tokens на секционирование по дням expires_at. Выполняется один раз
+-- в окно обслуживания после всех миграций (python -m app.db.migrations partition),
+-- после чего включается TOKENS_PARTITIONING_ENABLED: дальнейшие секции
+-- создаёт и удаляет app.db.sweeper.
+-- Действующие токены переносятся, просроченные отбрасываются.
+BEGIN;
+
+LOCK TABLE tokens IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE tokens RENAME TO tokens_unpartitioned;
+ALTER INDEX IF EXISTS tokens_expires_at_idx RENAME TO tokens_unpartitioned_expires_at_idx;
+
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования
+CREATE TABLE tokens(
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL,
+    refresh_token TEXT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, expires_at)
+    ) PARTITION BY RANGE (expires_at);
+
+CREATE INDEX tokens_expires_at_idx ON tokens (expires_at);
+-- Уникальный индекс по одному user_id у секционированной таблицы невозможен
+CREATE INDEX tokens_user_id_idx ON tokens (user_id);
+
+-- Секции на срок жизни токенов вперёд; строки вне их попадают в секцию по умолчанию
+DO $$
+DECLARE
+    day DATE;
+BEGIN
+    FOR day IN SELECT generate_series(current_date - 1, current_date + 62, INTERVAL '1 day')::DATE LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tokens FOR VALUES FROM (%L) TO (%L)',
+            'tokens_p' || to_char(day, 'YYYYMMDD'), day, day + 1
+        );
+    END LOOP;
+END $$;
+
+CREATE TABLE tokens_default PARTITION OF tokens DEFAULT;
+
+INSERT INTO tokens(id, user_id, refresh_token, expires_at, created_at)
+SELECT id, user_id, refresh_token, expires_at, created_at FROM tokens_unpartitioned
+WHERE expires_at > (now() AT TIME ZONE 'utc');
+
+DROP TABLE tokens_unpartitioned;
+
+-- Без уникального индекса ON CONFLICT (user_id) не работает: замена токена
+-- пользователя сериализуется advisory-блокировкой на время транзакции
+CREATE OR REPLACE FUNCTION save_refresh_token(p_user_id UUID,
+p_refresh_token TEXT, p_expires_at TIMESTAMP)
+RETURNS VOID AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtextextended(p_user_id::text, 0));
+  DELETE FROM tokens WHERE user_id = p_user_id;
+  INSERT INTO tokens(user_id, refresh_token, expires_at)
+  VALUES (p_user_id, p_refresh_token, p_expires_at);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
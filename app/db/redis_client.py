@@ -0,0 +1,56 @@
+import asyncio
+from typing import Optional
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from app.core.config import settings
+
+REDIS_URL = f'redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}'
+
+redis_client: Optional[Redis] = None
+_redis_lock = asyncio.Lock()
+
+
+def create_redis(url: str = REDIS_URL) -> Redis:
+    """Создание асинхронного клиента Redis поверх ограниченного пула соединений.
+
+    BlockingConnectionPool не открывает больше redis_max_connections соединений:
+    при исчерпании пула запрос ждёт освободившееся соединение не дольше
+    redis_pool_timeout, а не создаёт новое."""
+    connection_pool = BlockingConnectionPool.from_url(
+        url,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        decode_responses=True,
+    )
+    return Redis(connection_pool=connection_pool)
+
+
+async def init_redis() -> Redis:
+    """Ленивая инициализация глобального клиента Redis"""
+    global redis_client
+    async with _redis_lock:
+        if redis_client is None:
+            redis_client = create_redis()
+    return redis_client
+
+
+async def warm_redis(connections: int) -> None:
+    """Заранее открывает до connections соединений пула: одновременные PING
+    берут разные соединения, и первые запросы не ждут подключения к Redis"""
+    redis = await get_redis()
+    await asyncio.gather(*(redis.ping() for _ in range(min(connections, settings.redis_max_connections))))
+
+
+async def close_redis() -> None:
+    """Закрытие клиента Redis вместе с его пулом соединений"""
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose(close_connection_pool=True)
+        redis_client = None
+
+
+async def get_redis() -> Redis:
+    """Dependency для получения клиента Redis"""
+    return redis_client if redis_client is not None else await init_redis()
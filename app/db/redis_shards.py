@@ -0,0 +1,163 @@
+"""Ключи, привязанные к email, поверх нескольких узлов Redis.
+
+Коды подтверждения и токены сброса пароля живут отдельно от общего
+клиента Redis (outbox, отзыв токенов, лимиты), который остаётся на
+redis_host. В зависимости от settings.redis_keyspace_mode они хранятся:
+
+    single  — в том же Redis, что и всё остальное;
+    cluster — в Redis Cluster, узлы redis_nodes служат точками входа;
+    sharded — на узлах redis_nodes по согласованному хешированию на стороне
+              клиента: добавление узла переносит лишь ~1/N ключей.
+
+Связанные ключи одного email содержат hash tag — часть в фигурных скобках,
+например verification_code:{<email_tag(email)>}. И Redis Cluster, и кольцо
+хешей размещают ключ по этой части, поэтому скрипты над несколькими
+ключами одного email выполняются на одном узле.
+"""
+import asyncio
+import bisect
+import hashlib
+from typing import Optional, Union
+
+from redis.asyncio import Redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.exceptions import ConnectionError, RedisClusterException, RedisError
+
+from app.core.config import settings
+from app.db import redis_client
+
+SINGLE = 'single'
+CLUSTER = 'cluster'
+SHARDED = 'sharded'
+
+
+def hash_tag(key: str) -> str:
+    """Часть ключа, по которой выбирается узел: как в Redis Cluster, содержимое
+    первой непустой пары фигурных скобок, иначе весь ключ"""
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def normalize_email(email: str) -> str:
+    return email.lower()
+
+
+def email_tag(email: str) -> str:
+    """Hash tag ключей email — хеш адреса в нижнем регистре. Сам адрес для этого
+    не годится: он может быть пустым или содержать фигурные скобки"""
+    return hashlib.sha1(normalize_email(email).encode()).hexdigest()
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Кольцо согласованного хеширования с виртуальными точками узлов"""
+
+    def __init__(self, nodes: list[str], points_per_node: int):
+        points = sorted((_ring_hash(f'{node}#{i}'), node) for node in nodes for i in range(points_per_node))
+        self._hashes = [point_hash for point_hash, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _ring_hash(hash_tag(key))) % len(self._hashes)
+        return self._nodes[index]
+
+
+class ShardedRedis:
+    """Клиенты узлов redis_nodes и выбор узла для ключа по кольцу хешей"""
+
+    def __init__(self, nodes: list[str]):
+        self.ring = HashRing(nodes, settings.redis_ring_points_per_node)
+        self.clients = {node: redis_client.create_redis(f'redis://{node}/{settings.redis_db}') for node in nodes}
+
+    def client_for(self, key: str) -> Redis:
+        return self.clients[self.ring.node_for(key)]
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(client.aclose(close_connection_pool=True) for client in self.clients.values()))
+
+
+class KeyspaceCluster(RedisCluster):
+    """RedisCluster, у которого недоступность кластера — ConnectionError.
+
+    RedisClusterException (нет узлов, слот не покрыт) не наследует RedisError, и
+    маршруты, рассчитанные на деградацию при сбое Redis, отвечали бы 500. Как
+    ConnectionError она проходит тем же путём, что и сбой обычного клиента, и
+    учитывается автоматом размыкания resilience.redis"""
+
+    async def initialize(self) -> 'KeyspaceCluster':
+        try:
+            return await super().initialize()
+        except RedisClusterException as e:
+            raise ConnectionError(f'Redis Cluster is unavailable: {e}') from e
+
+    async def execute_command(self, *args, **kwargs):
+        try:
+            return await super().execute_command(*args, **kwargs)
+        except RedisClusterException as e:
+            raise ConnectionError(f'Redis Cluster is unavailable: {e}') from e
+
+
+def create_cluster(nodes: list[str]) -> KeyspaceCluster:
+    startup_nodes = [ClusterNode(host, int(port)) for host, port in (node.rsplit(':', 1) for node in nodes)]
+    return KeyspaceCluster(
+        startup_nodes=startup_nodes,
+        max_connections=settings.redis_max_connections,
+        socket_timeout=settings.redis_socket_timeout,
+        decode_responses=True,
+    )
+
+
+keyspace: Optional[Union[RedisCluster, ShardedRedis]] = None
+_keyspace_lock = asyncio.Lock()
+
+
+async def init_keyspace() -> None:
+    global keyspace
+    async with _keyspace_lock:
+        if keyspace is not None or settings.redis_keyspace_mode == SINGLE:
+            return
+        if not settings.redis_nodes:
+            raise ValueError(f'redis_nodes must be set for redis_keyspace_mode={settings.redis_keyspace_mode}')
+        if settings.redis_keyspace_mode == CLUSTER:
+            cluster = create_cluster(settings.redis_nodes)
+            try:
+                await cluster.initialize()
+            except RedisError:
+                await cluster.aclose()
+                raise
+            # Только инициализированный кластер: следующий вызов повторит попытку
+            keyspace = cluster
+        elif settings.redis_keyspace_mode == SHARDED:
+            keyspace = ShardedRedis(settings.redis_nodes)
+        else:
+            raise ValueError(f'Unknown redis_keyspace_mode: {settings.redis_keyspace_mode}')
+
+
+async def close_keyspace() -> None:
+    global keyspace
+    if keyspace is not None:
+        await keyspace.aclose()
+        keyspace = None
+
+
+async def get_redis_for_keys(*keys: str) -> Union[Redis, RedisCluster]:
+    """Клиент, на котором выполняются команды и скрипты над keys.
+    Все ключи обязаны иметь общий hash tag, иначе в кластере или на шардах
+    они оказались бы на разных узлах"""
+    if settings.redis_keyspace_mode == SINGLE:
+        return await redis_client.get_redis()
+    tag = hash_tag(keys[0])
+    if any(hash_tag(key) != tag for key in keys[1:]):
+        raise ValueError(f'Keys do not share a hash tag: {keys}')
+    if keyspace is None:
+        await init_keyspace()
+    if isinstance(keyspace, ShardedRedis):
+        return keyspace.client_for(keys[0])
+    return keyspace
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+
+import app.db as db
+from app.core import resilience
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики в секундах. Догнавшая основную бд реплика (всё
+# полученное WAL применено) отстаёт на 0, даже если записей давно не было;
+# сервер не в режиме восстановления (не реплика) тоже считается догнавшим
+REPLICATION_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END::float8
+"""
+
+# Ошибки, после которых реплика исключается из ротации до следующей проверки
+REPLICA_FAILURES = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                    asyncpg.exceptions.CannotConnectNowError, asyncpg.exceptions.TooManyConnectionsError)
+
+
+class Replica:
+    """Реплика для чтения: свой пул и состояние последней проверки"""
+
+    def __init__(self, index: int, dsn: str):
+        self.name = f'replica{index}'
+        self.dsn = dsn
+        self.pool: Optional[asyncpg.Pool] = None
+        self.healthy = False
+        self.lag = 0.0
+        self.reads = 0
+        self.failures = 0
+
+    async def check(self) -> None:
+        """Проверка доступности и отставания; пул создаётся при первой удачной проверке"""
+        try:
+            if self.pool is None:
+                self.pool = await db.create_pool(self.dsn)
+            async with self.pool.acquire(timeout=settings.postgres_pool_acquire_timeout) as conn:
+                self.lag = await conn.fetchval(REPLICATION_LAG_QUERY, timeout=settings.postgres_replica_check_timeout)
+        except (*REPLICA_FAILURES, asyncpg.PostgresError) as e:
+            self.mark_down(e)
+            return
+        healthy = self.lag <= settings.postgres_replica_max_lag
+        if healthy != self.healthy:
+            if healthy:
+                logger.info('Read replica %s is back in rotation (lag %.1fs)', self.name, self.lag)
+            else:
+                logger.warning('Read replica %s lags by %.1fs, reading from primary', self.name, self.lag)
+        self.healthy = healthy
+
+    def mark_down(self, error: BaseException) -> None:
+        self.failures += 1
+        if self.healthy:
+            logger.warning('Read replica %s is unavailable, reading from primary: %s', self.name, error)
+        self.healthy = False
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+
+class ReplicaSet:
+    """Маршрутизация чтения по репликам.
+
+    Запросы только на чтение берут соединение у здоровых реплик по кругу.
+    Реплика выходит из ротации при ошибке соединения или отставании больше
+    postgres_replica_max_lag и возвращается после удачной фоновой проверки.
+    Если здоровых реплик нет, чтение идёт в основную бд."""
+
+    def __init__(self, dsns: list[str]):
+        self.replicas = [Replica(index, dsn) for index, dsn in enumerate(dsns)]
+        self.primary_reads = 0
+        self._next = 0
+        self._checked_out: dict[int, Replica] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await asyncio.gather(*(replica.check() for replica in self.replicas))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*(replica.close() for replica in self.replicas))
+
+    def choose(self) -> Optional[Replica]:
+        """Следующая здоровая реплика по кругу"""
+        count = len(self.replicas)
+        for offset in range(count):
+            replica = self.replicas[(self._next + offset) % count]
+            if replica.healthy:
+                self._next = (self._next + offset + 1) % count
+                return replica
+        return None
+
+    async def acquire(self) -> tuple[asyncpg.Connection, Optional[Replica]]:
+        """Соединение для чтения и реплика, которой оно принадлежит (None — основная бд)"""
+        while (replica := self.choose()) is not None:
+            try:
+                conn = await replica.pool.acquire(timeout=settings.postgres_pool_acquire_timeout)
+            except REPLICA_FAILURES as e:
+                replica.mark_down(e)
+                continue
+            replica.reads += 1
+            self._checked_out[id(conn)] = replica
+            return conn, replica
+        resilience.postgres.ensure_available()
+        self.primary_reads += 1
+        return await db.pool.acquire(timeout=settings.postgres_pool_acquire_timeout), None
+
+    async def release(self, conn: asyncpg.Connection, replica: Optional[Replica]) -> None:
+        if replica is None:
+            await db.pool.release(conn)
+            return
+        self._checked_out.pop(id(conn), None)
+        await replica.pool.release(conn)
+
+    def replica_for(self, conn: asyncpg.Connection) -> Optional[Replica]:
+        """Реплика, которой принадлежит выданное соединение, или None для основной бд"""
+        return self._checked_out.get(id(conn))
+
+    def stats(self) -> dict[str, float]:
+        stats = {'primary_reads': self.primary_reads}
+        for replica in self.replicas:
+            stats[f'{replica.name}_healthy'] = int(replica.healthy)
+            stats[f'{replica.name}_lag_seconds'] = replica.lag
+            stats[f'{replica.name}_reads'] = replica.reads
+            stats[f'{replica.name}_failures'] = replica.failures
+        return stats
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.postgres_replica_check_interval)
+            await asyncio.gather(*(replica.check() for replica in self.replicas))
+
+
+replica_set: Optional[ReplicaSet] = None
+
+
+async def fetchrow_read(conn: asyncpg.Connection, query: str, *args):
+    """fetchrow на соединении из get_read_db. Если реплика не ответила,
+    запрос повторяется на основной бд. Промах повторяется там же, только
+    если при последней проверке реплика отставала: иначе каждый запрос
+    несуществующей строки доходил бы до основной бд. Промах догнавшей
+    реплики на только что записанной строке принимается"""
+    replica = replica_set.replica_for(conn) if replica_set is not None else None
+    if replica is None:
+        return await conn.fetchrow(query, *args)
+    try:
+        row = await conn.fetchrow(query, *args)
+    except REPLICA_FAILURES as e:
+        replica.mark_down(e)
+    else:
+        if row is not None or replica.lag <= 0:
+            return row
+    async with db.pool.acquire(timeout=settings.postgres_pool_acquire_timeout) as primary:
+        return await primary.fetchrow(query, *args)
+
+
+async def start_replicas() -> Optional[ReplicaSet]:
+    global replica_set
+    if replica_set is None and settings.postgres_replica_urls:
+        replica_set = ReplicaSet(settings.postgres_replica_urls)
+        await replica_set.start()
+    return replica_set
+
+
+async def stop_replicas() -> None:
+    global replica_set
+    if replica_set is not None:
+        await replica_set.stop()
+        replica_set = None
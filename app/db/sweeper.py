@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import asyncpg
+
+from app.core.config import settings
+from app.core.metrics import db_query_duration
+
+logger = logging.getLogger(__name__)
+
+# Пачка просроченных строк, которые сейчас никто не держит. SKIP LOCKED даёт
+# нескольким воркерам чистить таблицу параллельно, не ожидая друг друга.
+# Сравнение по (id, expires_at) подходит и для секционированной таблицы
+DELETE_EXPIRED_TOKENS_QUERY = """
+WITH expired AS (
+    SELECT id, expires_at FROM tokens
+    WHERE expires_at < (now() AT TIME ZONE 'utc')
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+)
+DELETE FROM tokens USING expired
+WHERE tokens.id = expired.id AND tokens.expires_at = expired.expires_at
+"""
+
+LIST_PARTITIONS_QUERY = """
+SELECT child.relname FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = 'tokens'
+"""
+
+# Обслуживанием секций в каждый момент занимается один воркер
+PARTITION_LOCK_ID = 0x746F6B656E73
+
+PARTITION_NAME = 'tokens_p{:%Y%m%d}'
+_PARTITION_NAME_PATTERN = re.compile(r'^tokens_p(\d{8})$')
+
+_sweep_timer = db_query_duration.labels('delete_expired_tokens')
+
+
+def partition_name(day: date) -> str:
+    return PARTITION_NAME.format(day)
+
+
+class TokenSweeper:
+    """Фоновая очистка просроченных refresh-токенов.
+
+    Раз в interval удаляет просроченные строки пачками по batch_size, каждая
+    пачка — отдельная короткая транзакция, между пачками пауза batch_pause,
+    чтобы не занимать соединения и не нагружать диск. При секционировании
+    tokens по expires_at сначала создаёт секции на срок жизни токенов вперёд
+    и удаляет целиком секции, в которых всё уже истекло."""
+
+    def __init__(self, pool: asyncpg.Pool, interval: float, batch_size: int, batch_pause: float,
+                 partitioned: bool = False):
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.partitioned = partitioned
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.rows_deleted = 0
+        self.partitions_dropped = 0
+        self.failed_runs = 0
+        self.last_run_seconds = 0.0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sweep(self) -> int:
+        """Один проход очистки, возвращает число удалённых строк"""
+        started = time.perf_counter()
+        if self.partitioned:
+            await self.maintain_partitions()
+        deleted = 0
+        while True:
+            async with self.pool.acquire(timeout=settings.postgres_pool_acquire_timeout) as conn:
+                with _sweep_timer.time():
+                    status = await conn.execute(DELETE_EXPIRED_TOKENS_QUERY, self.batch_size)
+            batch = int(status.split()[-1])
+            deleted += batch
+            self.rows_deleted += batch
+            if batch < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        return deleted
+
+    async def maintain_partitions(self) -> None:
+        """Создание секций вперёд и удаление полностью истёкших"""
+        today = datetime.utcnow().date()
+        async with self.pool.acquire(timeout=settings.postgres_pool_acquire_timeout) as conn:
+            if not await conn.fetchval('SELECT pg_try_advisory_lock($1)', PARTITION_LOCK_ID):
+                return
+            try:
+                for offset in range(settings.refresh_token_expire_days + 2):
+                    day = today + timedelta(days=offset)
+                    await self._create_partition(conn, day)
+                for row in await conn.fetch(LIST_PARTITIONS_QUERY):
+                    match = _PARTITION_NAME_PATTERN.match(row['relname'])
+                    # Секция дня day содержит токены, истекающие до начала следующего дня
+                    if match and datetime.strptime(match.group(1), '%Y%m%d').date() < today:
+                        await conn.execute(f'DROP TABLE IF EXISTS {row["relname"]}')
+                        self.partitions_dropped += 1
+                        logger.info('Dropped expired tokens partition %s', row['relname'])
+            finally:
+                await conn.execute('SELECT pg_advisory_unlock($1)', PARTITION_LOCK_ID)
+
+    @staticmethod
+    async def _create_partition(conn: asyncpg.Connection, day: date) -> None:
+        try:
+            await conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF tokens '
+                f"FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')"
+            )
+        except asyncpg.PostgresError as e:
+            # Например, в секции по умолчанию уже есть строки этого дня
+            logger.warning('Failed to create tokens partition for %s: %s', day, e)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'runs': self.runs,
+            'rows_deleted': self.rows_deleted,
+            'partitions_dropped': self.partitions_dropped,
+            'failed_runs': self.failed_runs,
+            'last_run_seconds': self.last_run_seconds,
+        }
+
+    async def _run(self) -> None:
+        # Разносим проходы воркеров во времени
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                deleted = await self.sweep()
+                if deleted:
+                    logger.info('Deleted %d expired refresh tokens', deleted)
+            except (asyncpg.PostgresError, OSError, asyncio.TimeoutError) as e:
+                self.failed_runs += 1
+                logger.warning('Expired tokens sweep failed: %s', e)
+            await asyncio.sleep(self.interval)
+
+
+token_sweeper: Optional[TokenSweeper] = None
+
+
+def start_token_sweeper(pool: asyncpg.Pool) -> TokenSweeper:
+    global token_sweeper
+    if token_sweeper is None:
+        token_sweeper = TokenSweeper(
+            pool,
+            interval=settings.token_sweeper_interval,
+            batch_size=settings.token_sweeper_batch_size,
+            batch_pause=settings.token_sweeper_batch_pause,
+            partitioned=settings.tokens_partitioning_enabled,
+        )
+        token_sweeper.start()
+    return token_sweeper
+
+
+async def stop_token_sweeper() -> None:
+    global token_sweeper
+    if token_sweeper is not None:
+        await token_sweeper.stop()
+        token_sweeper = None
@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import logging
+from datetime import datetime
+from typing import AsyncGenerator, Optional
+from uuid import UUID
+
+import asyncpg
+
+import app.db as db
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import db_query_duration
+
+logger = logging.getLogger(__name__)
+
+_flush_timer = db_query_duration.labels('save_refresh_token_batch')
+
+
+class RefreshTokenWriter:
+    """Отложенная пакетная запись refresh-токенов (write-behind).
+
+    Логин кладёт токен в буфер и сразу отвечает, фоновая задача сбрасывает
+    буфер в Postgres одним executemany не реже раза в flush_interval или
+    сразу при накоплении max_batch записей. Для каждого пользователя в буфере
+    хранится только последний токен. Пока токен не записан, чтение и удаление
+    учитывают буфер, так что логаут сразу после логина работает корректно.
+
+    Если пакет отвергнут (например, save_refresh_token поднял исключение для
+    одной строки), строки пишутся по одной; строка, не записавшаяся
+    max_attempts раз, отбрасывается с ошибкой в логе. В буфере не больше
+    max_pending пользователей: при переполнении логин ждёт сброса не дольше
+    postgres_pool_acquire_timeout и получает 503.
+
+    Ограничение: удаление учитывает только буфер своего процесса. Логаут,
+    обработанный другим воркером, пока токен ещё в буфере этого, будет
+    перезаписан следующим сбросом — окно не больше flush_interval, а при
+    сбоях бд — до успешного сброса."""
+
+    def __init__(self, pool: asyncpg.Pool, query: str, max_batch: int, flush_interval: float,
+                 max_pending: int, max_attempts: int):
+        self.pool = pool
+        self.query = query
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: dict[str, tuple[UUID, str, datetime]] = {}
+        self._inflight: dict[str, tuple[UUID, str, datetime]] = {}
+        # Неудачные попытки записи строк, вернувшихся в буфер
+        self._attempts: dict[str, int] = {}
+        self._flushed = asyncio.Event()
+        self._flushed.set()
+        self._batch_full = asyncio.Event()
+        # Выставляется после каждого сброса: его ждут логины при переполненном буфере
+        self._drained = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.rejected_saves = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой задачи и запись всего, что осталось в буфере"""
+        self._stopping = True
+        self._batch_full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def save(self, user_id: UUID, refresh_token: str, expires_at: datetime) -> None:
+        key = str(user_id)
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self._batch_full.set()
+            try:
+                async with asyncio.timeout(settings.postgres_pool_acquire_timeout):
+                    while len(self._pending) >= self.max_pending:
+                        self._drained.clear()
+                        await self._drained.wait()
+            except TimeoutError:
+                self.rejected_saves += 1
+                raise resilience.BackendUnavailable('postgres', 'write_behind_full')
+        self._pending[key] = (user_id, refresh_token, expires_at)
+        self._attempts.pop(key, None)
+        if len(self._pending) >= self.max_batch:
+            self._batch_full.set()
+
+    def get_pending(self, user_id: str) -> Optional[str]:
+        """Ещё не записанный в бд токен пользователя"""
+        row = self._pending.get(user_id) or self._inflight.get(user_id)
+        return row[1] if row else None
+
+    async def discard(self, user_id: str) -> None:
+        """Удаление токена пользователя из буфера. Если токен уже записывается,
+        дожидаемся окончания записи, чтобы следующий DELETE её не опередил"""
+        self._pending.pop(user_id, None)
+        self._attempts.pop(user_id, None)
+        if user_id in self._inflight:
+            await self._flushed.wait()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        self._inflight, self._pending = self._pending, {}
+        self._flushed.clear()
+        try:
+            async with self.pool.acquire(timeout=settings.postgres_pool_acquire_timeout) as conn:
+                try:
+                    with _flush_timer.time():
+                        # executemany атомарен: при ошибке не записана ни одна строка
+                        await conn.executemany(self.query, list(self._inflight.values()))
+                    self.rows_written += len(self._inflight)
+                    for key in self._inflight:
+                        self._attempts.pop(key, None)
+                except asyncpg.PostgresConnectionError:
+                    raise
+                except asyncpg.PostgresError as e:
+                    logger.warning('Batch of %d refresh tokens rejected, writing rows one by one: %s',
+                                   len(self._inflight), e)
+                    await self._write_rows(conn)
+            self.flushes += 1
+        except Exception as e:
+            # Бд недоступна: не теряем токены, возвращаем в буфер всё, что не
+            # перезаписано новым логином
+            self.failed_flushes += 1
+            logger.error('Failed to flush %d refresh tokens: %s', len(self._inflight), e)
+            for key, row in self._inflight.items():
+                self._pending.setdefault(key, row)
+        finally:
+            self._inflight = {}
+            self._flushed.set()
+            self._drained.set()
+
+    async def _write_rows(self, conn: asyncpg.Connection) -> None:
+        """Запись строк по одной после отвергнутого пакета. Записанные строки
+        убираются из _inflight, чтобы при обрыве соединения вернуть в буфер
+        только оставшиеся"""
+        for key, row in list(self._inflight.items()):
+            try:
+                await conn.execute(self.query, *row)
+            except asyncpg.PostgresConnectionError:
+                raise
+            except asyncpg.PostgresError as e:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self.dropped_rows += 1
+                    self._attempts.pop(key, None)
+                    logger.error('Dropping refresh token of user %s after %d failed writes: %s', key, attempts, e)
+                elif key not in self._pending:
+                    self._attempts[key] = attempts
+                    self._pending[key] = row
+            else:
+                self.rows_written += 1
+                self._attempts.pop(key, None)
+            del self._inflight[key]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'failed_flushes': self.failed_flushes,
+            'dropped_rows': self.dropped_rows,
+            'rejected_saves': self.rejected_saves,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            await self.flush()
+
+
+refresh_token_writer: Optional[RefreshTokenWriter] = None
+
+
+def start_refresh_token_writer(pool: asyncpg.Pool, query: str) -> RefreshTokenWriter:
+    global refresh_token_writer
+    if refresh_token_writer is None:
+        refresh_token_writer = RefreshTokenWriter(
+            pool,
+            query,
+            max_batch=settings.refresh_token_write_behind_max_batch,
+            flush_interval=settings.refresh_token_write_behind_flush_interval,
+            max_pending=settings.refresh_token_write_behind_max_pending,
+            max_attempts=settings.refresh_token_write_behind_max_attempts,
+        )
+        refresh_token_writer.start()
+    return refresh_token_writer
+
+
+async def stop_refresh_token_writer() -> None:
+    global refresh_token_writer
+    if refresh_token_writer is not None:
+        await refresh_token_writer.stop()
+        refresh_token_writer = None
+
+
+async def get_refresh_token_db() -> AsyncGenerator[Optional[asyncpg.Connection], None]:
+    """Dependency логина: соединение для записи refresh-токена. В режиме
+    write-behind токен уходит в буфер, и запросу соединение из пула не нужно"""
+    if refresh_token_writer is not None:
+        yield None
+        return
+    async with contextlib.aclosing(db.get_db()) as connections:
+        async for connection in connections:
+            yield connection
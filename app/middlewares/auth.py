@@ -1,6 +1,5 @@
 import logging
-import httpx
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from typing import Optional
 
 import jwt
@@ -8,60 +7,47 @@ from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 
 from app.core.config import settings
+from app.core.keys import keyring
 from app.db import get_db
-from app.db.functions import get_refresh_token_for_user
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
+from app.middlewares.token_cache import token_cache
+from app.services.revocation import revocation_list
+from app.services.tokens import (create_access_token, get_user_id_from_expired_token, refresh_access_token,
+                                 refresh_access_token_remote)
 
+logger = logging.getLogger(__name__)
 
-def create_access_token(user_id: str) -> str:
-    expiration = datetime.now(timezone.utc) + timedelta(minutes=settings.access_token_expire_minutes)
-    data = {"sub": user_id, "exp": expiration}
-    print(f"Token created with expires_at: {data}")
-    return jwt.encode(data, settings.jwt_secret_key, algorithm='HS256')
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
 
 async def decode_access_token(token: str, db=Depends(get_db)):
+    # Уже проверенный токен берём из кеша без повторной проверки подписи
+    payload = token_cache.get(token)
+    if payload is not None:
+        ensure_not_revoked(payload)
+        return payload
+
     try:
         # Декодирование токена с проверкой подписи
-        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=['HS256'])
-        print(f"Decoded payload: {payload}")  # Логируем декодированный payload
+        payload = keyring.decode(token)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Access token decoded', extra={'sub': payload.get('sub'), 'jti': payload.get('jti')})
         if payload.get("exp") < datetime.now(timezone.utc).timestamp():
             raise jwt.ExpiredSignatureError
+        ensure_not_revoked(payload)
+        token_cache.set(token, payload)
         return payload
 
     except jwt.ExpiredSignatureError:
-        try:
-            # Если токен просрочен, пытаемся извлечь id без проверки подписи
-            payload = jwt.decode(token, options={"verify_signature": False})
-            print(f"Decoded payload without signature verification: {payload}")  # Логируем
-            user_id = payload.get("sub")
-            if not user_id:
-                raise HTTPException(status_code=401, detail="Invalid token structure")
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid token structure")
-
-        # Попытка получить refresh token для пользователя
-        refresh_token = await get_refresh_token_for_user(db, user_id)
-        if not refresh_token:
-            raise HTTPException(status_code=401, detail="No refresh token found for user")
-
-        # Запрос на обновление access token
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.auth_service_url}/refresh_token",
-                json={"refresh_token": refresh_token}
-            )
-
-        if response.status_code == 200:
-            new_access_token = response.json().get("access_token")
-            if new_access_token:
-                payload = jwt.decode(new_access_token, settings.jwt_secret_key, algorithms=['HS256'])
-                return payload
-            else:
-                raise HTTPException(status_code=500, detail="Failed to retrieve new access token")
+        # Если токен просрочен, извлекаем id без проверки подписи
+        user_id = get_user_id_from_expired_token(token)
+
+        # Новый токен выпускаем в этом же процессе; во внешний сервис
+        # ходим, только если он явно задан в настройках
+        if settings.auth_service_url:
+            new_access_token = await refresh_access_token_remote(token)
         else:
-            raise HTTPException(status_code=401, detail="Failed to refresh access token")
+            new_access_token = await refresh_access_token(db, user_id)
+        return keyring.decode(new_access_token)
 
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -77,13 +63,27 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_d
     return user_id
 
 
+def ensure_not_revoked(payload: dict):
+    """Проверка по локальному списку отзывов, без сетевых запросов"""
+    if revocation_list.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+
 def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=['HS256'])
+    payload = token_cache.get(token)
+    if payload is not None:
+        ensure_not_revoked(payload)
         return payload
+
+    try:
+        payload = keyring.decode(token)
     
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+    ensure_not_revoked(payload)
+    token_cache.set(token, payload)
+    return payload
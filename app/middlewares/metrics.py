@@ -0,0 +1,74 @@
+import time
+from typing import Any
+
+from starlette.routing import Match
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+request_duration = Histogram('auth_http_request_duration_seconds', 'HTTP request latency by route', ('route',))
+requests_in_flight = Gauge('auth_http_requests_in_flight', 'HTTP requests being processed by route', ('route',))
+requests_total = Counter('auth_http_requests_total', 'HTTP responses by route and status', ('route', 'status'))
+
+UNMATCHED_ROUTE = '<unmatched>'
+# Предел кеша путь -> маршрут, чтобы пути с параметрами не раздували его
+ROUTE_CACHE_SIZE = 1024
+
+
+class MetricsMiddleware:
+    """ASGI middleware с гистограммой задержек и счётчиком запросов в обработке по маршрутам.
+
+    Маршрут определяется по шаблону пути, а не по самому пути, поэтому число
+    наборов меток ограничено числом маршрутов. Дочерние метрики для маршрута
+    и для пары маршрут–статус создаются при первом запросе и дальше берутся
+    из словаря."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_metrics: dict[str, tuple] = {}
+        self._status_counters: dict[tuple[str, int], Any] = {}
+        self._route_cache: dict[tuple[str, str], str] = {}
+
+    def _resolve_route(self, scope) -> str:
+        cache_key = (scope['method'], scope['path'])
+        route_path = self._route_cache.get(cache_key)
+        if route_path is not None:
+            return route_path
+        route_path = UNMATCHED_ROUTE
+        for route in scope['app'].router.routes:
+            match, _ = route.matches(scope)
+            if match is Match.FULL:
+                route_path = route.path
+                break
+        if len(self._route_cache) < ROUTE_CACHE_SIZE:
+            self._route_cache[cache_key] = route_path
+        return route_path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve_route(scope)
+        metrics = self._route_metrics.get(route)
+        if metrics is None:
+            metrics = self._route_metrics[route] = (request_duration.labels(route), requests_in_flight.labels(route))
+        duration, in_flight = metrics
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration.observe(time.perf_counter() - started)
+            in_flight.dec()
+            counter = self._status_counters.get((route, status_code))
+            if counter is None:
+                counter = self._status_counters[route, status_code] = requests_total.labels(route, str(status_code))
+            counter.inc()
@@ -0,0 +1,162 @@
+import asyncio
+import cProfile
+import logging
+import marshal
+import os
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logger import request_id_var
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b'x-profile'
+PROFILE_ID_HEADER = b'x-profile-id'
+# Имена файлов профилей: время с миллисекундами, pid, идентификатор запроса.
+# Сортировка по имени совпадает с порядком записи
+_PROFILE_NAME = re.compile(r'^\d{8}T\d{9}-\d+-[A-Za-z0-9._-]{1,128}\.(html|prof)$')
+
+
+def is_profiling_admin(token: Optional[str]) -> bool:
+    admin_token = settings.profiling_admin_token
+    return bool(admin_token and token) and secrets.compare_digest(token, admin_token)
+
+
+class ProfileRing:
+    """Каталог с последними max_files профилями: при записи нового удаляются самые старые"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def path(self, name: str) -> Optional[Path]:
+        """Путь к профилю по имени из списка; чужие имена (в том числе с ../) не принимаются"""
+        if not _PROFILE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+    def list(self) -> list[dict]:
+        if not self.directory.is_dir():
+            return []
+        profiles = []
+        for path in self.directory.iterdir():
+            if _PROFILE_NAME.match(path.name):
+                stat = path.stat()
+                profiles.append({'name': path.name, 'size': stat.st_size, 'created_at': stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile['name'], reverse=True)
+
+    def write(self, name: str, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f'.{name}.tmp'
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.directory / name)
+        self._trim()
+
+    def _trim(self) -> None:
+        names = sorted(path.name for path in self.directory.iterdir() if _PROFILE_NAME.match(path.name))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            (self.directory / name).unlink(missing_ok=True)
+
+
+profile_ring = ProfileRing(settings.profiling_dir, settings.profiling_max_files)
+
+
+class _SamplingProfile:
+    """pyinstrument в асинхронном режиме: время в await у других задач
+    не приписывается запросу"""
+    suffix = 'html'
+
+    def __init__(self):
+        self._profiler = Profiler(interval=settings.profiling_interval, async_mode='enabled')
+
+    def start(self) -> None:
+        self._profiler.start()
+
+    def stop(self) -> None:
+        self._profiler.stop()
+
+    def render(self) -> bytes:
+        return self._profiler.output_html().encode()
+
+
+class _TracingProfile:
+    """cProfile, если pyinstrument не установлен: в профиль попадает всё, что
+    выполнялось в цикле событий за время запроса, включая чужие запросы"""
+    suffix = 'prof'
+
+    def __init__(self):
+        self._profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        self._profiler.disable()
+
+    def render(self) -> bytes:
+        self._profiler.create_stats()
+        # Формат pstats.Stats, как у Profile.dump_stats
+        return marshal.dumps(self._profiler.stats)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware, профилирующее отдельные запросы.
+
+    Запрос профилируется, если в заголовке X-Profile передан
+    profiling_admin_token или он попал в долю profiling_sample_rate запросов
+    к API. Одновременно профилируется один запрос на процесс. Профиль
+    сохраняется в profile_ring после отправки ответа, его имя возвращается
+    в заголовке X-Profile-Id."""
+
+    def __init__(self, app):
+        self.app = app
+        self.api_prefix = f'/api/v1/{settings.service_name}'
+        self._active = False
+
+    def _selected(self, scope) -> bool:
+        for name, value in scope['headers']:
+            if name == PROFILE_HEADER:
+                return is_profiling_admin(value.decode('latin-1'))
+        rate = settings.profiling_sample_rate
+        return rate > 0 and scope['path'].startswith(self.api_prefix) and random.random() < rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self._active or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Идентификатор из RequestIdMiddleware уже проверен на допустимые символы
+        request_id = request_id_var.get() or secrets.token_hex(8)
+        profile = _SamplingProfile() if Profiler is not None else _TracingProfile()
+        now = time.time()
+        timestamp = f'{time.strftime("%Y%m%dT%H%M%S", time.gmtime(now))}{int(now * 1000) % 1000:03d}'
+        name = f'{timestamp}-{os.getpid()}-{request_id}.{profile.suffix}'
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), (PROFILE_ID_HEADER, name.encode())]
+            await send(message)
+
+        self._active = True
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            self._active = False
+        try:
+            # Отрисовка и запись профиля не занимают цикл событий
+            await asyncio.to_thread(lambda: profile_ring.write(name, profile.render()))
+        except OSError as e:
+            logger.warning('Failed to save request profile %s: %s', name, e)
@@ -0,0 +1,131 @@
+import logging
+import math
+import secrets
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import redis_command_duration
+from app.db.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = 'rate_limit:{route}:{dimension}:{value}:{window}'
+
+# Скользящее окно по журналу запросов в sorted set: все ключи проверяются
+# и, если ни один лимит не превышен, пополняются за один атомарный вызов.
+# Возвращает 0 или число миллисекунд до освобождения места в окне
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[i * 2 + 1])
+    local limit = tonumber(ARGV[i * 2 + 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local wait = tonumber(oldest[2]) + window - now
+        if wait > retry_after then
+            retry_after = wait
+        end
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, member)
+    redis.call('PEXPIRE', key, ARGV[i * 2 + 1])
+end
+return 0
+"""
+
+
+_sliding_window_script = None
+_rate_limit_timer = redis_command_duration.labels('rate_limit')
+
+
+def _get_sliding_window_script(redis: Redis):
+    global _sliding_window_script
+    if _sliding_window_script is None:
+        _sliding_window_script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+    return _sliding_window_script
+
+
+def parse_rules(rules: str) -> list[tuple[int, int]]:
+    """'3/60,10/3600' -> [(3, 60000), (10, 3600000)]: лимит и окно в миллисекундах"""
+    parsed = []
+    for rule in rules.split(','):
+        limit, _, seconds = rule.strip().partition('/')
+        parsed.append((int(limit), int(float(seconds) * 1000)))
+    return parsed
+
+
+def rate_limit(route: str):
+    """Dependency с лимитами из settings.rate_limits[route] по IP клиента и email из запроса"""
+    rules = {dimension: parse_rules(value) for dimension, value in settings.rate_limits.get(route, {}).items()}
+
+    async def check_rate_limit(request: Request, redis: Redis = Depends(get_redis)):
+        if not settings.rate_limit_enabled or not rules:
+            return
+        values = {
+            'ip': request.client.host if request.client else None,
+            'email': (request.query_params.get('email') or '').lower() or None,
+        }
+        keys, args = [], [int(time.time() * 1000), secrets.token_hex(8)]
+        for dimension, dimension_rules in rules.items():
+            if not values.get(dimension):
+                continue
+            for limit, window in dimension_rules:
+                keys.append(RATE_LIMIT_KEY.format(route=route, dimension=dimension, value=values[dimension], window=window))
+                args.extend((window, limit))
+        if not keys:
+            return
+
+        try:
+            async with resilience.redis.guard():
+                with _rate_limit_timer.time():
+                    retry_after_ms = await _get_sliding_window_script(redis)(keys=keys, args=args, client=redis)
+        except (RedisError, resilience.BackendUnavailable) as e:
+            # Лимиты — защита, а не условие работы: при недоступном Redis пропускаем запрос
+            logger.warning('Rate limit check failed for %s: %s', route, e)
+            return
+        if retry_after_ms:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='Too many requests',
+                headers={'Retry-After': str(max(1, math.ceil(retry_after_ms / 1000)))}
+            )
+
+    return check_rate_limit
+
+
+class ConcurrencyLimiter:
+    """Общий предел одновременно выполняемых запросов: лишние сразу получают 503"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def __call__(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Server is busy, try again later',
+                headers={'Retry-After': '1'}
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+email_endpoints_limiter = ConcurrencyLimiter(settings.email_endpoints_max_concurrency)
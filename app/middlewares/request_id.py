@@ -0,0 +1,43 @@
+import re
+from uuid import uuid4
+
+from app.core.logger import request_id_var
+
+REQUEST_ID_HEADER = b'x-request-id'
+# Принимаем идентификатор от балансировщика, только если он похож на идентификатор
+_VALID_REQUEST_ID = re.compile(rb'^[A-Za-z0-9._-]{1,128}$')
+
+
+class RequestIdMiddleware:
+    """ASGI middleware, задающее идентификатор запроса для логов.
+
+    Берёт X-Request-ID из запроса или создаёт новый, кладёт его в request_id_var
+    на время обработки и возвращает клиенту в заголовке ответа."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope['headers']:
+            if name == REQUEST_ID_HEADER:
+                if _VALID_REQUEST_ID.match(value):
+                    request_id = value
+                break
+        if request_id is None:
+            request_id = uuid4().hex.encode()
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), (REQUEST_ID_HEADER, request_id)]
+            await send(message)
+
+        token = request_id_var.set(request_id.decode())
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,125 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.core.config import settings
+
+
+class TokenCache:
+    """LRU-кеш проверенных access-токенов, ограниченный по числу записей и памяти.
+
+    Ключ записи — SHA-256 от токена, так что сами токены в памяти не хранятся.
+    Запись живёт не дольше exp токена и не дольше ttl кеша. Возвращаемый payload
+    общий для всех обращений и не должен изменяться вызывающим кодом."""
+
+    # Примерный объём записи без учёта токена: ключ, кортеж, словарь payload
+    ENTRY_OVERHEAD = 400
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int, enabled: bool = True):
+        self.enabled = enabled and max_entries > 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # digest -> (момент истечения, payload, оценка размера, user_id)
+        self._entries: OrderedDict[bytes, tuple[float, dict[str, Any], int, Optional[str]]] = OrderedDict()
+        self._by_user: dict[str, set[bytes]] = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict[str, Any]]:
+        """Возвращает payload из кеша или None, если токена нет или запись истекла"""
+        if not self.enabled:
+            return None
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, token: str, payload: dict[str, Any]) -> None:
+        """Кладёт проверенный payload в кеш, вытесняя самые старые записи при переполнении"""
+        if not self.enabled:
+            return
+        exp = payload.get('exp')
+        if exp is None:
+            return
+        now = time.time()
+        expires_at = min(float(exp), now + self.ttl)
+        if expires_at <= now:
+            return
+
+        key = self._digest(token)
+        if key in self._entries:
+            self._remove(key)
+        user_id = payload.get('sub')
+        size = len(token) + self.ENTRY_OVERHEAD
+        self._entries[key] = (expires_at, payload, size, user_id)
+        self.size_bytes += size
+        if user_id is not None:
+            self._by_user.setdefault(user_id, set()).add(key)
+
+        while self._entries and (len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, token: str) -> None:
+        """Удаляет запись для конкретного токена"""
+        key = self._digest(token)
+        if key in self._entries:
+            self._remove(key)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Удаляет все записи пользователя, например при логауте"""
+        for key in self._by_user.pop(user_id, ()):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'size_bytes': self.size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _remove(self, key: bytes) -> None:
+        _, _, size, user_id = self._entries.pop(key)
+        self.size_bytes -= size
+        if user_id is not None:
+            keys = self._by_user.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[user_id]
+
+
+token_cache = TokenCache(
+    max_entries=settings.token_cache_max_entries,
+    max_bytes=settings.token_cache_max_bytes,
+    ttl=settings.token_cache_ttl_seconds,
+    enabled=settings.token_cache_enabled,
+)
@@ -12,4 +12,11 @@ class Token(BaseModel):
     created_at: datetime
 
 class LoginRequest(BaseModel):
-    user_id: UUID
\ No newline at end of file
+    user_id: UUID
+
+class VerifyTokensRequest(BaseModel):
+    tokens: list[str]
+
+class VerifyCodeRequest(BaseModel):
+    email: str
+    code: str
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+import aiosmtplib
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import smtp_send_duration
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'email_outbox'
+GROUP_NAME = 'email_outbox_workers'
+DELAYED_KEY = 'email_outbox:delayed'
+DEAD_KEY = 'email_outbox:dead'
+
+_smtp_send_timer = smtp_send_duration.labels('outbox')
+
+# Предел паузы воркера после ошибок подряд, с
+WORKER_MAX_BACKOFF = 30.0
+
+# Атомарный перенос заданий, у которых подошло время повтора, обратно в поток
+MOVE_DUE_JOBS_SCRIPT = """
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(jobs) do
+    redis.call('ZREM', KEYS[1], job)
+    local fields = {}
+    for name, value in pairs(cjson.decode(job)) do
+        table.insert(fields, name)
+        table.insert(fields, tostring(value))
+    end
+    redis.call('XADD', KEYS[2], '*', unpack(fields))
+end
+return #jobs
+"""
+
+class OutgoingEmail(NamedTuple):
+    sender: str
+    recipients: list[str]
+    content: bytes
+
+
+BuildMessage = Callable[[str, str, dict[str, Any]], OutgoingEmail]
+
+
+async def enqueue_email(redis: Redis, kind: str, to_email: str, **params: Any) -> str:
+    """Сохранение письма в outbox; отправкой займутся фоновые воркеры"""
+    return await redis.xadd(STREAM_KEY, {
+        'kind': kind,
+        'to': to_email,
+        'params': json.dumps(params),
+        'attempts': 0,
+    })
+
+
+class SMTPPool:
+    """Небольшой пул авторизованных SMTP-соединений.
+
+    TCP, STARTTLS и AUTH выполняются один раз на соединение, дальше оно
+    переиспользуется для следующих писем, пока не простаивает дольше
+    smtp_idle_timeout (серверы обычно закрывают такие соединения сами)."""
+
+    def __init__(self, size: int):
+        self._semaphore = asyncio.Semaphore(size)
+        self._idle: list[tuple[float, aiosmtplib.SMTP]] = []
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                released_at, smtp = self._idle.pop()
+                if smtp.is_connected and time.monotonic() - released_at < settings.smtp_idle_timeout:
+                    return smtp
+                smtp.close()
+            return await self._connect()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def release(self, smtp: aiosmtplib.SMTP, reuse: bool = True) -> None:
+        if reuse and smtp.is_connected:
+            self._idle.append((time.monotonic(), smtp))
+        else:
+            smtp.close()
+        self._semaphore.release()
+
+    async def close(self) -> None:
+        while self._idle:
+            _, smtp = self._idle.pop()
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+
+    @staticmethod
+    async def _connect() -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.smtp_host,
+            port=settings.smtp_port,
+            start_tls=settings.smtp_start_tls,
+            username=settings.smtp_user,
+            password=settings.smtp_password,
+            timeout=settings.smtp_timeout,
+        )
+        await smtp.connect()
+        return smtp
+
+
+class EmailOutbox:
+    """Фоновая отправка писем из Redis Stream.
+
+    Каждый воркер читает задания пачками через группу потребителей,
+    отправляет их по соединению из пула SMTP и подтверждает (XACK).
+    Неудачные отправки откладываются в sorted set с экспоненциальной
+    задержкой, после email_outbox_max_attempts попыток задание уходит
+    в список DEAD_KEY. Задания упавших воркеров забираются через XAUTOCLAIM."""
+
+    def __init__(self, redis: Redis, build_message: BuildMessage, smtp_pool: Optional[SMTPPool] = None):
+        self.redis = redis
+        self.build_message = build_message
+        self.smtp_pool = smtp_pool or SMTPPool(settings.smtp_pool_size)
+        self.consumer_prefix = f'{socket.gethostname()}-{os.getpid()}'
+        self._move_due_jobs = redis.register_script(MOVE_DUE_JOBS_SCRIPT)
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.send_latency_count = 0
+        self.send_latency_sum = 0.0
+        self.send_latency_max = 0.0
+
+    async def start(self) -> None:
+        try:
+            await self.redis.xgroup_create(STREAM_KEY, GROUP_NAME, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._run_worker(f'{self.consumer_prefix}-{i}'))
+            for i in range(settings.email_outbox_workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._run_scheduler()))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Даёт воркерам дослать текущие пачки, затем закрывает соединения SMTP"""
+        self._stopping = True
+        pending = set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        await self.smtp_pool.close()
+
+    async def queue_depth(self) -> dict[str, int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xlen(STREAM_KEY)
+            pipe.zcard(DELAYED_KEY)
+            pipe.llen(DEAD_KEY)
+            queued, delayed, dead = await pipe.execute()
+        return {'queued': queued, 'delayed': delayed, 'dead': dead}
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'dead': self.dead,
+            'send_latency_count': self.send_latency_count,
+            'send_latency_sum': self.send_latency_sum,
+            'send_latency_max': self.send_latency_max,
+        }
+
+    async def _run_worker(self, consumer: str) -> None:
+        errors = 0
+        while not self._stopping:
+            try:
+                entries = await self._read_batch(consumer)
+                if entries:
+                    await self._send_batch(entries)
+                errors = 0
+            except RedisError as e:
+                errors += 1
+                logger.warning('Email outbox worker %s error: %s', consumer, e)
+                await asyncio.sleep(self._worker_backoff(errors))
+            except Exception:
+                # Неожиданная ошибка не должна останавливать воркер: задания
+                # пачки без XACK потом заберёт XAUTOCLAIM
+                errors += 1
+                logger.exception('Email outbox worker %s failed', consumer)
+                await asyncio.sleep(self._worker_backoff(errors))
+
+    async def _read_batch(self, consumer: str) -> list[tuple[str, dict[str, str]]]:
+        response = await self.redis.xreadgroup(
+            GROUP_NAME, consumer, {STREAM_KEY: '>'},
+            count=settings.email_outbox_batch_size,
+            block=1000,
+        )
+        if response:
+            return response[0][1]
+        # Новых заданий нет: подбираем зависшие у упавших воркеров
+        claimed = await self.redis.xautoclaim(
+            STREAM_KEY, GROUP_NAME, consumer,
+            min_idle_time=settings.email_outbox_claim_idle_ms,
+            count=settings.email_outbox_batch_size,
+        )
+        return [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+
+    async def _send_batch(self, entries: list[tuple[str, dict[str, str]]]) -> None:
+        sent, retry, dead = [], [], []
+        smtp: Optional[aiosmtplib.SMTP] = None
+        smtp_unavailable = False
+        try:
+            for entry_id, fields in entries:
+                try:
+                    email = self.build_message(fields['kind'], fields['to'], json.loads(fields['params']))
+                except Exception as e:
+                    logger.error('Email outbox job %s is malformed: %s', entry_id, e)
+                    dead.append((entry_id, fields))
+                    continue
+
+                if smtp is None and not smtp_unavailable:
+                    try:
+                        async with resilience.smtp.guard():
+                            smtp = await self.smtp_pool.acquire()
+                    except (aiosmtplib.SMTPException, OSError, resilience.BackendUnavailable) as e:
+                        logger.warning('Failed to connect to SMTP server: %s', e)
+                        smtp_unavailable = True
+                if smtp is None:
+                    retry.append((entry_id, fields))
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    async with resilience.smtp.guard():
+                        await smtp.sendmail(email.sender, email.recipients, email.content)
+                except aiosmtplib.SMTPRecipientsRefused:
+                    dead.append((entry_id, fields))
+                except aiosmtplib.SMTPResponseException as e:
+                    # 5xx — постоянная ошибка, повтор не поможет
+                    (dead if e.code >= 500 else retry).append((entry_id, fields))
+                except (aiosmtplib.SMTPException, OSError, resilience.BackendUnavailable):
+                    retry.append((entry_id, fields))
+                    self.smtp_pool.release(smtp, reuse=False)
+                    smtp = None
+                else:
+                    elapsed = time.perf_counter() - started
+                    self._observe_latency(elapsed)
+                    _smtp_send_timer.observe(elapsed)
+                    sent.append(entry_id)
+        finally:
+            if smtp is not None:
+                self.smtp_pool.release(smtp)
+            await self._complete(sent, retry, dead)
+
+    async def _complete(self, sent: list[str], retry: list[tuple[str, dict[str, str]]],
+                        dead: list[tuple[str, dict[str, str]]]) -> None:
+        """Подтверждение пачки одним пайплайном: отправленные удаляются,
+        неудачные откладываются на повтор или уходят в dead letter"""
+        entry_ids = sent + [entry_id for entry_id, _ in retry] + [entry_id for entry_id, _ in dead]
+        if not entry_ids:
+            return
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for entry_id, fields in retry:
+                attempts = int(fields.get('attempts', 0)) + 1
+                job = json.dumps({**fields, 'attempts': attempts, 'origin': entry_id})
+                if attempts >= settings.email_outbox_max_attempts:
+                    pipe.lpush(DEAD_KEY, job)
+                    self.dead += 1
+                else:
+                    pipe.zadd(DELAYED_KEY, {job: now + self._backoff(attempts)})
+                    self.retried += 1
+            for entry_id, fields in dead:
+                pipe.lpush(DEAD_KEY, json.dumps({**fields, 'origin': entry_id}))
+                self.dead += 1
+            pipe.xack(STREAM_KEY, GROUP_NAME, *entry_ids)
+            pipe.xdel(STREAM_KEY, *entry_ids)
+            await pipe.execute()
+        self.sent += len(sent)
+
+    async def _run_scheduler(self) -> None:
+        while not self._stopping:
+            try:
+                await self._move_due_jobs(keys=[DELAYED_KEY, STREAM_KEY], args=[time.time(), 100])
+            except RedisError as e:
+                logger.warning('Email outbox scheduler error: %s', e)
+            except Exception:
+                logger.exception('Email outbox scheduler failed')
+            await asyncio.sleep(1)
+
+    @staticmethod
+    def _worker_backoff(errors: int) -> float:
+        return min(2 ** (errors - 1), WORKER_MAX_BACKOFF)
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        delay = min(settings.email_outbox_retry_base_delay * 2 ** (attempts - 1), settings.email_outbox_retry_max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _observe_latency(self, seconds: float) -> None:
+        self.send_latency_count += 1
+        self.send_latency_sum += seconds
+        self.send_latency_max = max(self.send_latency_max, seconds)
+
+
+outbox: Optional[EmailOutbox] = None
+
+
+async def start_outbox(redis: Redis, build_message: BuildMessage) -> EmailOutbox:
+    global outbox
+    if outbox is None:
+        email_outbox = EmailOutbox(redis, build_message)
+        await email_outbox.start()
+        outbox = email_outbox
+    return outbox
+
+
+async def stop_outbox() -> None:
+    global outbox
+    if outbox is not None:
+        await outbox.stop()
+        outbox = None
@@ -0,0 +1,18 @@
+from app.core import resilience
+from app.core.metrics import redis_command_duration
+from app.db.redis_shards import email_tag, get_redis_for_keys
+
+# В фигурных скобках — hash tag от email, как у ключей кодов подтверждения
+PASSWORD_RESET_TOKEN_KEY = 'password_reset_token:{{{}}}'
+PASSWORD_RESET_TOKEN_TTL = 900
+
+_save_reset_token_timer = redis_command_duration.labels('save_password_reset_token')
+
+
+async def save_password_reset_token(email: str, token: str) -> None:
+    key = PASSWORD_RESET_TOKEN_KEY.format(email_tag(email))
+    redis = await get_redis_for_keys(key)
+    async with resilience.redis.guard():
+        with _save_reset_token_timer.time():
+            await redis.setex(key, PASSWORD_RESET_TOKEN_TTL, token)
+
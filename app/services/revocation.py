@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Optional
+
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import redis_command_duration
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY = 'revoked_jti:{}'
+REVOKED_CHANNEL = 'revoked_jti'
+# Отозванные jti группируются по минуте истечения, чтобы чистить их целыми корзинами
+BUCKET_SECONDS = 60
+# Сколько ждать закрытия подписки при остановке, с
+PUBSUB_CLOSE_TIMEOUT = 2.0
+
+_revoke_timer = redis_command_duration.labels('revoke_token')
+
+
+class BloomFilter:
+    """Битовый фильтр Блума с двойным хешированием (Kirsch–Mitzenmacher)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _hashes(self, item: bytes) -> tuple[int, int]:
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item: bytes) -> None:
+        h1, h2 = self._hashes(item)
+        bits, size = self.bits, self.size
+        for _ in range(self.hash_count):
+            position = h1 % size
+            bits[position >> 3] |= 1 << (position & 7)
+            h1 += h2
+
+    def __contains__(self, item: bytes) -> bool:
+        h1, h2 = self._hashes(item)
+        bits, size = self.bits, self.size
+        for _ in range(self.hash_count):
+            position = h1 % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            h1 += h2
+        return True
+
+
+def _jti_key(jti: str) -> bytes:
+    """jti выдаются как uuid4().hex, в памяти храним их 16 байтами"""
+    try:
+        return bytes.fromhex(jti)
+    except ValueError:
+        return jti.encode()
+
+
+class RevocationList:
+    """Локальная копия списка отозванных access-токенов.
+
+    Проверка идёт сначала по фильтру Блума, который отвечает «точно не отозван»
+    для подавляющего большинства токенов, и только при срабатывании фильтра —
+    по точному множеству. Сети при проверке нет: список пополняется из Redis
+    при старте и через pub/sub."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._revoked: set[bytes] = set()
+        self._buckets: dict[int, set[bytes]] = {}
+        # Удалённые ключи остаются в фильтре и повышают долю ложных срабатываний
+        self.removed_since_rebuild = 0
+        self._added_during_rebuild: Optional[list[bytes]] = None
+        self.checks = 0
+        self.bloom_positives = 0
+        self.false_positives = 0
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def add(self, jti: str, exp: float) -> None:
+        key = _jti_key(jti)
+        if key in self._revoked:
+            return
+        self._revoked.add(key)
+        self._buckets.setdefault(int(exp) // BUCKET_SECONDS + 1, set()).add(key)
+        self._bloom.add(key)
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.append(key)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        self.checks += 1
+        key = _jti_key(jti)
+        if key not in self._bloom:
+            return False
+        self.bloom_positives += 1
+        if key in self._revoked:
+            return True
+        self.false_positives += 1
+        return False
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Удаляет отзывы уже истёкших токенов, возвращает число удалённых"""
+        current_bucket = int(now if now is not None else time.time()) // BUCKET_SECONDS
+        removed = 0
+        for bucket in [bucket for bucket in self._buckets if bucket <= current_bucket]:
+            keys = self._buckets.pop(bucket)
+            self._revoked.difference_update(keys)
+            removed += len(keys)
+        self.removed_since_rebuild += removed
+        return removed
+
+    def needs_rebuild(self) -> bool:
+        # Сравнение с ёмкостью текущего фильтра: после пересборки под выросший
+        # список он больше настроенной capacity, и повторная пересборка не нужна
+        capacity = self._bloom.capacity
+        return self.removed_since_rebuild > capacity // 10 or len(self._revoked) > capacity
+
+    async def rebuild_bloom(self) -> None:
+        """Пересборка фильтра без удалённых ключей. Сборка идёт в отдельном потоке,
+        ключи, добавленные за это время, докладываются в новый фильтр перед заменой"""
+        snapshot = list(self._revoked)
+        self._added_during_rebuild = []
+        try:
+            bloom = await asyncio.to_thread(self._build_bloom, snapshot)
+            for key in self._added_during_rebuild:
+                bloom.add(key)
+            self._bloom = bloom
+            self.removed_since_rebuild = 0
+        finally:
+            self._added_during_rebuild = None
+
+    def _build_bloom(self, keys: list[bytes]) -> BloomFilter:
+        bloom = BloomFilter(max(self.capacity, len(keys) * 2), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'revoked': len(self._revoked),
+            'checks': self.checks,
+            'bloom_positives': self.bloom_positives,
+            'false_positives': self.false_positives,
+            'bloom_bytes': len(self._bloom.bits),
+        }
+
+
+revocation_list = RevocationList(
+    capacity=settings.revocation_bloom_capacity,
+    error_rate=settings.revocation_bloom_error_rate,
+)
+
+
+async def revoke_token(redis: Redis, payload: dict[str, Any]) -> None:
+    """Отзыв access-токена до его exp: запись в Redis и рассылка остальным воркерам"""
+    jti = payload.get('jti')
+    exp = payload.get('exp')
+    if not jti or exp is None:
+        return
+    ttl = int(exp - time.time()) + 1
+    if ttl <= 0:
+        return
+    revocation_list.add(jti, exp)
+    async with resilience.redis.guard():
+        with _revoke_timer.time():
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.set(REVOKED_KEY.format(jti), int(exp), ex=ttl)
+                pipe.publish(REVOKED_CHANNEL, f'{jti}:{int(exp)}')
+                await pipe.execute()
+
+
+class RevocationSync:
+    """Фоновая синхронизация локального списка отзывов с Redis"""
+
+    def __init__(self, redis: Redis, revoked: RevocationList):
+        self.redis = redis
+        self.revoked = revoked
+        self._tasks: list[asyncio.Task] = []
+        self._pubsub: Optional[PubSub] = None
+
+    async def start(self) -> None:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Подписываемся до загрузки, чтобы не потерять отзывы, сделанные во время неё
+            await pubsub.subscribe(REVOKED_CHANNEL)
+            await self.load()
+        except BaseException:
+            await pubsub.aclose()
+            raise
+        self._pubsub = pubsub
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._prune()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Подписка закрывается после завершения задачи: отменённый get_message
+        # мог оставить за собой блокировку соединения, и закрытие внутри
+        # задачи ждало бы её без ограничения
+        if self._pubsub is not None:
+            try:
+                await asyncio.wait_for(self._pubsub.aclose(), PUBSUB_CLOSE_TIMEOUT)
+            except (asyncio.TimeoutError, RedisError, OSError) as e:
+                logger.warning('Failed to close revocation subscription: %s', e)
+            self._pubsub = None
+
+    async def load(self) -> None:
+        """Полная загрузка отозванных jti из Redis"""
+        batch: list[str] = []
+        async for key in self.redis.scan_iter(match=REVOKED_KEY.format('*'), count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                await self._load_batch(batch)
+                batch = []
+        if batch:
+            await self._load_batch(batch)
+
+    async def _load_batch(self, keys: list[str]) -> None:
+        prefix_length = len(REVOKED_KEY.format(''))
+        for key, exp in zip(keys, await self.redis.mget(keys)):
+            if exp is not None:
+                self.revoked.add(key[prefix_length:], float(exp))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    self._apply(message['data'])
+            except (RedisError, OSError) as e:
+                # Пока подписка была разорвана, сообщения могли потеряться: перечитываем всё
+                logger.warning('Revocation subscription error: %s', e)
+                await asyncio.sleep(1)
+                try:
+                    await self._pubsub.aclose()
+                    self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    await self._pubsub.subscribe(REVOKED_CHANNEL)
+                    await self.load()
+                except (RedisError, OSError) as e:
+                    logger.error('Failed to resubscribe to revocations: %s', e)
+
+    def _apply(self, data: str) -> None:
+        """Сообщение вида '<jti>:<exp>'; испорченное пропускается, а не останавливает подписку"""
+        jti, _, exp = data.rpartition(':')
+        try:
+            expires_at = float(exp)
+        except ValueError:
+            expires_at = None
+        if not jti or expires_at is None or not math.isfinite(expires_at):
+            logger.warning('Ignoring malformed revocation message: %r', data)
+            return
+        self.revoked.add(jti, expires_at)
+
+    async def _prune(self) -> None:
+        while True:
+            await asyncio.sleep(settings.revocation_prune_interval)
+            self.revoked.prune()
+            if self.revoked.needs_rebuild():
+                await self.revoked.rebuild_bloom()
+
+
+revocation_sync: Optional[RevocationSync] = None
+
+
+async def start_revocation_sync(redis: Redis) -> RevocationSync:
+    global revocation_sync
+    if revocation_sync is None:
+        sync = RevocationSync(redis, revocation_list)
+        # Синглтон появляется только после успешного запуска, иначе повторный вызов его бы пропустил
+        await sync.start()
+        revocation_sync = sync
+    return revocation_sync
+
+
+async def stop_revocation_sync() -> None:
+    global revocation_sync
+    if revocation_sync is not None:
+        await revocation_sync.stop()
+        revocation_sync = None
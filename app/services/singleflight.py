@@ -0,0 +1,55 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight(Generic[T]):
+    """Объединение одновременных вызовов с одним ключом.
+
+    Первый вызов выполняет func сам, в своей задаче и со своими ресурсами
+    (например, соединением с бд из запроса). Вызовы с тем же ключом, пришедшие
+    до его завершения, ждут и получают тот же результат или то же исключение.
+    Если первый вызов отменён, ожидающие повторяют попытку сами."""
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                return await self._lead(key, func)
+            self.coalesced += 1
+            try:
+                # shield: отмена ожидающего не должна отменять общий результат
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+    async def _lead(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.calls += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже поднято у ведущего; без ожидающих asyncio
+            # иначе сообщил бы о необработанном исключении будущего
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict[str, float]:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+from uuid import uuid4
+
+import jwt
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.keys import keyring
+from app.db.functions import get_refresh_token_for_user
+from app.db.redis_client import get_redis
+from app.services.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+http_client: Optional['httpx.AsyncClient'] = None
+
+REFRESH_LOCK_KEY = 'refresh_lock:{}'
+REFRESHED_TOKEN_KEY = 'refreshed_access_token:{}'
+
+# Завершение обновления под блокировкой: если блокировка всё ещё принадлежит
+# этому вызову, новый токен (если он выпущен) становится виден остальным
+# воркерам и блокировка снимается. Логаут удаляет блокировку, поэтому
+# обновление, начатое до него, свой токен уже не опубликует
+FINISH_REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    if ARGV[2] ~= '' then
+        redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+    end
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+# Как часто воркер, не получивший блокировку, проверяет готовность токена, с
+REFRESH_POLL_INTERVAL = 0.02
+
+_finish_refresh_script = None
+
+
+class RefreshStats:
+    """Счётчики обновления токенов между воркерами"""
+
+    def __init__(self):
+        self.lock_acquired = 0
+        self.shared_from_workers = 0
+        self.lock_wait_expired = 0
+        self.redis_errors = 0
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'lock_acquired': self.lock_acquired,
+            'shared_from_workers': self.shared_from_workers,
+            'lock_wait_expired': self.lock_wait_expired,
+            'redis_errors': self.redis_errors,
+        }
+
+
+refresh_singleflight: SingleFlight[str] = SingleFlight()
+refresh_stats = RefreshStats()
+
+
+def create_access_token(user_id: str) -> str:
+    expiration = datetime.now(timezone.utc) + timedelta(minutes=settings.access_token_expire_minutes)
+    data = {"sub": user_id, "exp": expiration, "jti": uuid4().hex}
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Access token issued', extra={'sub': user_id, 'jti': data['jti'], 'expires_at': expiration})
+    return keyring.encode(data)
+
+
+def get_user_id_from_expired_token(token: str) -> str:
+    """Извлечение id пользователя из просроченного токена без проверки подписи"""
+    try:
+        user_id = jwt.decode(token, options={"verify_signature": False}).get("sub")
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid token structure")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token structure")
+    return user_id
+
+
+async def refresh_access_token(db, user_id: str, refresh_token: Optional[str] = None) -> str:
+    """Выпуск нового access-токена для пользователя с действующим refresh-токеном.
+
+    Одновременные обновления одного пользователя без переданного refresh-токена
+    объединяются: поиск в бд выполняется один раз, и все получают один новый токен"""
+    if refresh_token:
+        return create_access_token(user_id)
+    if settings.refresh_singleflight_redis_enabled:
+        return await refresh_singleflight.do(user_id, lambda: _issue_across_workers(db, user_id))
+    return await refresh_singleflight.do(user_id, lambda: _issue_for_user(db, user_id))
+
+
+async def _issue_for_user(db, user_id: str) -> str:
+    refresh_token = await get_refresh_token_for_user(db, user_id)
+    if not refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No refresh token found"
+        )
+    return create_access_token(user_id)
+
+
+def _get_finish_refresh_script(redis):
+    global _finish_refresh_script
+    if _finish_refresh_script is None:
+        _finish_refresh_script = redis.register_script(FINISH_REFRESH_SCRIPT)
+    return _finish_refresh_script
+
+
+async def _issue_across_workers(db, user_id: str) -> str:
+    """Токен выпускает воркер, взявший короткую блокировку в Redis; остальные
+    ждут его токен не дольше срока блокировки. При ошибках Redis каждый воркер
+    выпускает токен сам, как без блокировки"""
+    redis = await get_redis()
+    keys = [REFRESH_LOCK_KEY.format(user_id), REFRESHED_TOKEN_KEY.format(user_id)]
+    owner = secrets.token_hex(8)
+    try:
+        async with resilience.redis.guard():
+            shared = await redis.get(keys[1])
+            acquired = shared is None and await redis.set(
+                keys[0], owner, nx=True, px=int(settings.refresh_singleflight_lock_ttl * 1000))
+    except (RedisError, resilience.BackendUnavailable) as e:
+        refresh_stats.redis_errors += 1
+        logger.warning('Refresh lock for user_id %s is unavailable: %s', user_id, e)
+        return await _issue_for_user(db, user_id)
+    if shared is not None:
+        refresh_stats.shared_from_workers += 1
+        return shared
+
+    if acquired:
+        refresh_stats.lock_acquired += 1
+        access_token = ''
+        try:
+            access_token = await _issue_for_user(db, user_id)
+            return access_token
+        finally:
+            await _finish_refresh(redis, keys, owner, access_token)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.refresh_singleflight_lock_ttl
+    while loop.time() < deadline:
+        await asyncio.sleep(REFRESH_POLL_INTERVAL)
+        try:
+            async with resilience.redis.guard():
+                shared = await redis.get(keys[1])
+        except (RedisError, resilience.BackendUnavailable):
+            refresh_stats.redis_errors += 1
+            break
+        if shared is not None:
+            refresh_stats.shared_from_workers += 1
+            return shared
+    # Воркер с блокировкой не успел или не смог выпустить токен
+    refresh_stats.lock_wait_expired += 1
+    return await _issue_for_user(db, user_id)
+
+
+async def forget_refreshed_token(redis, user_id: str) -> None:
+    """При логауте: выпущенный для остальных воркеров access-токен и блокировка
+    обновления удаляются, иначе токен раздавался бы ещё refresh_singleflight_share_ttl"""
+    async with resilience.redis.guard():
+        await redis.delete(REFRESH_LOCK_KEY.format(user_id), REFRESHED_TOKEN_KEY.format(user_id))
+
+
+async def _finish_refresh(redis, keys: list[str], owner: str, access_token: str) -> None:
+    try:
+        async with resilience.redis.guard():
+            await _get_finish_refresh_script(redis)(
+                keys=keys,
+                args=[owner, access_token, int(settings.refresh_singleflight_share_ttl * 1000)],
+                client=redis,
+            )
+    except (RedisError, resilience.BackendUnavailable) as e:
+        # Блокировка истечёт сама через refresh_singleflight_lock_ttl
+        refresh_stats.redis_errors += 1
+        logger.warning('Failed to release refresh lock %s: %s', keys[0], e)
+
+
+def get_http_client() -> 'httpx.AsyncClient':
+    """Общий долгоживущий HTTP-клиент с пулом соединений к внешнему сервису авторизации.
+    httpx импортируется при первом обращении: без auth_service_url он не нужен,
+    а его импорт заметно удлиняет запуск"""
+    global http_client
+    if http_client is None:
+        import httpx
+
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.auth_service_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.auth_service_max_connections,
+                max_keepalive_connections=settings.auth_service_max_connections,
+            ),
+        )
+    return http_client
+
+
+async def close_http_client() -> None:
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+async def refresh_access_token_remote(token: str) -> str:
+    """Обновление просроченного токена через внешний сервис авторизации"""
+    import httpx
+
+    try:
+        response = await get_http_client().post(
+            f"{settings.auth_service_url}/refresh_token",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Auth service is unavailable: {e}")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Failed to refresh access token")
+    new_access_token = response.json().get("access_token")
+    if not new_access_token:
+        raise HTTPException(status_code=500, detail="Failed to retrieve new access token")
+    return new_access_token
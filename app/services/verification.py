@@ -0,0 +1,113 @@
+from typing import NamedTuple
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.metrics import redis_command_duration
+from app.db.redis_shards import email_tag, get_redis_for_keys
+
+# В фигурных скобках — hash tag от email: все ключи одного email хранятся
+# на одном узле кластера или шарде, и скрипты над ними выполняются там же
+VERIFICATION_CODE_KEY = 'verification_code:{{{}}}'
+VERIFICATION_ATTEMPTS_KEY = 'verification_attempts:{{{}}}'
+VERIFICATION_LOCK_KEY = 'verification_lock:{{{}}}'
+
+# Новый код заменяет прежний и обнуляет счётчик попыток одним атомарным
+# вызовом; в отличие от MULTI, скрипты поддерживаются и в Redis Cluster
+SAVE_CODE_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# Проверка и погашение кода за один round-trip. Скрипт выполняется атомарно,
+# поэтому параллельные попытки с одним email не обходят счётчик.
+# Ответ: {статус, значение}
+#   1  — код верный, ключи удалены
+#   0  — код неверный, значение — оставшиеся попытки
+#   -1 — блокировка, значение — сколько ещё она продлится, мс
+#   -2 — кода нет или он истёк
+VERIFY_CODE_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return {-1, redis.call('PTTL', KEYS[3])}
+end
+local code = redis.call('GET', KEYS[1])
+if not code then
+    return {-2, 0}
+end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return {1, 0}
+end
+local attempts = redis.call('INCR', KEYS[2])
+if attempts == 1 then
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl > 0 then
+        redis.call('PEXPIRE', KEYS[2], ttl)
+    end
+end
+local max_attempts = tonumber(ARGV[2])
+if attempts >= max_attempts then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], 1, 'PX', ARGV[3])
+    return {-1, tonumber(ARGV[3])}
+end
+return {0, max_attempts - attempts}
+"""
+
+CODE_VERIFIED = 1
+CODE_INVALID = 0
+CODE_LOCKED = -1
+CODE_MISSING = -2
+
+_save_code_script = None
+_verify_code_script = None
+_save_code_timer = redis_command_duration.labels('save_verification_code')
+_verify_code_timer = redis_command_duration.labels('verify_code')
+
+
+class VerificationResult(NamedTuple):
+    status: int
+    # Оставшиеся попытки для CODE_INVALID, миллисекунды до снятия блокировки для CODE_LOCKED
+    value: int
+
+
+def _keys(email: str) -> list[str]:
+    tag = email_tag(email)
+    return [VERIFICATION_CODE_KEY.format(tag), VERIFICATION_ATTEMPTS_KEY.format(tag), VERIFICATION_LOCK_KEY.format(tag)]
+
+
+def _get_save_code_script(redis):
+    global _save_code_script
+    if _save_code_script is None:
+        _save_code_script = redis.register_script(SAVE_CODE_SCRIPT)
+    return _save_code_script
+
+
+def _get_verify_code_script(redis):
+    global _verify_code_script
+    if _verify_code_script is None:
+        _verify_code_script = redis.register_script(VERIFY_CODE_SCRIPT)
+    return _verify_code_script
+
+
+async def save_verification_code(email: str, code: str) -> None:
+    """Новый код заменяет прежний и обнуляет счётчик попыток; действующую блокировку не снимает"""
+    keys = _keys(email)[:2]
+    redis = await get_redis_for_keys(*keys)
+    async with resilience.redis.guard():
+        with _save_code_timer.time():
+            await _get_save_code_script(redis)(keys=keys, args=[code, settings.verification_code_ttl], client=redis)
+
+
+async def check_verification_code(email: str, code: str) -> VerificationResult:
+    """Проверка кода с учётом попыток; верный код гасится и повторно не принимается"""
+    keys = _keys(email)
+    redis = await get_redis_for_keys(*keys)
+    async with resilience.redis.guard():
+        with _verify_code_timer.time():
+            status, value = await _get_verify_code_script(redis)(
+                keys=keys,
+                args=[code, settings.verification_code_max_attempts, settings.verification_code_lockout_seconds * 1000],
+                client=redis,
+            )
+    return VerificationResult(int(status), int(value))
@@ -1,29 +1,51 @@
-def get_verification_email_html(verification_code: str) -> str:
-    """Возвращает HTML-контент для верификационного письма"""
-    return f"""
-    <html>
-    <body>
-        <h1>Код подтверждения регистрации</h1>
-        <p>Ваш код подтверждения: <strong>{verification_code}</strong></p>
-    </body>
-    </html>
-    """
-
-def get_password_reset_email_html(reset_link: str) -> str:
-    """Возвращает HTML-контент для письма сброса пароля."""
-    return f"""
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Password Reset Request</title>
-    </head>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-        <h1>Запрос на сброс пароля</h1>
-        <p>Мы получили запрос на сброс вашего пароля. Вы можете сбросить его, перейдя по следующей ссылке:</p>
-        <p><a href="{reset_link}" style="color: #1a73e8; text-decoration: none;">Сбросить пароль</a></p>
-        <p>Если вы не запрашивали сброс пароля, проигнорируйте это сообщение.</p>
-    </body>
-    </html>
-    """
+from pathlib import Path
+from typing import Any, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from app.core.config import settings
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / 'templates' / 'email'
+
+# Темы писем по виду и языку; шаблоны лежат в TEMPLATES_DIR как <вид>.<язык>.html/.txt
+SUBJECTS = {
+    'verification': {
+        'ru': 'Код верификации',
+        'en': 'Verification Code',
+    },
+    'password_reset': {
+        'ru': 'Сброс пароля',
+        'en': 'Password Reset Request',
+    },
+}
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+    cache_size=-1,
+)
+
+
+def compile_templates() -> None:
+    """Компиляция всех шаблонов писем в кеш окружения; вызывается при старте"""
+    for name in environment.list_templates():
+        environment.get_template(name)
+
+
+def pick_locale(kind: str, accept_language: Optional[str]) -> str:
+    """Выбор языка письма по заголовку Accept-Language с откатом на язык по умолчанию"""
+    if accept_language:
+        for language in accept_language.split(','):
+            locale = language.split(';')[0].strip().split('-')[0].lower()
+            if locale in SUBJECTS[kind]:
+                return locale
+    return settings.email_default_locale
+
+
+def render_email(kind: str, locale: str, context: dict[str, Any]) -> tuple[str, str]:
+    """Возвращает текстовую и HTML-версии письма"""
+    text = environment.get_template(f'{kind}.{locale}.txt').render(context)
+    html = environment.get_template(f'{kind}.{locale}.html').render(context)
+    return text, html
+
@@ -1,62 +1,142 @@
-from email.message import EmailMessage
+import base64
+import secrets
+from email.header import Header
+from email.utils import formatdate, make_msgid
+from typing import Any, Optional
 
 import aiosmtplib
+from redis.exceptions import RedisError
 
+from app.core import resilience
 from app.core.config import settings
+from app.core.metrics import smtp_send_duration
+from app.db.redis_client import get_redis
+from app.services.email_outbox import OutgoingEmail, enqueue_email
 
-from .email_templates import get_verification_email_html, get_password_reset_email_html
+from .email_templates import SUBJECTS, compile_templates, render_email
 
+_smtp_send_timer = smtp_send_duration.labels('inline')
 
-async def send_verification_email(to_email: str, verification_code: str):
-    """Функция отправки email с кодом верификации при активации пользователя"""
-    message = EmailMessage()
-    message['From'] = settings.smtp_from
-    message['To'] = to_email
-    message['Subject'] = 'Verification Code'
 
-    #текстовая версия письма
-    message.set_content(f'Ваш код верификации: {verification_code}')
+class EmailSkeleton:
+    """Заранее собранный каркас письма multipart/alternative.
 
-    #html-версия письма
-    html_content = get_verification_email_html(verification_code)
-    message.add_alternative(html_content, subtype='html')
+    Статические заголовки (From, Subject, MIME) и разметка частей
+    формируются один раз; при отправке подставляются только To, Date,
+    Message-ID и тела частей в base64."""
 
-    try:
-        await aiosmtplib.send(
-            message,
-            hostname=settings.smtp_host,
-            port=settings.smtp_port,
-            start_tls=True,
-            username=settings.smtp_user,
-            password=settings.smtp_password
+    def __init__(self, sender: str, subject: str):
+        self.sender = sender
+        self.msgid_domain = sender.rpartition('@')[2].strip('>') or None
+        boundary = f'==============={secrets.token_hex(16)}=='
+        self.headers = (
+            f'From: {sender}\r\n'
+            f'Subject: {Header(subject, "utf-8").encode()}\r\n'
+            'MIME-Version: 1.0\r\n'
+            f'Content-Type: multipart/alternative; boundary="{boundary}"\r\n'
+        ).encode()
+        part_headers = (
+            'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+            'Content-Transfer-Encoding: base64\r\n'
+            '\r\n'
         )
-    except Exception as e:
-        raise RuntimeError(f'Failed to send email: {e}')
+        self.text_part = f'\r\n--{boundary}\r\n{part_headers.format(subtype="plain")}'.encode()
+        self.html_part = f'\r\n--{boundary}\r\n{part_headers.format(subtype="html")}'.encode()
+        self.closing = f'\r\n--{boundary}--\r\n'.encode()
 
-async def send_password_reset_email(to_email: str, token: str):
-    """Функция отправки email со ссылкой для сброса пароля"""
-    message = EmailMessage()
-    message['From'] = settings.smtp_from
-    message['To'] = to_email
-    message['Subject'] = 'Password Reset Request'
+    def render(self, to_email: str, text: str, html: str) -> OutgoingEmail:
+        if '\r' in to_email or '\n' in to_email:
+            raise ValueError('Invalid recipient address')
+        variable_headers = (
+            f'To: {to_email}\r\n'
+            f'Date: {formatdate(usegmt=True)}\r\n'
+            f'Message-ID: {make_msgid(domain=self.msgid_domain)}\r\n'
+        ).encode()
+        content = b''.join((
+            self.headers,
+            variable_headers,
+            b'\r\n',
+            self.text_part,
+            _encode_body(text),
+            self.html_part,
+            _encode_body(html),
+            self.closing,
+        ))
+        return OutgoingEmail(self.sender, [to_email], content)
+
+
+def _encode_body(body: str) -> bytes:
+    return base64.encodebytes(body.encode()).replace(b'\n', b'\r\n')
+
+
+_skeletons: dict[tuple[str, str], EmailSkeleton] = {}
+
+
+def prepare_email_templates() -> None:
+    """Компиляция шаблонов и сборка каркасов писем; вызывается при старте приложения.
+    Повторный вызов, например в воркере после прогрева в родительском процессе, ничего не делает"""
+    if _skeletons:
+        return
+    compile_templates()
+    for kind, subjects in SUBJECTS.items():
+        for locale, subject in subjects.items():
+            _skeletons[(kind, locale)] = EmailSkeleton(settings.smtp_from, subject)
 
-    reset_link = f"{settings.fake_link}/?token={token}"
 
-    # Текстовая версия письма
-    message.set_content(f'Чтобы сбросить ваш пароль, перейдите по следующей ссылке: {reset_link}')
+def build_reset_link(token: str) -> str:
+    return f"{settings.fake_link}/?token={token}"
 
-    # HTML-версия письма
-    html_content = get_password_reset_email_html(reset_link)
-    message.add_alternative(html_content, subtype='html')
 
+def build_email_message(kind: str, to_email: str, params: dict[str, Any]) -> OutgoingEmail:
+    """Сборка письма по заданию из outbox"""
+    if not _skeletons:
+        prepare_email_templates()
+    context = dict(params)
+    locale = context.pop('locale', None) or settings.email_default_locale
+    if kind == 'password_reset':
+        context['reset_link'] = build_reset_link(context.pop('token'))
+    text, html = render_email(kind, locale, context)
+    return _skeletons[(kind, locale)].render(to_email, text, html)
+
+
+async def send_email(email: OutgoingEmail):
+    """Непосредственная отправка письма, минуя outbox"""
     try:
-        await aiosmtplib.send(
-            message,
-            hostname=settings.smtp_host,
-            port=settings.smtp_port,
-            start_tls=True,
-            username=settings.smtp_user,
-            password=settings.smtp_password
-        )
+        async with resilience.smtp.guard():
+            with _smtp_send_timer.time():
+                await aiosmtplib.send(
+                    email.content,
+                    sender=email.sender,
+                    recipients=email.recipients,
+                    hostname=settings.smtp_host,
+                    port=settings.smtp_port,
+                    start_tls=settings.smtp_start_tls,
+                    username=settings.smtp_user,
+                    password=settings.smtp_password,
+                    timeout=settings.smtp_timeout
+                )
+    except resilience.BackendUnavailable:
+        raise
     except Exception as e:
         raise RuntimeError(f'Failed to send email: {e}')
+
+
+async def deliver_email(kind: str, to_email: str, **params: Any):
+    """Постановка письма в outbox или, если он выключен, отправка сразу"""
+    if not settings.email_outbox_enabled:
+        await send_email(build_email_message(kind, to_email, params))
+        return
+    try:
+        async with resilience.redis.guard():
+            await enqueue_email(await get_redis(), kind, to_email, **params)
+    except RedisError as e:
+        raise RuntimeError(f'Failed to enqueue email: {e}')
+
+
+async def send_verification_email(to_email: str, verification_code: str, locale: Optional[str] = None):
+    """Функция отправки email с кодом верификации при активации пользователя"""
+    await deliver_email('verification', to_email, verification_code=verification_code, locale=locale)
+
+async def send_password_reset_email(to_email: str, token: str, locale: Optional[str] = None):
+    """Функция отправки email со ссылкой для сброса пароля"""
+    await deliver_email('password_reset', to_email, token=token, locale=locale)
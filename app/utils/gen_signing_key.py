@@ -0,0 +1,32 @@
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+
+def generate_signing_key(algorithm: str) -> bytes:
+    """Генерация приватного ключа подписи JWT в формате PEM"""
+    if algorithm == 'EdDSA':
+        key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Новый ключ для каталога jwt_keys_dir')
+    parser.add_argument('keys_dir')
+    parser.add_argument('--algorithm', choices=['RS256', 'EdDSA'], default='RS256')
+    parser.add_argument('--kid', default=datetime.now(timezone.utc).strftime('%Y-%m-%d'))
+    args = parser.parse_args()
+
+    path = Path(args.keys_dir) / f'{args.kid}.pem'
+    path.write_bytes(generate_signing_key(args.algorithm))
+    path.chmod(0o600)
+    print(f"Your generated signing key: {path}")
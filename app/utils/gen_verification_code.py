@@ -1,5 +1,5 @@
-import random
+import secrets
 
 def generate_verification_code() -> str:
-    """Генерация случайного шестизначного кода"""
-    return str(random.randint(100000, 999999))
\ No newline at end of file
+    """Генерация случайного шестизначного кода криптостойким генератором"""
+    return str(100000 + secrets.randbelow(900000))
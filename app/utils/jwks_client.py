@@ -0,0 +1,34 @@
+"""Клиент для локальной проверки access-токенов в других сервисах.
+
+Публичные ключи загружаются с /.well-known/jwks.json сервиса авторизации
+и кешируются, поэтому сетевой запрос делается только при старте, по
+истечении lifespan или при появлении токена с незнакомым kid:
+
+    verifier = TokenVerifier('https://auth.example.com/.well-known/jwks.json')
+    payload = verifier.verify(token)
+
+Загрузка ключей синхронная; в асинхронном коде первый вызов лучше
+выполнить при старте сервиса."""
+from typing import Any, Sequence
+
+import jwt
+
+
+class TokenVerifier:
+    """Проверка подписи и срока действия токенов по ключам из JWKS"""
+
+    def __init__(self, jwks_url: str, algorithms: Sequence[str] = ('RS256', 'EdDSA'),
+                 lifespan: float = 300, timeout: float = 5):
+        self.algorithms = list(algorithms)
+        self._jwks_client = jwt.PyJWKClient(
+            jwks_url,
+            cache_keys=True,
+            cache_jwk_set=True,
+            lifespan=lifespan,
+            timeout=timeout,
+        )
+
+    def verify(self, token: str) -> dict[str, Any]:
+        """Возвращает payload токена или бросает jwt.InvalidTokenError"""
+        signing_key = self._jwks_client.get_signing_key_from_jwt(token)
+        return jwt.decode(token, signing_key.key, algorithms=self.algorithms)
@@ -0,0 +1,52 @@
+"""Сравнение двух результатов benchmarks.load, например до и после коммита.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+
+Код возврата 1, если RPS какого-либо эндпоинта упал или p99 вырос больше
+чем на threshold процентов.
+"""
+import argparse
+import json
+import sys
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Печатает таблицу изменений и возвращает список регрессий"""
+    regressions = []
+    print(f"{'endpoint':<14} {'rps':>20} {'p50 ms':>22} {'p99 ms':>22}")
+    for name, after in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        rps_change = _change(before['rps'], after['rps'])
+        p50_change = _change(before['p50_ms'], after['p50_ms'])
+        p99_change = _change(before['p99_ms'], after['p99_ms'])
+        print(f"{name:<14} {after['rps']:>10.0f} ({rps_change:>+6.1f}%) "
+              f"{after['p50_ms']:>11.2f} ({p50_change:>+6.1f}%) {after['p99_ms']:>11.2f} ({p99_change:>+6.1f}%)")
+        if rps_change < -threshold:
+            regressions.append(f'{name}: rps {rps_change:+.1f}%')
+        if p99_change > threshold:
+            regressions.append(f'{name}: p99 {p99_change:+.1f}%')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Допустимое ухудшение, %%')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline_report = json.load(f)
+    with open(args.current) as f:
+        current_report = json.load(f)
+    print(f"baseline {baseline_report['meta'].get('commit')}, current {current_report['meta'].get('commit')}")
+    found = compare(baseline_report, current_report, args.threshold)
+    for regression in found:
+        print(f'regression: {regression}')
+    sys.exit(1 if found else 0)
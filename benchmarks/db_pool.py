@@ -0,0 +1,67 @@
+"""Бенчмарк пропускной способности запросов к бд в зависимости от конкурентности.
+
+Сравнивает одно разделяемое соединение (прежнее поведение app.db) с пулом
+соединений. Нужна доступная база из настроек приложения:
+
+    python -m benchmarks.db_pool --requests 5000 --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import asyncpg
+
+from app.core.config import settings
+from app.db import create_pool
+from app.db.functions import get_refresh_token_for_user
+
+
+async def _run(acquire, requests: int, concurrency: int) -> float:
+    """Выполняет requests запросов в concurrency потоков, возвращает RPS"""
+    user_ids = [str(uuid.uuid4()) for _ in range(concurrency)]
+    remaining = requests
+
+    async def worker(user_id: str) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            async with acquire() as conn:
+                await get_refresh_token_for_user(conn, user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(user_id) for user_id in user_ids))
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, concurrency_levels: list[int]) -> None:
+    connection = await asyncpg.connect(settings.postgres_url)
+    lock = asyncio.Lock()
+
+    class _single:
+        """Одно соединение на всех: запросы выстраиваются в очередь"""
+        async def __aenter__(self):
+            await lock.acquire()
+            return connection
+
+        async def __aexit__(self, *exc):
+            lock.release()
+
+    pool = await create_pool()
+    print(f'{"concurrency":>12} {"single conn RPS":>16} {"pool RPS":>10}')
+    try:
+        for concurrency in concurrency_levels:
+            single_rps = await _run(_single, requests, concurrency)
+            pool_rps = await _run(pool.acquire, requests, concurrency)
+            print(f'{concurrency:>12} {single_rps:>16.0f} {pool_rps:>10.0f}')
+    finally:
+        await pool.close()
+        await connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
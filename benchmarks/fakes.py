@@ -0,0 +1,369 @@
+"""Локальные заменители Postgres, Redis и SMTP для нагрузочных тестов без внешних сервисов.
+
+Заменители повторяют ровно ту часть API asyncpg, redis.asyncio и aiosmtplib,
+которой пользуется приложение, и хранят данные в памяти процесса. Задержка
+каждого вызова задаётся отдельно, чтобы моделировать сетевой round-trip,
+а connect_latency — время подключения при создании пула бд и первом вызове Redis:
+
+    backends = install_fakes(db_latency=0.001, redis_latency=0.0005)
+"""
+import asyncio
+import fnmatch
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+import aiosmtplib
+
+import app.db
+import app.db.redis_client
+from app.core.config import settings
+from app.db.functions import DELETE_REFRESH_TOKEN_QUERY, GET_REFRESH_TOKEN_QUERY, SAVE_REFRESH_TOKEN_QUERY
+from app.db.replicas import REPLICATION_LAG_QUERY
+from app.db.sweeper import DELETE_EXPIRED_TOKENS_QUERY
+
+
+async def _pause(latency: float) -> None:
+    # sleep(0) всё равно отдаёт управление циклу, как настоящий сетевой вызов
+    await asyncio.sleep(latency)
+
+
+class FakeDatabase:
+    """Таблицы users и tokens в памяти"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tokens: dict[str, tuple[str, Any]] = {}
+        self.users: dict[str, str] = {}
+        self.queries = 0
+
+
+class FakeConnection:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+
+    async def fetchrow(self, query: str, *args):
+        await self._round_trip()
+        if query == GET_REFRESH_TOKEN_QUERY:
+            row = self.database.tokens.get(str(args[0]))
+            if row is None or row[1] <= datetime.utcnow():
+                return None
+            return {'refresh_token': row[0], 'expires_at': row[1]}
+        if 'FROM users' in query:
+            user_id = self.database.users.get(args[0].lower())
+            return None if user_id is None else {'id': user_id}
+        raise NotImplementedError(query)
+
+    async def fetchval(self, query: str, *args, timeout: Optional[float] = None):
+        await self._round_trip()
+        if query == REPLICATION_LAG_QUERY:
+            return 0.0
+        raise NotImplementedError(query)
+
+    async def execute(self, query: str, *args) -> str:
+        await self._round_trip()
+        return self._apply(query, args)
+
+    async def executemany(self, query: str, args) -> None:
+        await self._round_trip()
+        for row in args:
+            self._apply(query, row)
+
+    def _apply(self, query: str, args) -> str:
+        if query == SAVE_REFRESH_TOKEN_QUERY:
+            self.database.tokens[str(args[0])] = (args[1], args[2])
+            return 'SELECT 1'
+        if query == DELETE_REFRESH_TOKEN_QUERY:
+            deleted = self.database.tokens.pop(str(args[0]), None) is not None
+            return f'DELETE {int(deleted)}'
+        if query == DELETE_EXPIRED_TOKENS_QUERY:
+            now = datetime.utcnow()
+            expired = [user_id for user_id, (_, expires_at) in self.database.tokens.items() if expires_at < now]
+            for user_id in expired[:args[0]]:
+                del self.database.tokens[user_id]
+            return f'DELETE {min(len(expired), args[0])}'
+        raise NotImplementedError(query)
+
+    async def _round_trip(self) -> None:
+        self.database.queries += 1
+        await _pause(self.database.latency)
+
+
+class _AcquireContext:
+    """Как и PoolAcquireContext в asyncpg: можно и await, и async with"""
+
+    def __init__(self, pool: 'FakePool', timeout: Optional[float]):
+        self.pool = pool
+        self.timeout = timeout
+        self.connection: Optional[FakeConnection] = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self) -> FakeConnection:
+        self.connection = await self.pool._acquire(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, *exc) -> None:
+        await self.pool.release(self.connection)
+
+
+class FakePool:
+    """Пул с тем же ограничением max_size, что и настоящий: при исчерпании запросы ждут"""
+
+    def __init__(self, database: FakeDatabase, max_size: int):
+        self.database = database
+        self.max_size = max_size
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._idle: list[FakeConnection] = []
+        self._size = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> _AcquireContext:
+        return _AcquireContext(self, timeout)
+
+    async def _acquire(self, timeout: Optional[float]) -> FakeConnection:
+        await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        if self._idle:
+            return self._idle.pop()
+        self._size += 1
+        return FakeConnection(self.database)
+
+    async def release(self, connection: FakeConnection) -> None:
+        self._idle.append(connection)
+        self._semaphore.release()
+
+    async def close(self) -> None:
+        self._idle.clear()
+        self._size = 0
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get_idle_size(self) -> int:
+        return len(self._idle)
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list[Any]:
+        # Пайплайн — один round-trip на все команды
+        await self.redis._round_trip()
+        results = []
+        for name, args, kwargs in self._commands:
+            results.append(getattr(self.redis, f'_{name}')(*args, **kwargs))
+        self._commands = []
+        return results
+
+    async def __aenter__(self) -> 'FakePipeline':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._commands = []
+
+
+class FakePubSub:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.channels: set[str] = set()
+        self._messages: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe(self, *channels: str) -> None:
+        self.channels.update(channels)
+        self.redis._subscribers.append(self)
+
+    async def get_message(self, timeout: float = 0.0) -> Optional[dict[str, Any]]:
+        # asyncio.timeout, а не wait_for: в 3.11 wait_for может проглотить отмену задачи
+        try:
+            async with asyncio.timeout(timeout):
+                return await self._messages.get()
+        except TimeoutError:
+            return None
+
+    async def aclose(self) -> None:
+        if self in self.redis._subscribers:
+            self.redis._subscribers.remove(self)
+
+
+class FakeScript:
+    """Lua-скрипты не исполняются: лимиты в нагрузочном тесте не срабатывают"""
+
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+
+    async def __call__(self, keys=(), args=(), client=None) -> int:
+        await self.redis._round_trip()
+        return 0
+
+
+class FakeRedis:
+    """Строковые ключи с TTL и pub/sub в памяти, ответы декодированы, как при decode_responses=True"""
+
+    def __init__(self, latency: float = 0.0, connect_latency: float = 0.0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self._connected = False
+        self.values: dict[str, tuple[str, Optional[float]]] = {}
+        self.commands = 0
+        self._subscribers: list[FakePubSub] = []
+
+    def __getattr__(self, name: str):
+        # ping, get, set, setex, delete, mget, publish, xadd: вызов с задержкой поверх синхронной реализации
+        implementation = type(self).__dict__.get(f'_{name}')
+        if implementation is None:
+            raise AttributeError(name)
+
+        async def command(*args, **kwargs):
+            await self._round_trip()
+            return implementation(self, *args, **kwargs)
+        setattr(self, name, command)
+        return command
+
+    async def _round_trip(self) -> None:
+        # Вызовы до первого завершённого подключения ждут и его
+        if not self._connected:
+            await _pause(self.connect_latency)
+            self._connected = True
+        await _pause(self.latency)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> FakePubSub:
+        return FakePubSub(self)
+
+    def register_script(self, script: str) -> FakeScript:
+        return FakeScript(self)
+
+    async def scan_iter(self, match: str = '*', count: Optional[int] = None):
+        for key in list(self.values):
+            if fnmatch.fnmatchcase(key, match) and self._get(key) is not None:
+                yield key
+
+    async def aclose(self, close_connection_pool: bool = True) -> None:
+        self._subscribers.clear()
+
+    def _ping(self) -> bool:
+        self.commands += 1
+        return True
+
+    def _get(self, key: str) -> Optional[str]:
+        self.commands += 1
+        item = self.values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    def _set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        self.commands += 1
+        self.values[key] = (str(value), time.monotonic() + ex if ex else None)
+        return True
+
+    def _setex(self, key: str, ttl: int, value: Any) -> bool:
+        return self._set(key, value, ex=ttl)
+
+    def _delete(self, *keys: str) -> int:
+        self.commands += 1
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def _mget(self, keys: list[str]) -> list[Optional[str]]:
+        return [self._get(key) for key in keys]
+
+    def _publish(self, channel: str, message: str) -> int:
+        self.commands += 1
+        receivers = [pubsub for pubsub in self._subscribers if channel in pubsub.channels]
+        for pubsub in receivers:
+            pubsub._messages.put_nowait({'type': 'message', 'channel': channel, 'data': message})
+        return len(receivers)
+
+    def _xadd(self, stream: str, fields: dict[str, Any]) -> str:
+        self.commands += 1
+        return f'{int(time.time() * 1000)}-0'
+
+
+class FakeSMTP:
+    """Заменитель aiosmtplib.SMTP: письма только считаются"""
+
+    latency = 0.0
+    sent = 0
+
+    def __init__(self, **kwargs):
+        self.is_connected = False
+
+    async def connect(self) -> None:
+        await _pause(FakeSMTP.latency)
+        self.is_connected = True
+
+    async def sendmail(self, sender: str, recipients: list[str], message: bytes):
+        await _pause(FakeSMTP.latency)
+        FakeSMTP.sent += 1
+        return {}, 'OK'
+
+    async def quit(self) -> None:
+        self.is_connected = False
+
+    def close(self) -> None:
+        self.is_connected = False
+
+
+async def fake_send(message: bytes, sender: str, recipients: list[str], **kwargs):
+    """Заменитель aiosmtplib.send: соединение на каждое письмо, как у настоящего"""
+    smtp = FakeSMTP()
+    await smtp.connect()
+    try:
+        return await smtp.sendmail(sender, recipients, message)
+    finally:
+        await smtp.quit()
+
+
+class FakeBackends:
+    def __init__(self, database: FakeDatabase, redis: FakeRedis):
+        self.database = database
+        self.redis = redis
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'db_queries': self.database.queries,
+            'redis_commands': self.redis.commands,
+            'emails_sent': FakeSMTP.sent,
+        }
+
+
+def install_fakes(db_latency: float = 0.0, redis_latency: float = 0.0, smtp_latency: float = 0.0,
+                  connect_latency: float = 0.0) -> FakeBackends:
+    """Подменяет фабрики пула бд и клиента Redis и отправку писем.
+
+    Вызывается до старта приложения: lifespan создаст пул и клиент Redis
+    через подменённые фабрики. Outbox отключается, так как Streams
+    заменителем Redis не поддерживаются; письма уходят через FakeSMTP."""
+    database = FakeDatabase(db_latency)
+    redis = FakeRedis(redis_latency, connect_latency)
+    FakeSMTP.latency = smtp_latency
+
+    async def create_pool(dsn: Optional[str] = None) -> FakePool:
+        # Реплики видят те же данные, что и основная бд, без отставания.
+        # asyncpg открывает postgres_pool_min_size соединений параллельно
+        await _pause(connect_latency)
+        return FakePool(database, settings.postgres_pool_max_size)
+
+    app.db.create_pool = create_pool
+    app.db.redis_client.create_redis = lambda url=None: redis
+    aiosmtplib.send = fake_send
+    aiosmtplib.SMTP = FakeSMTP
+    settings.email_outbox_enabled = False
+    return FakeBackends(database, redis)
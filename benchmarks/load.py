@@ -0,0 +1,214 @@
+"""Нагрузочный тест основных эндпоинтов: /login, /verify_token, /refresh_token, /logout.
+
+По умолчанию приложение запускается в этом же процессе через ASGI-транспорт
+httpx поверх заменителей бд, Redis и SMTP из benchmarks.fakes, так что
+внешние сервисы не нужны:
+
+    python -m benchmarks.load --requests 5000 --concurrency 64 --output results.json
+
+С --url нагрузка идёт на запущенный сервер, например на benchmarks.serve
+с теми же заменителями или на стенд с настоящими Postgres и Redis. Токены
+для /refresh_token и /logout выпускаются локально, поэтому настройки JWT
+у генератора и сервера должны совпадать:
+
+    python -m benchmarks.serve --port 8080 &
+    python -m benchmarks.load --url http://127.0.0.1:8080
+
+Результаты разных коммитов сравниваются через benchmarks.compare.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.keys import keyring
+
+from .fakes import install_fakes
+
+SCENARIOS = ('login', 'verify_token', 'refresh_token', 'logout')
+
+# Запрос сценария: по номеру запроса возвращает (путь, параметры httpx)
+RequestFactory = Callable[[int], tuple[str, dict[str, Any]]]
+
+
+def _issue_token(user_id: str, expires_in: timedelta) -> str:
+    """Токен того же вида, что выдаёт create_access_token, но с произвольным сроком"""
+    expiration = datetime.now(timezone.utc) + expires_in
+    return keyring.encode({'sub': user_id, 'exp': expiration, 'jti': uuid.uuid4().hex})
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, float]:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': count / elapsed if elapsed else 0.0,
+        'mean_ms': sum(latencies) / count * 1000 if count else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if count else 0.0,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request: RequestFactory, requests: int,
+                       concurrency: int) -> dict[str, float]:
+    """Отправляет requests запросов из concurrency параллельных воркеров"""
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index, errors
+        while next_index < requests:
+            path, kwargs = make_request(next_index)
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def _login_users(client: httpx.AsyncClient, prefix: str, user_ids: list[str], concurrency: int) -> None:
+    """Прогрев: логин пользователей, чтобы у них были refresh-токены"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(user_id: str) -> None:
+        async with semaphore:
+            response = await client.post(f'{prefix}/login', json={'user_id': user_id})
+            response.raise_for_status()
+
+    await asyncio.gather(*(login(user_id) for user_id in user_ids))
+
+
+def build_scenarios(prefix: str, user_ids: list[str], requests: int) -> dict[str, RequestFactory]:
+    valid_tokens = [_issue_token(user_id, timedelta(minutes=30)) for user_id in user_ids]
+    expired_tokens = [_issue_token(user_id, timedelta(minutes=-5)) for user_id in user_ids]
+    # Каждый логаут отзывает свой токен, поэтому они не переиспользуются
+    logout_tokens = [_issue_token(user_ids[i % len(user_ids)], timedelta(minutes=30)) for i in range(requests)]
+
+    def login(i: int):
+        return f'{prefix}/login', {'json': {'user_id': user_ids[i % len(user_ids)]}}
+
+    def verify_token(i: int):
+        return f'{prefix}/verify_token', {'json': {'token': valid_tokens[i % len(valid_tokens)]}}
+
+    def refresh_token(i: int):
+        token = expired_tokens[i % len(expired_tokens)]
+        return f'{prefix}/refresh_token', {'headers': {'Authorization': f'Bearer {token}'}}
+
+    def logout(i: int):
+        return f'{prefix}/logout', {'headers': {'Authorization': f'Bearer {logout_tokens[i]}'}}
+
+    return {'login': login, 'verify_token': verify_token, 'refresh_token': refresh_token, 'logout': logout}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _run(client: httpx.AsyncClient, args) -> dict[str, dict[str, float]]:
+    prefix = f'/api/v1/{settings.service_name}'
+    user_ids = [str(uuid.uuid4()) for _ in range(args.users)]
+    await _login_users(client, prefix, user_ids, args.concurrency)
+    scenarios = build_scenarios(prefix, user_ids, args.requests)
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency)
+        print(f"{name:<14} {results[name]['rps']:>9.0f} req/s  "
+              f"p50 {results[name]['p50_ms']:>7.2f} ms  p95 {results[name]['p95_ms']:>7.2f} ms  "
+              f"p99 {results[name]['p99_ms']:>7.2f} ms  errors {results[name]['errors']}")
+    return results
+
+
+async def main(args) -> dict[str, Any]:
+    keyring.load()
+    # Логи каждого запроса генератора искажают замер
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    backends = None
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+            results = await _run(client, args)
+    else:
+        settings.refresh_token_write_behind = args.write_behind
+        backends = install_fakes(args.db_latency, args.redis_latency, args.smtp_latency)
+        from main import app
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+                results = await _run(client, args)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'mode': 'remote' if args.url else 'in-process',
+            'url': args.url,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'users': args.users,
+            'write_behind': args.write_behind,
+            'db_latency': args.db_latency,
+            'redis_latency': args.redis_latency,
+            'python': platform.python_version(),
+            'backends': backends.stats() if backends else None,
+        },
+        'results': results,
+    }
+
+
+def parse_args(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Адрес запущенного сервера; без него приложение поднимается в процессе')
+    parser.add_argument('--requests', type=int, default=5000, help='Запросов на каждый сценарий')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--write-behind', action='store_true', help='Пакетная запись refresh-токенов')
+    parser.add_argument('--db-latency', type=float, default=0.0005, help='Задержка запроса к бд, с')
+    parser.add_argument('--redis-latency', type=float, default=0.0002, help='Задержка команды Redis, с')
+    parser.add_argument('--smtp-latency', type=float, default=0.01, help='Задержка SMTP-команды, с')
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results saved to {arguments.output}')
@@ -0,0 +1,67 @@
+"""Бенчмарк /login с отложенной записью refresh-токенов (write-behind) и без неё.
+
+Приложение запускается в этом же процессе, запросы идут через ASGI-транспорт
+httpx, поэтому в замер входит весь маршрут, включая его зависимости: без
+write-behind логин держит соединение из пула на время записи, с ним — не
+берёт соединение вовсе. Нужна база из настроек приложения со схемой tokens;
+с --fakes вместо неё и Redis используются заменители из benchmarks.fakes:
+
+    python -m benchmarks.login_write_behind --requests 20000 --concurrency 64
+    python -m benchmarks.login_write_behind --fakes --db-latency 0.002
+"""
+import argparse
+import asyncio
+import logging
+import uuid
+
+import httpx
+
+from app.core.config import settings
+from app.db import write_behind
+
+from .fakes import install_fakes
+from .load import run_scenario
+
+
+async def _measure(app, enabled: bool, args) -> dict[str, float]:
+    settings.refresh_token_write_behind = enabled
+    path = f'/api/v1/{settings.service_name}/login'
+
+    def login(i: int):
+        return path, {'json': {'user_id': str(uuid.uuid4())}}
+
+    async with app.router.lifespan_context(app):
+        writer = write_behind.refresh_token_writer
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            result = await run_scenario(client, login, args.requests, args.concurrency)
+        if writer is not None:
+            result.update(writer.stats())
+    # Остаток буфера записан в бд при остановке приложения
+    return result
+
+
+async def main(args) -> None:
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    if args.fakes:
+        install_fakes(db_latency=args.db_latency, redis_latency=args.redis_latency)
+    from main import app
+
+    for enabled in (False, True):
+        result = await _measure(app, enabled, args)
+        line = (f"write-behind {'on ' if enabled else 'off'}: {result['rps']:>9.0f} logins/s  "
+                f"p50 {result['p50_ms']:>7.2f} ms  p99 {result['p99_ms']:>7.2f} ms  errors {result['errors']}")
+        if enabled:
+            line += f"  ({result['flushes']} flushes)"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--fakes', action='store_true', help='Заменители бд и Redis вместо настоящих')
+    parser.add_argument('--db-latency', type=float, default=0.001)
+    parser.add_argument('--redis-latency', type=float, default=0.0002)
+    args = parser.parse_args()
+    asyncio.run(main(args))
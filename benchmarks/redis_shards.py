@@ -0,0 +1,172 @@
+"""Коды подтверждения и токены сброса пароля на нескольких узлах Redis.
+
+Поднимает --nodes локальных redis-server (для --mode cluster — собирает из
+них Redis Cluster через redis-cli --cluster create), направляет на них
+app.db.redis_shards и для --emails адресов сохраняет и проверяет код
+подтверждения и сохраняет токен сброса пароля. Печатает производительность
+операций и распределение ключей по узлам; размещение ключей одного email
+на одном узле проверяют тесты (tests/test_redis_shards.py):
+
+    python -m benchmarks.redis_shards --mode sharded --nodes 3 --emails 20000
+    python -m benchmarks.redis_shards --mode cluster --nodes 3 --output shards.json
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import socket
+import subprocess
+import tempfile
+import time
+from collections import Counter
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+from app.db import redis_shards
+from app.services.password_reset import save_password_reset_token
+from app.services.verification import CODE_VERIFIED, check_verification_code, save_verification_code
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Redis did not start on {host}:{port}')
+
+
+def _start_nodes(args, directory: str) -> list[subprocess.Popen]:
+    processes = []
+    for port in args.ports:
+        command = [args.redis_server, '--port', str(port), '--bind', args.host, '--save', '', '--appendonly', 'no',
+                   '--dir', directory]
+        if args.mode == redis_shards.CLUSTER:
+            command += ['--cluster-enabled', 'yes', '--cluster-config-file', f'nodes-{port}.conf']
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+    for port in args.ports:
+        _wait_for_port(args.host, port)
+    return processes
+
+
+def _create_cluster(args, timeout: float = 30.0) -> None:
+    nodes = [f'{args.host}:{port}' for port in args.ports]
+    subprocess.run([args.redis_cli, '--cluster', 'create', *nodes, '--cluster-replicas', '0', '--cluster-yes'],
+                   check=True, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = subprocess.run([args.redis_cli, '-h', args.host, '-p', str(args.ports[0]), 'cluster', 'info'],
+                              check=True, capture_output=True, text=True).stdout
+        if 'cluster_state:ok' in info:
+            return
+        time.sleep(0.2)
+    raise RuntimeError('Redis Cluster did not reach cluster_state:ok')
+
+
+async def _timed(name: str, emails: list[str], func, concurrency: int) -> dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def run(email: str) -> None:
+        nonlocal errors
+        async with semaphore:
+            if not await func(email):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(email) for email in emails))
+    elapsed = time.perf_counter() - started
+    result = {'ops': len(emails), 'errors': errors, 'ops_per_second': len(emails) / elapsed}
+    print(f'{name:<20} {result["ops_per_second"]:>10.0f} ops/s  errors {errors}')
+    return result
+
+
+async def _keys_per_node(args) -> dict[str, int]:
+    keys_per_node = {}
+    for port in args.ports:
+        client = Redis(host=args.host, port=port, decode_responses=True)
+        try:
+            keys_per_node[f'{args.host}:{port}'] = await client.dbsize()
+        finally:
+            await client.aclose()
+    return keys_per_node
+
+
+async def _run(args) -> dict:
+    settings.redis_keyspace_mode = args.mode
+    settings.redis_nodes = [f'{args.host}:{port}' for port in args.ports]
+    await redis_shards.init_keyspace()
+    codes = {}
+    emails = [f'user{i}@example.com' for i in range(args.emails)]
+
+    async def save(email: str) -> bool:
+        codes[email] = f'{secrets.randbelow(10 ** 6):06d}'
+        await save_verification_code(email, codes[email])
+        return True
+
+    async def verify(email: str) -> bool:
+        # Неверная попытка и верный код: оба пути скрипта проверки
+        await check_verification_code(email, 'wrong')
+        return (await check_verification_code(email, codes[email])).status == CODE_VERIFIED
+
+    async def save_reset_token(email: str) -> bool:
+        await save_password_reset_token(email, secrets.token_urlsafe(32))
+        return True
+
+    try:
+        operations = {
+            'save_code': await _timed('save_code', emails, save, args.concurrency),
+            'verify_code': await _timed('verify_code', emails, verify, args.concurrency),
+            'save_reset_token': await _timed('save_reset_token', emails, save_reset_token, args.concurrency),
+        }
+    finally:
+        await redis_shards.close_keyspace()
+
+    keys_per_node = await _keys_per_node(args)
+    ring = redis_shards.HashRing(settings.redis_nodes, settings.redis_ring_points_per_node)
+    expected = Counter(ring.node_for(redis_shards.email_tag(email)) for email in emails) if args.mode == redis_shards.SHARDED else None
+    for node, count in keys_per_node.items():
+        line = f'{node:<22} {count:>8} keys'
+        if expected is not None:
+            line += f'  ({expected[node]} emails by ring)'
+        print(line)
+    return {'mode': args.mode, 'nodes': len(args.ports), 'emails': args.emails, 'operations': operations,
+            'keys_per_node': keys_per_node}
+
+
+def main(args) -> dict:
+    args.ports = [args.base_port + i for i in range(args.nodes)]
+    with tempfile.TemporaryDirectory() as directory:
+        processes = _start_nodes(args, directory)
+        try:
+            if args.mode == redis_shards.CLUSTER:
+                _create_cluster(args)
+            report = asyncio.run(_run(args))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=[redis_shards.SHARDED, redis_shards.CLUSTER], default=redis_shards.SHARDED)
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--emails', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=17000)
+    parser.add_argument('--redis-server', default='redis-server')
+    parser.add_argument('--redis-cli', default='redis-cli')
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    args = parser.parse_args()
+
+    report = main(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,56 @@
+"""Бенчмарк памяти и задержки проверки отзыва токенов.
+
+    python -m benchmarks.revocation --revoked 1000000 --lookups 200000
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from app.services.revocation import RevocationList
+
+
+def _lookup_latency(revocations: RevocationList, jtis: list[str]) -> float:
+    """Средняя задержка одной проверки в микросекундах"""
+    started = time.perf_counter()
+    for jti in jtis:
+        revocations.is_revoked(jti)
+    return (time.perf_counter() - started) / len(jtis) * 1e6
+
+
+def main(revoked: int, lookups: int, error_rate: float) -> None:
+    exp = time.time() + 3600
+    revoked_jtis = [uuid.uuid4().hex for _ in range(revoked)]
+
+    started = time.perf_counter()
+    revocations = RevocationList(capacity=revoked, error_rate=error_rate)
+    for jti in revoked_jtis:
+        revocations.add(jti, exp)
+    load_seconds = time.perf_counter() - started
+
+    # Память считаем отдельным проходом: tracemalloc сильно замедляет загрузку
+    tracemalloc.start()
+    measured = RevocationList(capacity=revoked, error_rate=error_rate)
+    for jti in revoked_jtis:
+        measured.add(jti, exp)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+
+    valid_jtis = [uuid.uuid4().hex for _ in range(lookups)]
+    print(f'revoked entries:      {len(revocations)}')
+    print(f'memory:               {memory / 2 ** 20:.1f} MiB '
+          f'(bloom filter {revocations.stats()["bloom_bytes"] / 2 ** 20:.1f} MiB)')
+    print(f'load time:            {load_seconds:.2f} s')
+    print(f'lookup, not revoked:  {_lookup_latency(revocations, valid_jtis):.2f} us')
+    print(f'lookup, revoked:      {_lookup_latency(revocations, revoked_jtis[:lookups]):.2f} us')
+    print(f'false positives:      {revocations.false_positives} of {lookups}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--revoked', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    args = parser.parse_args()
+    main(args.revoked, args.lookups, args.error_rate)
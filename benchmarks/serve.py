@@ -0,0 +1,36 @@
+"""Запуск сервиса поверх заменителей бд, Redis и SMTP из benchmarks.fakes.
+
+Нужен для нагрузочного теста по сети, когда настоящих сервисов нет:
+
+    python -m benchmarks.serve --port 8080 --db-latency 0.001
+    python -m benchmarks.serve --port 8080 --workers 4
+
+С --workers сервис поднимается через app.core.server. Заменители живут
+в памяти своего процесса, поэтому у каждого воркера свои бд и Redis.
+"""
+import argparse
+
+import uvicorn
+
+from .fakes import install_fakes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help='Запуск через app.core.server')
+    parser.add_argument('--db-latency', type=float, default=0.0005)
+    parser.add_argument('--redis-latency', type=float, default=0.0002)
+    parser.add_argument('--smtp-latency', type=float, default=0.01)
+    parser.add_argument('--connect-latency', type=float, default=0.0, help='Подключение к бд и Redis, секунды')
+    args = parser.parse_args()
+
+    install_fakes(args.db_latency, args.redis_latency, args.smtp_latency, args.connect_latency)
+    from main import app
+
+    if args.workers:
+        from app.core import server
+
+        server.run(app, args.host, args.port, args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
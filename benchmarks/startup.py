@@ -0,0 +1,116 @@
+"""Время импорта и запуска сервиса до первого ответа.
+
+Импорт: в новом интерпретаторе замеряются import main и сборка приложения
+(обращение к main.app). Первый запрос: поднимается benchmarks.serve на
+заменителях бд и Redis с задержкой подключения --connect-latency,
+замеряется время от запуска процесса до первого ответа /login, задержка
+этого первого запроса и следующего за ним. Каждый замер повторяется
+--runs раз, в отчёт идёт медиана.
+
+Для сравнения до и после изменения замер запускается в другой копии
+репозитория (--tree); benchmarks.fakes и benchmarks.serve в ней должны
+поддерживать --connect-latency:
+
+    python -m benchmarks.startup --runs 10 --output after.json
+    python -m benchmarks.startup --runs 10 --tree /tmp/auth-before --output before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+IMPORT_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.app
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (time.perf_counter() - imported) * 1000}))
+"""
+
+
+def measure_import(tree: str) -> dict[str, float]:
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=tree, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _login(client: httpx.Client, url: str) -> float:
+    started = time.perf_counter()
+    response = client.post(url, json={'user_id': str(uuid.uuid4())})
+    response.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_first_request(args) -> dict[str, float]:
+    url = f'http://{args.host}:{args.port}/api/v1/{settings.service_name}/login'
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--host', args.host, '--port', str(args.port),
+         '--db-latency', str(args.db_latency), '--redis-latency', str(args.redis_latency),
+         '--connect-latency', str(args.connect_latency)],
+        cwd=args.tree,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=30) as client:
+            deadline = started + 30
+            while True:
+                try:
+                    first_request_ms = _login(client, url)
+                    break
+                except httpx.TransportError:
+                    if time.perf_counter() > deadline:
+                        raise RuntimeError(f'Server did not answer on {url}')
+                    time.sleep(0.005)
+            time_to_first_response_ms = (time.perf_counter() - started) * 1000
+            second_request_ms = _login(client, url)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'time_to_first_response_ms': time_to_first_response_ms,
+        'first_request_ms': first_request_ms,
+        'second_request_ms': second_request_ms,
+    }
+
+
+def _median(samples: list[dict[str, float]]) -> dict[str, float]:
+    return {name: statistics.median(sample[name] for sample in samples) for name in samples[0]}
+
+
+def main(args) -> dict[str, float]:
+    report = {
+        **_median([measure_import(args.tree) for _ in range(args.runs)]),
+        **_median([measure_first_request(args) for _ in range(args.runs)]),
+    }
+    for name, value in report.items():
+        print(f'{name:<28} {value:>8.1f}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tree', default=os.getcwd(), help='Каталог репозитория, в котором запускается сервис')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--connect-latency', type=float, default=0.05)
+    parser.add_argument('--db-latency', type=float, default=0.0005)
+    parser.add_argument('--redis-latency', type=float, default=0.0002)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18090)
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    args = parser.parse_args()
+
+    report = main(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'tree': args.tree, 'connect_latency': args.connect_latency, 'results': report}, f, indent=2)
@@ -0,0 +1,41 @@
+"""Микробенчмарк проверки access-токенов с кешем и без него.
+
+    python -m benchmarks.token_cache --iterations 100000 --tokens 100
+"""
+import argparse
+import time
+import uuid
+
+from app.middlewares.auth import create_access_token, verify_token
+from app.middlewares.token_cache import token_cache
+
+
+def _measure(tokens: list[str], iterations: int) -> float:
+    """Возвращает число проверок в секунду"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        verify_token(tokens[i % len(tokens)])
+    return iterations / (time.perf_counter() - started)
+
+
+def main(iterations: int, token_count: int) -> None:
+    tokens = [create_access_token(str(uuid.uuid4())) for _ in range(token_count)]
+
+    token_cache.enabled = False
+    uncached = _measure(tokens, iterations)
+
+    token_cache.enabled = True
+    token_cache.clear()
+    cached = _measure(tokens, iterations)
+
+    print(f'uncached: {uncached:>12.0f} verifications/s')
+    print(f'cached:   {cached:>12.0f} verifications/s ({cached / uncached:.1f}x)')
+    print(f'cache stats: {token_cache.stats()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--tokens', type=int, default=100)
+    args = parser.parse_args()
+    main(args.iterations, args.tokens)
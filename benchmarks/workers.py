@@ -0,0 +1,105 @@
+"""Масштабирование RPS по числу воркеров app.core.server.
+
+Для каждого числа воркеров поднимает benchmarks.serve --workers N на
+заменителях бд и Redis, нагружает его несколькими процессами
+benchmarks.load и суммирует их RPS. Один процесс генератора сам упирается
+в одно ядро, поэтому генераторов нужно не меньше, чем воркеров, а ядер
+на машине — больше, чем воркеров и генераторов вместе:
+
+    python -m benchmarks.workers --workers 1 2 4 8 --generators 4 --output workers.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ('verify_token', 'login')
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on {host}:{port}')
+
+
+def _run_generators(url: str, generators: int, requests: int, concurrency: int) -> dict[str, dict[str, float]]:
+    """Запускает генераторы параллельно и складывает их результаты"""
+    with tempfile.TemporaryDirectory() as directory:
+        outputs = [os.path.join(directory, f'{i}.json') for i in range(generators)]
+        processes = [
+            subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.load', '--url', url, '--requests', str(requests),
+                 '--concurrency', str(concurrency), '--users', '100', '--scenarios', *SCENARIOS,
+                 '--output', output],
+                stdout=subprocess.DEVNULL,
+            )
+            for output in outputs
+        ]
+        for process in processes:
+            if process.wait() != 0:
+                raise RuntimeError('Load generator failed')
+        reports = []
+        for output in outputs:
+            with open(output) as f:
+                reports.append(json.load(f)['results'])
+
+    totals = {}
+    for name in SCENARIOS:
+        results = [report[name] for report in reports]
+        totals[name] = {
+            'rps': sum(result['rps'] for result in results),
+            'errors': sum(result['errors'] for result in results),
+            # Перцентили разных генераторов не складываются, берём худший
+            'p50_ms': max(result['p50_ms'] for result in results),
+            'p99_ms': max(result['p99_ms'] for result in results),
+        }
+    return totals
+
+
+def main(args) -> dict[str, dict[str, dict[str, float]]]:
+    url = f'http://{args.host}:{args.port}'
+    results = {}
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.serve', '--host', args.host, '--port', str(args.port),
+             '--workers', str(workers)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_for_port(args.host, args.port)
+            results[str(workers)] = _run_generators(url, args.generators, args.requests, args.concurrency)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+        line = '  '.join(f"{name} {result['rps']:>8.0f} req/s" for name, result in results[str(workers)].items())
+        print(f'{workers:>3} workers  {line}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--generators', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=3000, help='Запросов на сценарий от каждого генератора')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    args = parser.parse_args()
+
+    report = main(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'generators': args.generators, 'results': report}, f, indent=2)
@@ -1,21 +1,65 @@
-from logging import config as logging_config
-from typing import Any
+"""Точка входа ASGI-приложения.
 
-from fastapi import FastAPI
+Импорт main ничего не создаёт: настройки, роутеры, клиенты и метрики
+появляются в create_app. Приложение можно получить фабрикой
+(uvicorn --factory main:create_app) или как main:app — тогда оно
+собирается при первом обращении к атрибуту.
+"""
 
-from app.api.routes.auth import router
-from app.core.config import settings
-from app.core.logger import get_logging_config
 
-app = FastAPI()
+def create_app():
+    """Сборка приложения: роутеры, middleware и lifespan с прогревом пулов"""
+    from fastapi import FastAPI
 
-log_config: dict[str, Any] = get_logging_config(
-    log_level='INFO',
-)
-logging_config.dictConfig(config=log_config)
+    from app.api.routes.auth import router
+    from app.api.routes.health import router as health_router
+    from app.api.routes.well_known import router as well_known_router
+    from app.core.config import settings
+    from app.core.logger import setup_logging
+    from app.core.lifespan import lifespan
+
+    setup_logging()
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.include_router(router=router)
+    app.include_router(router=well_known_router)
+    app.include_router(router=health_router)
+
+    if settings.metrics_enabled:
+        from app.api.routes.metrics import router as metrics_router
+        from app.middlewares.metrics import MetricsMiddleware
+
+        app.add_middleware(MetricsMiddleware)
+        app.include_router(router=metrics_router)
+
+    # Между RequestIdMiddleware и MetricsMiddleware: профиль получает идентификатор
+    # запроса, а запись профиля на диск не попадает в метрики задержек
+    if settings.profiling_enabled:
+        from app.api.routes.profiling import router as profiling_router
+        from app.middlewares.profiling import ProfilingMiddleware
+
+        app.add_middleware(ProfilingMiddleware)
+        app.include_router(router=profiling_router)
+
+    from app.middlewares.request_id import RequestIdMiddleware
+
+    app.add_middleware(RequestIdMiddleware)
+    return app
+
+
+def __getattr__(name: str):
+    # main:app для uvicorn, app.core.server и benchmarks: приложение собирается один раз
+    global app
+    if name == 'app':
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-app.include_router(router=router)
 
 if __name__ == '__main__':
     import uvicorn
-    uvicorn.run('main:app', host='127.0.0.1', port=8080, log_level='INFO')
\ No newline at end of file
+
+    from app.core.config import settings
+
+    uvicorn.run('main:create_app', factory=True, host='127.0.0.1', port=8080, log_level=settings.log_level.lower())
@@ -0,0 +1,234 @@
+"""Outbox писем поверх локального SMTP-сервера aiosmtpd и fakeredis.
+
+    pytest tests/test_email_outbox.py
+"""
+import asyncio
+import email
+import email.policy
+import json
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from fakeredis.aioredis import FakeRedis
+
+from app.core import resilience
+from app.core.config import settings
+from app.services.email_outbox import DEAD_KEY, DELAYED_KEY, GROUP_NAME, STREAM_KEY, EmailOutbox, enqueue_email
+from app.utils.email_utils import build_email_message
+
+
+class RecordingHandler:
+    """Принимает письма и отвечает кодами из responses по очереди, затем 250"""
+
+    def __init__(self):
+        self.responses: list[str] = []
+        self.messages: list[bytes] = []
+        self.attempts = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.responses:
+            return self.responses.pop(0)
+        self.messages.append(envelope.content)
+        return '250 Message accepted'
+
+
+class BlockingFakeRedis(FakeRedis):
+    """fakeredis отвечает на XREADGROUP с BLOCK сразу; как настоящий Redis,
+    ждём, пока в потоке не появятся записи или не истечёт таймаут"""
+
+    async def xreadgroup(self, *args, block=None, **kwargs):
+        deadline = time.monotonic() + (block or 0) / 1000
+        while True:
+            response = await super().xreadgroup(*args, **kwargs)
+            if response or time.monotonic() >= deadline:
+                return response
+            await asyncio.sleep(0.01)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecordingHandler()
+    controller = Controller(
+        handler,
+        hostname='127.0.0.1',
+        port=_free_port(),
+        authenticator=lambda *args: AuthResult(success=True),
+        auth_require_tls=False,
+    )
+    controller.start()
+    monkeypatch.setattr(settings, 'smtp_host', '127.0.0.1')
+    monkeypatch.setattr(settings, 'smtp_port', controller.port)
+    monkeypatch.setattr(settings, 'smtp_start_tls', False)
+    monkeypatch.setattr(settings, 'email_outbox_workers', 1)
+    monkeypatch.setattr(settings, 'email_outbox_retry_base_delay', 0.2)
+    # Автомат размыкания SMTP общий для процесса: тесты с ошибками не должны влиять друг на друга
+    resilience.smtp.breaker.state = resilience.CLOSED
+    resilience.smtp.breaker.failures = 0
+    yield handler
+    controller.stop()
+
+
+async def _wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('Condition not reached in time')
+        await asyncio.sleep(0.05)
+
+
+async def _run_outbox(scenario) -> None:
+    redis = BlockingFakeRedis(decode_responses=True)
+    outbox = EmailOutbox(redis, build_email_message)
+    try:
+        await scenario(redis, outbox)
+    finally:
+        await outbox.stop()
+        await redis.aclose()
+
+
+def test_sends_queued_email(smtp_server):
+    async def scenario(redis, outbox):
+        await outbox.start()
+        await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+
+        async def delivered():
+            return bool(smtp_server.messages)
+        await _wait_until(delivered)
+        assert await redis.xlen(STREAM_KEY) == 0
+        assert outbox.sent == 1
+
+    asyncio.run(_run_outbox(scenario))
+    message = email.message_from_bytes(smtp_server.messages[0])
+    assert message['To'] == 'user@example.com'
+    assert any('123456' in part.get_payload(decode=True).decode()
+               for part in message.walk() if not part.is_multipart())
+
+
+def test_subject_matches_locale():
+    cases = [('verification', 'ru', 'Код верификации'), ('verification', 'en', 'Verification Code'),
+             ('password_reset', 'ru', 'Сброс пароля'), ('password_reset', 'en', 'Password Reset Request')]
+    for kind, locale, subject in cases:
+        outgoing = build_email_message(kind, 'user@example.com',
+                                       {'verification_code': '123456', 'token': 'reset-token', 'locale': locale})
+        message = email.message_from_bytes(outgoing.content, policy=email.policy.default)
+        assert message['Subject'] == subject
+
+
+def test_temporary_failure_is_retried_with_backoff(smtp_server):
+    smtp_server.responses = ['451 4.3.0 Try again later']
+
+    async def scenario(redis, outbox):
+        await outbox.start()
+        await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+        started = time.time()
+
+        async def delayed():
+            return await redis.zcard(DELAYED_KEY) == 1
+        await _wait_until(delayed)
+        [(job, due_at)] = await redis.zrange(DELAYED_KEY, 0, -1, withscores=True)
+        assert json.loads(job)['attempts'] == 1
+        # Первая задержка — от половины до полной email_outbox_retry_base_delay
+        assert started + 0.1 - 0.05 <= due_at <= time.time() + 0.2
+
+        async def delivered():
+            return bool(smtp_server.messages)
+        await _wait_until(delivered)
+        assert outbox.retried == 1
+        assert outbox.sent == 1
+
+    asyncio.run(_run_outbox(scenario))
+    assert smtp_server.attempts == 2
+
+
+def test_permanent_failure_goes_to_dead_letter(smtp_server):
+    smtp_server.responses = ['550 5.1.1 Mailbox unavailable']
+
+    async def scenario(redis, outbox):
+        await outbox.start()
+        entry_id = await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+
+        async def dead():
+            return await redis.llen(DEAD_KEY) == 1
+        await _wait_until(dead)
+        job = json.loads(await redis.lindex(DEAD_KEY, 0))
+        assert job['origin'] == entry_id
+        assert job['to'] == 'user@example.com'
+        assert await redis.zcard(DELAYED_KEY) == 0
+
+    asyncio.run(_run_outbox(scenario))
+    assert smtp_server.attempts == 1
+    assert smtp_server.messages == []
+
+
+def test_exhausted_retries_go_to_dead_letter(smtp_server, monkeypatch):
+    monkeypatch.setattr(settings, 'email_outbox_max_attempts', 2)
+    monkeypatch.setattr(settings, 'email_outbox_retry_base_delay', 0.05)
+    smtp_server.responses = ['451 4.3.0 Try again later'] * 2
+
+    async def scenario(redis, outbox):
+        await outbox.start()
+        await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+
+        async def dead():
+            return await redis.llen(DEAD_KEY) == 1
+        await _wait_until(dead)
+        assert json.loads(await redis.lindex(DEAD_KEY, 0))['attempts'] == 2
+        assert outbox.dead == 1
+
+    asyncio.run(_run_outbox(scenario))
+    assert smtp_server.attempts == 2
+    assert smtp_server.messages == []
+
+
+def test_reclaims_jobs_of_crashed_worker(smtp_server, monkeypatch):
+    monkeypatch.setattr(settings, 'email_outbox_claim_idle_ms', 0)
+
+    async def scenario(redis, outbox):
+        await redis.xgroup_create(STREAM_KEY, GROUP_NAME, id='0', mkstream=True)
+        await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+        # Воркер упал, прочитав задание, но не подтвердив его
+        await redis.xreadgroup(GROUP_NAME, 'crashed-worker', {STREAM_KEY: '>'}, count=1)
+        await outbox.start()
+
+        async def delivered():
+            return bool(smtp_server.messages)
+        await _wait_until(delivered)
+        pending = await redis.xpending(STREAM_KEY, GROUP_NAME)
+        assert pending['pending'] == 0
+
+    asyncio.run(_run_outbox(scenario))
+
+
+def test_worker_survives_unexpected_errors(smtp_server):
+    calls = 0
+
+    async def scenario(redis, outbox):
+        nonlocal calls
+        read_batch = outbox._read_batch
+
+        async def failing_once(consumer):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ValueError('unexpected')
+            return await read_batch(consumer)
+        outbox._read_batch = failing_once
+        await outbox.start()
+        await enqueue_email(redis, 'verification', 'user@example.com', verification_code='123456')
+
+        async def delivered():
+            return bool(smtp_server.messages)
+        await _wait_until(delivered)
+
+    asyncio.run(_run_outbox(scenario))
+    assert calls > 1
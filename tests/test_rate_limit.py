@@ -0,0 +1,126 @@
+"""Лимиты запросов скользящим окном в Redis (app.middlewares.rate_limit).
+
+    pytest tests/test_rate_limit.py
+"""
+import asyncio
+
+import httpx
+import pytest
+from fakeredis.aioredis import FakeRedis
+from fastapi import Depends, FastAPI
+from redis.asyncio import Redis
+
+from app.core import resilience
+from app.core.config import settings
+from app.db.redis_client import get_redis
+from app.middlewares import rate_limit as rate_limit_module
+from app.middlewares.rate_limit import parse_rules, rate_limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit_module, 'time', clock)
+    monkeypatch.setattr(rate_limit_module, '_sliding_window_script', None)
+    monkeypatch.setattr(settings, 'rate_limit_enabled', True)
+    monkeypatch.setitem(settings.rate_limits, 'test', {'ip': '2/1,3/10', 'email': '1/5'})
+    resilience.redis.breaker.state = resilience.CLOSED
+    resilience.redis.breaker.failures = 0
+    yield clock
+    resilience.redis.breaker.state = resilience.CLOSED
+    resilience.redis.breaker.failures = 0
+
+
+def _app(redis) -> FastAPI:
+    app = FastAPI()
+
+    @app.post('/limited', dependencies=[Depends(rate_limit('test'))])
+    async def limited():
+        return {}
+
+    app.dependency_overrides[get_redis] = lambda: redis
+    return app
+
+
+async def _post(app, clock, at: float, email=None, ip='10.0.0.1') -> httpx.Response:
+    clock.now = 1_700_000_000.0 + at
+    transport = httpx.ASGITransport(app=app, client=(ip, 12345))
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        return await client.post('/limited', params={'email': email} if email else None)
+
+
+def test_parse_rules():
+    assert parse_rules('3/60, 10/3600') == [(3, 60000), (10, 3600000)]
+    assert parse_rules('5/0.5') == [(5, 500)]
+
+
+def test_limit_hit_and_window_expiry(clock):
+    async def scenario():
+        app = _app(FakeRedis(decode_responses=True))
+        assert (await _post(app, clock, 0.0)).status_code == 200
+        assert (await _post(app, clock, 0.1)).status_code == 200
+
+        # Короткое окно 2/1 заполнено: место освободится через 0.8 с
+        response = await _post(app, clock, 0.2)
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+
+        # Короткое окно истекло, длинное 3/10 ещё принимает третий запрос
+        assert (await _post(app, clock, 1.5)).status_code == 200
+
+        # Теперь заполнено длинное окно: ждать до 10.0 с от первого запроса
+        response = await _post(app, clock, 1.6)
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '9'
+
+        # Отклонённые запросы в журнал не попадают: после истечения окна снова можно
+        assert (await _post(app, clock, 10.05)).status_code == 200
+
+        # Лимит по IP: другой клиент его не делит
+        assert (await _post(app, clock, 10.1, ip='10.0.0.2')).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_email_limit_is_case_insensitive(clock):
+    async def scenario():
+        app = _app(FakeRedis(decode_responses=True))
+        assert (await _post(app, clock, 0.0, email='User@Example.com')).status_code == 200
+        response = await _post(app, clock, 1.0, email='user@example.com', ip='10.0.0.2')
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '4'
+        assert (await _post(app, clock, 1.0, email='other@example.com', ip='10.0.0.3')).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_fails_open_when_redis_is_unavailable(clock):
+    async def scenario():
+        redis = Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.5)
+        try:
+            app = _app(redis)
+            for i in range(5):
+                assert (await _post(app, clock, i * 0.01)).status_code == 200
+        finally:
+            await redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_disabled_limits_are_not_checked(clock, monkeypatch):
+    monkeypatch.setattr(settings, 'rate_limit_enabled', False)
+
+    async def scenario():
+        app = _app(FakeRedis(decode_responses=True))
+        for i in range(5):
+            assert (await _post(app, clock, i * 0.01)).status_code == 200
+
+    asyncio.run(scenario())
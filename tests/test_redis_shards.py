@@ -0,0 +1,131 @@
+"""Размещение ключей email на узлах Redis (app.db.redis_shards).
+
+    pytest tests/test_redis_shards.py
+"""
+import asyncio
+from collections import defaultdict
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from redis.exceptions import ConnectionError
+
+from app.core.config import settings
+from app.db import redis_client, redis_shards
+from app.db.redis_shards import (CLUSTER, SHARDED, HashRing, create_cluster, email_tag, get_redis_for_keys, hash_tag,
+                                 init_keyspace)
+from app.services import verification
+from app.services.password_reset import save_password_reset_token
+from app.services.verification import CODE_VERIFIED, check_verification_code, save_verification_code
+
+# Порт, на котором никто не слушает
+UNREACHABLE_NODE = '127.0.0.1:1'
+NODES = ['10.0.0.1:6379', '10.0.0.2:6379', '10.0.0.3:6379']
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    """Режим sharded поверх отдельного fakeredis на каждый узел"""
+    servers = {node: FakeServer() for node in NODES}
+
+    def create_redis(url):
+        node = url.removeprefix('redis://').rsplit('/', 1)[0]
+        return FakeRedis(server=servers[node], decode_responses=True)
+    monkeypatch.setattr(redis_client, 'create_redis', create_redis)
+    monkeypatch.setattr(settings, 'redis_keyspace_mode', SHARDED)
+    monkeypatch.setattr(settings, 'redis_nodes', NODES)
+    monkeypatch.setattr(redis_shards, 'keyspace', None)
+    # Скрипты регистрируются на первом клиенте и вызываются на других через EVALSHA/SCRIPT LOAD
+    monkeypatch.setattr(verification, '_save_code_script', None)
+    monkeypatch.setattr(verification, '_verify_code_script', None)
+    yield servers
+    asyncio.run(redis_shards.close_keyspace())
+
+
+def test_hash_tag():
+    assert hash_tag('verification_code:{abc}') == 'abc'
+    assert hash_tag('a{}b{c}') == 'a{}b{c}'
+    assert hash_tag('plain') == 'plain'
+
+
+def test_email_tag_is_case_insensitive_and_brace_free():
+    assert email_tag('User@Example.com') == email_tag('user@example.com')
+    for email in ('', 'a}b@example.com', '{x}@example.com'):
+        key = f'verification_code:{{{email_tag(email)}}}'
+        assert hash_tag(key) == email_tag(email)
+
+
+def test_ring_moves_few_keys_when_node_is_added():
+    tags = [email_tag(f'user{i}@example.com') for i in range(5000)]
+    before = HashRing(NODES, settings.redis_ring_points_per_node)
+    after = HashRing(NODES + ['10.0.0.4:6379'], settings.redis_ring_points_per_node)
+    moved = sum(before.node_for(tag) != after.node_for(tag) for tag in tags)
+    # В идеале переезжает 1/4 ключей — только на новый узел
+    assert moved < len(tags) * 0.35
+    assert all(after.node_for(tag) == '10.0.0.4:6379' for tag in tags if before.node_for(tag) != after.node_for(tag))
+
+
+def test_keys_of_one_email_share_a_node(sharded):
+    emails = [f'user{i}@example.com' for i in range(300)] + ['', 'a}b@example.com', 'Mixed@Example.com']
+
+    async def scenario():
+        for email in emails:
+            await save_verification_code(email, '123456')
+            await check_verification_code(email, 'wrong')
+            await save_password_reset_token(email, 'reset-token')
+        nodes_by_tag = defaultdict(set)
+        keys_per_node = {}
+        for node, server in sharded.items():
+            client = FakeRedis(server=server, decode_responses=True)
+            keys = [key async for key in client.scan_iter()]
+            keys_per_node[node] = len(keys)
+            for key in keys:
+                nodes_by_tag[hash_tag(key)].add(node)
+            await client.aclose()
+        assert len(nodes_by_tag) == len(emails)
+        assert all(len(nodes) == 1 for nodes in nodes_by_tag.values())
+        # Код, счётчик попыток и токен сброса — три ключа на email; каждому узлу
+        # достаётся не меньше половины равной доли
+        assert sum(keys_per_node.values()) == 3 * len(emails)
+        assert min(keys_per_node.values()) > 3 * len(emails) / len(NODES) / 2
+
+        assert (await check_verification_code('user1@example.com', '123456')).status == CODE_VERIFIED
+
+    asyncio.run(scenario())
+
+
+def test_keys_without_common_tag_are_rejected(sharded):
+    async def scenario():
+        with pytest.raises(ValueError):
+            await get_redis_for_keys('a:{one}', 'b:{two}')
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def cluster_mode(monkeypatch):
+    monkeypatch.setattr(settings, 'redis_keyspace_mode', CLUSTER)
+    monkeypatch.setattr(settings, 'redis_nodes', [UNREACHABLE_NODE])
+    monkeypatch.setattr(redis_shards, 'keyspace', None)
+
+
+def test_unreachable_cluster_is_a_connection_error(cluster_mode):
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await init_keyspace()
+        # Неудачная инициализация не оставляет полуготовый клиент
+        assert redis_shards.keyspace is None
+
+    asyncio.run(scenario())
+
+
+def test_cluster_command_failure_is_a_connection_error(cluster_mode):
+    async def scenario():
+        cluster = create_cluster([UNREACHABLE_NODE])
+        try:
+            with pytest.raises(ConnectionError):
+                await cluster.get('verification_code:{tag}')
+        finally:
+            await cluster.aclose()
+
+    asyncio.run(scenario())
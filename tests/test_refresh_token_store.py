@@ -0,0 +1,110 @@
+"""Кеш refresh-токенов в Redis перед таблицей tokens и его инвалидация при логауте.
+
+    pytest tests/test_refresh_token_store.py
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from app.core import resilience
+from app.core.config import settings
+from app.db import functions, redis_client
+from app.db.functions import REFRESH_TOKEN_DELETED_KEY, REFRESH_TOKEN_KEY
+
+USER_ID = '5f0c6a4e-8d2b-4c55-9a43-0d6f1c2b7e10'
+
+
+class FakeConnection:
+    """Таблица tokens из одной строки; чтение можно придержать, чтобы вклинить логаут"""
+
+    def __init__(self):
+        self.row = {'refresh_token': 'refresh-token', 'expires_at': datetime.utcnow() + timedelta(days=30)}
+        self.read_started = asyncio.Event()
+        self.release_read = asyncio.Event()
+        self.release_read.set()
+
+    async def fetchrow(self, query, user_id):
+        row = self.row
+        self.read_started.set()
+        await self.release_read.wait()
+        return row
+
+    async def execute(self, query, user_id, *args):
+        if query == functions.DELETE_REFRESH_TOKEN_QUERY:
+            self.row = None
+        else:
+            refresh_token, expires_at = args
+            self.row = {'refresh_token': refresh_token, 'expires_at': expires_at}
+
+
+class FailingRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionError('Redis is down')
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, 'redis_client', client)
+    monkeypatch.setattr(settings, 'refresh_token_cache_enabled', True)
+    # Скрипт регистрируется на клиенте, с которым вызван впервые
+    monkeypatch.setattr(functions, '_fill_refresh_token_script', None)
+    resilience.redis.breaker.state = resilience.CLOSED
+    resilience.redis.breaker.failures = 0
+    return client
+
+
+def test_read_through_fills_cache(redis):
+    async def scenario():
+        conn = FakeConnection()
+        assert await functions.get_refresh_token_for_user(conn, USER_ID) == 'refresh-token'
+        assert await redis.get(REFRESH_TOKEN_KEY.format(USER_ID)) == 'refresh-token'
+        assert await redis.ttl(REFRESH_TOKEN_KEY.format(USER_ID)) > 29 * 24 * 3600
+
+    asyncio.run(scenario())
+
+
+def test_logout_during_read_does_not_revive_token(redis):
+    async def scenario():
+        conn = FakeConnection()
+        conn.release_read.clear()
+        # Чтение взяло строку из бд, и до записи в кеш проходит логаут
+        reader = asyncio.create_task(functions.get_refresh_token_for_user(conn, USER_ID))
+        await conn.read_started.wait()
+        await functions.delete_refresh_token_for_user(conn, USER_ID)
+        conn.release_read.set()
+        await reader
+
+        assert await redis.get(REFRESH_TOKEN_KEY.format(USER_ID)) is None
+        assert await functions.get_refresh_token_for_user(conn, USER_ID) is None
+
+    asyncio.run(scenario())
+
+
+def test_login_after_logout_is_cached(redis):
+    async def scenario():
+        conn = FakeConnection()
+        await functions.delete_refresh_token_for_user(conn, USER_ID)
+        assert await redis.exists(REFRESH_TOKEN_DELETED_KEY.format(USER_ID))
+        await functions.execute_save_refresh_token(conn, USER_ID, 'new-token', datetime.utcnow() + timedelta(days=30))
+        assert await redis.get(REFRESH_TOKEN_KEY.format(USER_ID)) == 'new-token'
+
+    asyncio.run(scenario())
+
+
+def test_logout_keeps_row_when_cache_cannot_be_invalidated(redis, monkeypatch):
+    async def scenario():
+        conn = FakeConnection()
+        monkeypatch.setattr(redis_client, 'redis_client', FailingRedis())
+        with pytest.raises(HTTPException):
+            await functions.delete_refresh_token_for_user(conn, USER_ID)
+        # Строка не удалена: закешированный токен не расходится с бд
+        assert conn.row is not None
+
+    asyncio.run(scenario())
+    resilience.redis.breaker.state = resilience.CLOSED
+    resilience.redis.breaker.failures = 0
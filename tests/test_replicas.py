@@ -0,0 +1,79 @@
+"""Чтение с реплик и повтор на основной бд (app.db.replicas.fetchrow_read).
+
+    pytest tests/test_replicas.py
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import app.db as db
+from app.db import replicas
+from app.db.replicas import ReplicaSet, fetchrow_read
+
+QUERY = 'SELECT id FROM users WHERE email = $1'
+
+
+class FakeConnection:
+    def __init__(self, rows, error=None):
+        self.rows = rows
+        self.error = error
+        self.queries = 0
+
+    async def fetchrow(self, query, email):
+        self.queries += 1
+        if self.error is not None:
+            raise self.error
+        return self.rows.get(email)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield self.conn
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    """Строка new@example.com уже в основной бд, но ещё не на реплике"""
+    primary = FakeConnection({'old@example.com': {'id': 1}, 'new@example.com': {'id': 2}})
+    replica_conn = FakeConnection({'old@example.com': {'id': 1}})
+    replica_set = ReplicaSet(['postgresql://replica'])
+    replica = replica_set.replicas[0]
+    replica.healthy = True
+    replica_set._checked_out[id(replica_conn)] = replica
+    monkeypatch.setattr(db, 'pool', FakePool(primary))
+    monkeypatch.setattr(replicas, 'replica_set', replica_set)
+    return primary, replica_conn, replica
+
+
+def test_replica_hit_does_not_touch_primary(setup):
+    primary, replica_conn, replica = setup
+    row = asyncio.run(fetchrow_read(replica_conn, QUERY, 'old@example.com'))
+    assert row == {'id': 1}
+    assert primary.queries == 0
+
+
+def test_miss_on_caught_up_replica_is_accepted(setup):
+    primary, replica_conn, replica = setup
+    replica.lag = 0.0
+    assert asyncio.run(fetchrow_read(replica_conn, QUERY, 'missing@example.com')) is None
+    assert primary.queries == 0
+
+
+def test_miss_on_lagging_replica_falls_back_to_primary(setup):
+    primary, replica_conn, replica = setup
+    replica.lag = 1.5
+    assert asyncio.run(fetchrow_read(replica_conn, QUERY, 'new@example.com')) == {'id': 2}
+    assert primary.queries == 1
+
+
+def test_replica_failure_falls_back_to_primary(setup):
+    primary, replica_conn, replica = setup
+    replica_conn.error = ConnectionResetError('replica went away')
+    assert asyncio.run(fetchrow_read(replica_conn, QUERY, 'old@example.com')) == {'id': 1}
+    assert primary.queries == 1
+    assert not replica.healthy
@@ -0,0 +1,201 @@
+"""Автомат размыкания, семафор и дедлайн внешних вызовов (app.core.resilience).
+
+    pytest tests/test_resilience.py
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core import resilience
+from app.core.config import settings
+from app.core.resilience import CLOSED, HALF_OPEN, OPEN, Backend, BackendUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, 'time', clock)
+    monkeypatch.setattr(settings, 'circuit_failure_threshold', 3)
+    monkeypatch.setattr(settings, 'circuit_recovery_timeout', 10.0)
+    monkeypatch.setattr(settings, 'backend_queue_timeout', 0.05)
+    return clock
+
+
+def _backend(max_concurrency=2, deadline=1.0) -> Backend:
+    return Backend('test', max_concurrency=max_concurrency, deadline=deadline, failure_exceptions=(ConnectionError,))
+
+
+async def _fail(backend: Backend) -> None:
+    with pytest.raises(ConnectionError):
+        async with backend.guard():
+            raise ConnectionError('down')
+
+
+async def _succeed(backend: Backend) -> None:
+    async with backend.guard():
+        pass
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    async def scenario():
+        backend = _backend()
+        await _fail(backend)
+        await _fail(backend)
+        assert backend.breaker.state == CLOSED
+        await _fail(backend)
+        assert backend.breaker.state == OPEN
+
+        # Разомкнутый автомат отказывает сразу и сообщает, когда попробовать снова
+        clock.now += 4
+        with pytest.raises(BackendUnavailable) as exc_info:
+            await _succeed(backend)
+        assert exc_info.value.reason == 'circuit_open'
+        assert exc_info.value.headers['Retry-After'] == '6'
+
+        # После recovery_timeout пропускается ровно один пробный вызов
+        clock.now += 6
+        probe_started, release_probe = asyncio.Event(), asyncio.Event()
+
+        async def probe():
+            async with backend.guard():
+                probe_started.set()
+                await release_probe.wait()
+        task = asyncio.create_task(probe())
+        await probe_started.wait()
+        assert backend.breaker.state == HALF_OPEN
+        with pytest.raises(BackendUnavailable):
+            await _succeed(backend)
+        release_probe.set()
+        await task
+        assert backend.breaker.state == CLOSED
+        assert backend.breaker.failures == 0
+        await _succeed(backend)
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_breaker(clock):
+    async def scenario():
+        backend = _backend()
+        for _ in range(3):
+            await _fail(backend)
+        clock.now += 10
+        await _fail(backend)
+        assert backend.breaker.state == OPEN
+        assert backend.breaker.retry_after == 10
+        assert backend.breaker.opened_total == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_lets_next_call_probe(clock):
+    async def scenario():
+        backend = _backend()
+        for _ in range(3):
+            await _fail(backend)
+        clock.now += 10
+
+        async def probe():
+            async with backend.guard():
+                await asyncio.sleep(10)
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await _succeed(backend)
+        assert backend.breaker.state == CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_application_errors_are_not_failures(clock):
+    async def scenario():
+        backend = _backend()
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                async with backend.guard():
+                    raise ValueError('constraint violated')
+        assert backend.breaker.state == CLOSED
+        assert backend.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_semaphore_saturation_rejects_with_503(clock):
+    async def scenario():
+        backend = _backend(max_concurrency=2)
+        release = asyncio.Event()
+
+        async def hold():
+            async with backend.guard():
+                await release.wait()
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert backend.in_flight == 2
+
+        # Очередь ждёт слот не дольше backend_queue_timeout
+        with pytest.raises(BackendUnavailable) as exc_info:
+            await _succeed(backend)
+        assert exc_info.value.reason == 'concurrency'
+        assert exc_info.value.status_code == 503
+        # Отказ из-за очереди не считается сбоем сервиса
+        assert backend.breaker.failures == 0
+
+        release.set()
+        await asyncio.gather(*holders)
+        assert backend.in_flight == 0
+        await _succeed(backend)
+
+    asyncio.run(scenario())
+
+
+def test_deadline_counts_as_failure(clock):
+    async def scenario():
+        backend = _backend(deadline=0.01)
+        with pytest.raises(BackendUnavailable) as exc_info:
+            async with backend.guard():
+                await asyncio.sleep(1)
+        assert exc_info.value.reason == 'deadline'
+        assert backend.timeouts == 1
+        assert backend.breaker.failures == 1
+        assert backend.in_flight == 0
+
+        # Дедлайн вызова перекрывает дедлайн сервиса
+        async with backend.guard(deadline=1.0):
+            await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+
+
+def test_backend_unavailable_is_a_503_response(clock):
+    backend = _backend()
+    app = FastAPI()
+
+    @app.get('/backend')
+    async def call_backend():
+        async with backend.guard():
+            raise ConnectionError('down')
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            for _ in range(3):
+                await client.get('/backend')
+            clock.now += 2.5
+            return await client.get('/backend')
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '8'
+    assert response.json() == {'detail': 'test is unavailable (circuit_open), try again later'}
@@ -0,0 +1,71 @@
+"""Синхронизация списка отзывов через pub/sub fakeredis.
+
+    pytest tests/test_revocation.py
+"""
+import asyncio
+import time
+
+from fakeredis.aioredis import FakeRedis
+
+from app.services.revocation import REVOKED_CHANNEL, REVOKED_KEY, RevocationList, RevocationSync
+
+
+def test_sync_receives_revocations_and_stops_promptly():
+    async def scenario():
+        redis = FakeRedis(decode_responses=True)
+        revoked = RevocationList(capacity=1000, error_rate=0.01)
+        await redis.set(REVOKED_KEY.format('a' * 32), int(time.time()) + 60)
+        sync = RevocationSync(redis, revoked)
+        await sync.start()
+        assert revoked.is_revoked('a' * 32)
+
+        # Отзыв, сделанный другим воркером, приходит через pub/sub
+        await redis.publish(REVOKED_CHANNEL, f"{'b' * 32}:{int(time.time()) + 60}")
+        deadline = time.monotonic() + 3
+        while not revoked.is_revoked('b' * 32):
+            assert time.monotonic() < deadline, 'Revocation was not delivered'
+            await asyncio.sleep(0.05)
+
+        # Остановка посреди ожидания get_message не должна зависать на закрытии подписки
+        started = time.monotonic()
+        await asyncio.wait_for(sync.stop(), 5)
+        assert time.monotonic() - started < 3
+        assert sync._pubsub is None
+        await redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_malformed_messages_do_not_stop_the_listener():
+    async def scenario():
+        redis = FakeRedis(decode_responses=True)
+        revoked = RevocationList(capacity=1000, error_rate=0.01)
+        sync = RevocationSync(redis, revoked)
+        await sync.start()
+        for data in ('no-separator', f"{'a' * 32}:soon", f"{'a' * 32}:inf", ':123'):
+            await redis.publish(REVOKED_CHANNEL, data)
+        await redis.publish(REVOKED_CHANNEL, f"{'b' * 32}:{int(time.time()) + 60}")
+        deadline = time.monotonic() + 3
+        while not revoked.is_revoked('b' * 32):
+            assert time.monotonic() < deadline, 'Listener stopped after a malformed message'
+            await asyncio.sleep(0.05)
+        assert not revoked.is_revoked('a' * 32)
+        assert len(revoked) == 1
+        await sync.stop()
+        await redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_bloom_is_not_rebuilt_again_after_growing_past_capacity():
+    async def scenario():
+        revoked = RevocationList(capacity=100, error_rate=0.01)
+        exp = time.time() + 600
+        for i in range(150):
+            revoked.add(f'{i:032x}', exp)
+        assert revoked.needs_rebuild()
+        await revoked.rebuild_bloom()
+        assert not revoked.needs_rebuild()
+        assert all(revoked.is_revoked(f'{i:032x}') for i in range(150))
+
+    asyncio.run(scenario())
@@ -0,0 +1,105 @@
+"""Локальный кеш проверенных access-токенов (app.middlewares.token_cache).
+
+    pytest tests/test_token_cache.py
+"""
+import pytest
+
+from app.middlewares import token_cache as token_cache_module
+from app.middlewares.token_cache import TokenCache
+
+NOW = 1_700_000_000.0
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_cache_module, 'time', clock)
+    return clock
+
+
+def _payload(user_id='user-1', exp=NOW + 3600) -> dict:
+    return {'sub': user_id, 'exp': exp}
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = TokenCache(max_entries=2, max_bytes=1 << 20, ttl=300)
+    cache.set('token-a', _payload('a'))
+    cache.set('token-b', _payload('b'))
+    assert cache.get('token-a') == _payload('a')
+
+    # token-b дольше всех не использовался
+    cache.set('token-c', _payload('c'))
+    assert cache.get('token-b') is None
+    assert cache.get('token-a') is not None
+    assert cache.get('token-c') is not None
+    assert cache.stats()['entries'] == 2
+    assert cache.evictions == 1
+
+
+def test_byte_budget_limits_entries(clock):
+    token_size = 100 + TokenCache.ENTRY_OVERHEAD
+    cache = TokenCache(max_entries=100, max_bytes=3 * token_size, ttl=300)
+    for i in range(5):
+        cache.set(f'{i}'.ljust(100, 'x'), _payload(f'user-{i}'))
+    assert cache.stats()['entries'] == 3
+    assert cache.size_bytes == 3 * token_size
+    assert cache.get('0'.ljust(100, 'x')) is None
+    assert cache.get('4'.ljust(100, 'x')) is not None
+
+    # Повторная запись того же токена не удваивает учтённый объём
+    cache.set('4'.ljust(100, 'x'), _payload('user-4'))
+    assert cache.size_bytes == 3 * token_size
+
+
+def test_ttl_is_capped_at_token_exp(clock):
+    cache = TokenCache(max_entries=10, max_bytes=1 << 20, ttl=300)
+    cache.set('short', _payload(exp=NOW + 60))
+    cache.set('long', _payload(exp=NOW + 3600))
+    cache.set('expired', _payload(exp=NOW - 1))
+    cache.set('no-exp', {'sub': 'user-1'})
+    assert cache.get('expired') is None
+    assert cache.get('no-exp') is None
+
+    clock.now = NOW + 60
+    assert cache.get('short') is None
+    assert cache.get('long') is not None
+
+    # Запись не переживает ttl кеша, даже если токен ещё действителен
+    clock.now = NOW + 300
+    assert cache.get('long') is None
+    assert cache.expirations == 2
+    assert cache.size_bytes == 0
+
+
+def test_invalidate_user_drops_only_their_tokens(clock):
+    cache = TokenCache(max_entries=10, max_bytes=1 << 20, ttl=300)
+    cache.set('user-1-web', _payload('user-1'))
+    cache.set('user-1-mobile', _payload('user-1'))
+    cache.set('user-2-web', _payload('user-2'))
+
+    cache.invalidate_user('user-1')
+    assert cache.get('user-1-web') is None
+    assert cache.get('user-1-mobile') is None
+    assert cache.get('user-2-web') is not None
+    assert cache.stats()['entries'] == 1
+    assert cache.size_bytes == len('user-2-web') + TokenCache.ENTRY_OVERHEAD
+
+    # Повторная инвалидация ничего не ломает
+    cache.invalidate_user('user-1')
+    cache.invalidate('user-2-web')
+    assert cache.size_bytes == 0
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = TokenCache(max_entries=0, max_bytes=1 << 20, ttl=300)
+    cache.set('token', _payload())
+    assert cache.get('token') is None
+    assert cache.stats()['entries'] == 0
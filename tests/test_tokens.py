@@ -0,0 +1,48 @@
+"""Общий для воркеров access-токен при обновлении (refresh_singleflight_redis_enabled).
+
+    pytest tests/test_tokens.py
+"""
+import asyncio
+
+from fakeredis.aioredis import FakeRedis
+
+from app.services.tokens import REFRESH_LOCK_KEY, REFRESHED_TOKEN_KEY, _finish_refresh, forget_refreshed_token
+
+USER_ID = '5f0c6a4e-8d2b-4c55-9a43-0d6f1c2b7e10'
+KEYS = [REFRESH_LOCK_KEY.format(USER_ID), REFRESHED_TOKEN_KEY.format(USER_ID)]
+
+
+def test_finished_refresh_is_shared_with_other_workers():
+    async def scenario():
+        redis = FakeRedis(decode_responses=True)
+        await redis.set(KEYS[0], 'owner')
+        await _finish_refresh(redis, KEYS, 'owner', 'access-token')
+        assert await redis.get(KEYS[1]) == 'access-token'
+        assert await redis.exists(KEYS[0]) == 0
+        await redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_logout_drops_shared_token():
+    async def scenario():
+        redis = FakeRedis(decode_responses=True)
+        await redis.set(KEYS[1], 'access-token')
+        await forget_refreshed_token(redis, USER_ID)
+        assert await redis.exists(*KEYS) == 0
+        await redis.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_refresh_started_before_logout_is_not_shared():
+    async def scenario():
+        redis = FakeRedis(decode_responses=True)
+        # Обновление взяло блокировку и выпускает токен, в это время проходит логаут
+        await redis.set(KEYS[0], 'owner')
+        await forget_refreshed_token(redis, USER_ID)
+        await _finish_refresh(redis, KEYS, 'owner', 'access-token')
+        assert await redis.exists(*KEYS) == 0
+        await redis.aclose()
+
+    asyncio.run(scenario())
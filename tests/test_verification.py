@@ -0,0 +1,107 @@
+"""Проверка кодов подтверждения скриптом VERIFY в Redis (app.services.verification).
+
+    pytest tests/test_verification.py
+"""
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from app.core import resilience
+from app.core.config import settings
+from app.db import redis_client
+from app.db.redis_shards import email_tag
+from app.services import verification
+from app.services.verification import (CODE_INVALID, CODE_LOCKED, CODE_MISSING, CODE_VERIFIED,
+                                       VERIFICATION_ATTEMPTS_KEY, VERIFICATION_CODE_KEY, VERIFICATION_LOCK_KEY,
+                                       check_verification_code, save_verification_code)
+
+EMAIL = 'User@Example.com'
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_client, 'redis_client', client)
+    monkeypatch.setattr(settings, 'redis_keyspace_mode', 'single')
+    monkeypatch.setattr(settings, 'verification_code_max_attempts', 3)
+    monkeypatch.setattr(settings, 'verification_code_lockout_seconds', 900)
+    # Скрипты регистрируются на клиенте, с которым вызваны впервые
+    monkeypatch.setattr(verification, '_save_code_script', None)
+    monkeypatch.setattr(verification, '_verify_code_script', None)
+    resilience.redis.breaker.state = resilience.CLOSED
+    resilience.redis.breaker.failures = 0
+    return client
+
+
+def _key(template: str) -> str:
+    return template.format(email_tag(EMAIL))
+
+
+def test_correct_code_is_accepted_once(redis):
+    async def scenario():
+        await save_verification_code(EMAIL, '123456')
+        await check_verification_code(EMAIL, '000000')
+
+        result = await check_verification_code('user@example.com', '123456')
+        assert result.status == CODE_VERIFIED
+        assert await redis.exists(_key(VERIFICATION_CODE_KEY), _key(VERIFICATION_ATTEMPTS_KEY)) == 0
+
+        # Повтор погашенного кода
+        assert (await check_verification_code(EMAIL, '123456')).status == CODE_MISSING
+
+    asyncio.run(scenario())
+
+
+def test_wrong_code_counts_attempts(redis):
+    async def scenario():
+        await save_verification_code(EMAIL, '123456')
+        assert tuple(await check_verification_code(EMAIL, '000000')) == (CODE_INVALID, 2)
+        assert tuple(await check_verification_code(EMAIL, '111111')) == (CODE_INVALID, 1)
+        # Счётчик живёт не дольше самого кода
+        assert 0 < await redis.ttl(_key(VERIFICATION_ATTEMPTS_KEY)) <= settings.verification_code_ttl
+
+        # Новый код обнуляет счётчик
+        await save_verification_code(EMAIL, '654321')
+        assert tuple(await check_verification_code(EMAIL, '000000')) == (CODE_INVALID, 2)
+
+    asyncio.run(scenario())
+
+
+def test_max_attempts_lock_out(redis):
+    async def scenario():
+        await save_verification_code(EMAIL, '123456')
+        await check_verification_code(EMAIL, '000000')
+        await check_verification_code(EMAIL, '000000')
+        assert tuple(await check_verification_code(EMAIL, '000000')) == (CODE_LOCKED, 900_000)
+        assert await redis.exists(_key(VERIFICATION_CODE_KEY), _key(VERIFICATION_ATTEMPTS_KEY)) == 0
+
+        # Во время блокировки не принимается и верный код, в том числе новый
+        status, value = await check_verification_code(EMAIL, '123456')
+        assert status == CODE_LOCKED and 0 < value <= 900_000
+        await save_verification_code(EMAIL, '654321')
+        assert (await check_verification_code(EMAIL, '654321')).status == CODE_LOCKED
+
+        # После снятия блокировки действует последний код
+        await redis.delete(_key(VERIFICATION_LOCK_KEY))
+        assert (await check_verification_code(EMAIL, '654321')).status == CODE_VERIFIED
+
+    asyncio.run(scenario())
+
+
+def test_parallel_attempts_do_not_bypass_counter(redis):
+    async def scenario():
+        await save_verification_code(EMAIL, '123456')
+        results = await asyncio.gather(*(check_verification_code(EMAIL, f'{i:06d}') for i in range(10)))
+        statuses = [result.status for result in results]
+        assert statuses.count(CODE_INVALID) == settings.verification_code_max_attempts - 1
+        assert statuses.count(CODE_LOCKED) == 10 - statuses.count(CODE_INVALID)
+
+    asyncio.run(scenario())
+
+
+def test_missing_code(redis):
+    async def scenario():
+        assert tuple(await check_verification_code(EMAIL, '123456')) == (CODE_MISSING, 0)
+
+    asyncio.run(scenario())
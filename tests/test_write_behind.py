@@ -0,0 +1,212 @@
+"""Отложенная пакетная запись refresh-токенов (app.db.write_behind).
+
+    pytest tests/test_write_behind.py
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import asyncpg
+import pytest
+
+from app.core.config import settings
+from app.core.resilience import BackendUnavailable
+from app.db.write_behind import RefreshTokenWriter
+
+QUERY = 'SELECT save_refresh_token($1, $2, $3)'
+EXPIRES_AT = datetime.utcnow() + timedelta(days=30)
+
+
+class FakeConnection:
+    """Таблица токенов; строки с токенами из rejected бд отвергает"""
+
+    def __init__(self):
+        self.rows = {}
+        self.batches = []
+        self.rejected = set()
+        self.release_batch = asyncio.Event()
+        self.release_batch.set()
+
+    async def executemany(self, query, rows):
+        await self.release_batch.wait()
+        self.batches.append(rows)
+        if any(row[1] in self.rejected for row in rows):
+            raise asyncpg.exceptions.CheckViolationError('token rejected')
+        for row in rows:
+            self.rows[row[0]] = row[1]
+
+    async def execute(self, query, user_id, refresh_token, expires_at):
+        if refresh_token in self.rejected:
+            raise asyncpg.exceptions.CheckViolationError('token rejected')
+        self.rows[user_id] = refresh_token
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+        self.down = False
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        if self.down:
+            raise ConnectionRefusedError('Postgres is down')
+        yield self.conn
+
+
+def _writer(pool, max_batch=100, flush_interval=10.0, max_pending=100, max_attempts=2) -> RefreshTokenWriter:
+    return RefreshTokenWriter(pool, QUERY, max_batch=max_batch, flush_interval=flush_interval,
+                              max_pending=max_pending, max_attempts=max_attempts)
+
+
+def test_full_batch_is_flushed_at_once():
+    async def scenario():
+        pool = FakePool()
+        writer = _writer(pool, max_batch=3)
+        writer.start()
+        users = [uuid4() for _ in range(4)]
+        await writer.save(users[0], 'old-token', EXPIRES_AT)
+        await writer.save(users[0], 'token-0', EXPIRES_AT)
+        await writer.save(users[1], 'token-1', EXPIRES_AT)
+        assert writer.get_pending(str(users[0])) == 'token-0'
+        await writer.save(users[2], 'token-2', EXPIRES_AT)
+        # Пакет набран: сброс не ждёт flush_interval
+        await asyncio.sleep(0.01)
+        assert len(pool.conn.batches) == 1
+        # Для пользователя пишется только последний токен
+        assert pool.conn.rows == {users[0]: 'token-0', users[1]: 'token-1', users[2]: 'token-2'}
+
+        # Остаток буфера записывается при остановке
+        await writer.save(users[3], 'token-3', EXPIRES_AT)
+        await writer.stop()
+        assert pool.conn.rows[users[3]] == 'token-3'
+        assert writer.stats()['rows_written'] == 4
+        assert writer.get_pending(str(users[3])) is None
+
+    asyncio.run(scenario())
+
+
+def test_rejected_row_is_retried_then_dropped():
+    async def scenario():
+        pool = FakePool()
+        pool.conn.rejected.add('bad-token')
+        writer = _writer(pool, max_attempts=2)
+        good, bad = uuid4(), uuid4()
+        await writer.save(good, 'good-token', EXPIRES_AT)
+        await writer.save(bad, 'bad-token', EXPIRES_AT)
+
+        # Пакет отвергнут, строки пишутся по одной: хорошая записана, плохая ждёт повтора
+        await writer.flush()
+        assert pool.conn.rows == {good: 'good-token'}
+        assert writer.get_pending(str(bad)) == 'bad-token'
+
+        # Вторая неудача исчерпывает max_attempts
+        await writer.flush()
+        assert writer.get_pending(str(bad)) is None
+        assert writer.stats()['dropped_rows'] == 1
+        assert writer.stats()['pending'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_new_login_resets_attempts():
+    async def scenario():
+        pool = FakePool()
+        pool.conn.rejected.add('bad-token')
+        writer = _writer(pool, max_attempts=2)
+        user = uuid4()
+        await writer.save(user, 'bad-token', EXPIRES_AT)
+        await writer.flush()
+        await writer.save(user, 'good-token', EXPIRES_AT)
+        await writer.flush()
+        assert pool.conn.rows == {user: 'good-token'}
+        assert writer.stats()['dropped_rows'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_rows_survive_database_outage():
+    async def scenario():
+        pool = FakePool()
+        writer = _writer(pool)
+        user = uuid4()
+        await writer.save(user, 'token', EXPIRES_AT)
+        pool.down = True
+        await writer.flush()
+        await writer.flush()
+        # Недоступность бд не считается отказом строки
+        assert writer.get_pending(str(user)) == 'token'
+        assert writer.stats()['failed_flushes'] == 2
+
+        pool.down = False
+        await writer.flush()
+        assert pool.conn.rows == {user: 'token'}
+        assert writer.stats()['dropped_rows'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_buffer_rejects_new_users_with_503(monkeypatch):
+    monkeypatch.setattr(settings, 'postgres_pool_acquire_timeout', 0.05)
+
+    async def scenario():
+        pool = FakePool()
+        writer = _writer(pool, max_pending=2)
+        first, second = uuid4(), uuid4()
+        await writer.save(first, 'token-1', EXPIRES_AT)
+        await writer.save(second, 'token-2', EXPIRES_AT)
+
+        with pytest.raises(BackendUnavailable) as exc_info:
+            await writer.save(uuid4(), 'token-3', EXPIRES_AT)
+        assert exc_info.value.status_code == 503
+        assert writer.stats()['rejected_saves'] == 1
+
+        # Пользователь, уже стоящий в буфере, место не занимает
+        await writer.save(first, 'token-1-new', EXPIRES_AT)
+
+        # Логин при переполнении дожидается сброса
+        third = uuid4()
+        waiting = asyncio.create_task(writer.save(third, 'token-3', EXPIRES_AT))
+        await asyncio.sleep(0)
+        await writer.flush()
+        await waiting
+        assert writer.get_pending(str(third)) == 'token-3'
+
+    asyncio.run(scenario())
+
+
+def test_discard_drops_pending_token():
+    async def scenario():
+        pool = FakePool()
+        writer = _writer(pool)
+        user = uuid4()
+        await writer.save(user, 'token', EXPIRES_AT)
+        await writer.discard(str(user))
+        assert writer.get_pending(str(user)) is None
+        await writer.flush()
+        assert pool.conn.rows == {}
+
+    asyncio.run(scenario())
+
+
+def test_discard_waits_for_inflight_write():
+    async def scenario():
+        pool = FakePool()
+        pool.conn.release_batch.clear()
+        writer = _writer(pool)
+        user = uuid4()
+        await writer.save(user, 'token', EXPIRES_AT)
+        flush = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0)
+        assert writer.get_pending(str(user)) == 'token'
+
+        # Логаут не завершается, пока запись токена не дошла до бд, иначе DELETE её опередит
+        discard = asyncio.create_task(writer.discard(str(user)))
+        await asyncio.sleep(0.01)
+        assert not discard.done()
+        pool.conn.release_batch.set()
+        await asyncio.gather(flush, discard)
+        assert pool.conn.rows == {user: 'token'}
+        assert writer.get_pending(str(user)) is None
+
+    asyncio.run(scenario())